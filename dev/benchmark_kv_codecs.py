@@ -0,0 +1,86 @@
+#!/usr/bin/env python2.7
+
+# Compare the KV codecs on the shapes of the values that we actually store:
+# single arguments/reduction-results, collected map-results, and the blocks
+# that queue records are packed into.
+
+import sys
+import os.path
+import timeit
+
+dev_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dev_path, '..'))
+
+import mr.config.kv
+import mr.models.kv.codecs
+
+_ITERATIONS = 2000
+
+def _get_shapes():
+    pair = { 'p': ('word%d' % 12345, 17413412) }
+
+    collected = { 'k': 'word12345',
+                  'vl': [[i, 'value%d' % i] for i in range(100)] }
+
+    # The records of a block are encoded individually, and then joined.
+    block = [{ 'p': ('word%d' % i, i)} for i in range(1000)]
+
+    return [
+        ('pair', pair, False),
+        ('collected', collected, False),
+        ('block', block, True),
+    ]
+
+def _get_variants():
+    for name in sorted(mr.models.kv.codecs._codecs_by_name.keys()):
+        yield (name, name, 0)
+        yield (name + '+zlib',
+               name,
+               mr.config.kv.CODEC_COMPRESSION_THRESHOLD_BYTES)
+
+def _benchmark(codec_name, threshold, data, is_block):
+    if is_block is True:
+        # This is how the queue writes them (see mr.models.kv.queues.queue).
+        encode = lambda: mr.models.kv.codecs.encode_block(
+                            [mr.models.kv.codecs.encode(
+                                record,
+                                codec_name=codec_name,
+                                compression_threshold_bytes=0)
+                             for record
+                             in data],
+                            compression_threshold_bytes=threshold)
+
+        decode = lambda: mr.models.kv.codecs.decode_many(encoded)
+    else:
+        encode = lambda: mr.models.kv.codecs.encode(
+                            data,
+                            codec_name=codec_name,
+                            compression_threshold_bytes=threshold)
+
+        decode = lambda: mr.models.kv.codecs.decode(encoded)
+
+    encoded = encode()
+
+    encode_s = timeit.timeit(encode, number=_ITERATIONS)
+    decode_s = timeit.timeit(decode, number=_ITERATIONS)
+
+    return (len(encoded),
+            encode_s / _ITERATIONS * 1e6,
+            decode_s / _ITERATIONS * 1e6)
+
+def _main():
+    print("%-10s %-14s %10s %12s %12s" %
+          ('shape', 'codec', 'bytes', 'encode (us)', 'decode (us)'))
+
+    for shape_name, data, is_block in _get_shapes():
+        for variant_name, codec_name, threshold in _get_variants():
+            (size, encode_us, decode_us) = \
+                _benchmark(codec_name, threshold, data, is_block)
+
+            print("%-10s %-14s %10d %12.1f %12.1f" %
+                  (shape_name, variant_name, size, encode_us, decode_us))
+
+        print('')
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python2.7
+
+# Compare the binary queue-message envelope with the double-pickle that it 
+# replaced, on a message with no snapshots and on a fully-populated one.
+
+import sys
+import os.path
+import timeit
+import pickle
+
+dev_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(dev_path, '..'))
+
+import mr.constants
+import mr.queue.queue_message
+
+_ITERATIONS = 20000
+
+def _get_shapes():
+    ids = {
+        'workflow_name': 'test_workflow',
+        'request_id': '6be8bd5a3d934ad1a1d0b4a7d3fb7c8e',
+        'invocation_id': 'c0a9e0ee4fa24f0c8cb8d2b3f9d6c3f1',
+        'step_name': 'map_step1',
+    }
+
+    bare = mr.queue.queue_message.QueueMessageV3(
+            request_snapshot=None,
+            invocation_snapshot=None,
+            job_snapshot=None,
+            step_snapshot=None,
+            handler_name=None,
+            handler_version=None,
+            **ids)
+
+    snapshot = ('c0a9e0ee4fa24f0c8cb8d2b3f9d6c3f1',
+                { 'mapped_step_name': 'map_step1',
+                  'arguments_dataset_name': 'arguments',
+                  'parent_invocation_id': None,
+                  'direction': 'map' },
+                '1234')
+
+    full = mr.queue.queue_message.QueueMessageV3(
+            request_snapshot=snapshot,
+            invocation_snapshot=snapshot,
+            job_snapshot=snapshot,
+            step_snapshot=snapshot,
+            handler_name='map_handler',
+            handler_version='4',
+            **ids)
+
+    return [
+        ('bare', bare),
+        ('full', full),
+    ]
+
+def _pickle_encode(job_class, data):
+    return pickle.dumps((job_class, 3, pickle.dumps(data)))
+
+def _pickle_decode(encoded):
+    (job_class, format_version, data) = pickle.loads(encoded)
+    return (job_class, format_version, pickle.loads(data))
+
+def _get_variants():
+    qmp = mr.queue.queue_message.get_queue_message_processor()
+
+    yield ('pickle', _pickle_encode, _pickle_decode)
+    yield ('envelope', qmp.encode, qmp.decode)
+
+def _benchmark(encode_cb, decode_cb, data):
+    encode = lambda: encode_cb(mr.constants.D_MAP, data)
+
+    encoded = encode()
+    decode = lambda: decode_cb(encoded)
+
+    encode_s = timeit.timeit(encode, number=_ITERATIONS)
+    decode_s = timeit.timeit(decode, number=_ITERATIONS)
+
+    return (len(encoded),
+            encode_s / _ITERATIONS * 1e6,
+            decode_s / _ITERATIONS * 1e6)
+
+def _main():
+    print("%-10s %-14s %10s %12s %12s" %
+          ('shape', 'format', 'bytes', 'encode (us)', 'decode (us)'))
+
+    for shape_name, data in _get_shapes():
+        for variant_name, encode_cb, decode_cb in _get_variants():
+            (size, encode_us, decode_us) = \
+                _benchmark(encode_cb, decode_cb, data)
+
+            print("%-10s %-14s %10d %12.1f %12.1f" %
+                  (shape_name, variant_name, size, encode_us, decode_us))
+
+        print('')
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,34 @@
+"""
+Yields many downstream steps, from a worker process
+
+**
+argument_spec:
+    -
+        name: arguments
+        type: list
+
+handler_type: mapper
+required_capability: none
+execution: process
+"""
+
+import random
+
+arg_dict = dict(arguments)
+
+#yield MrConfigureToMap('step5')
+yield MrConfigureToReturn()
+
+count = random.randrange(1, arg_dict['arg1'])
+
+i = 0
+
+while count > 1:
+    interval = random.randrange(1, count)
+    count -= interval
+
+    #yield ('arg1', interval)
+    yield (random.randrange(10), interval)
+    i += 1
+
+LOG.info("mapper(random_yield_process): Yield (%d) times.", i)
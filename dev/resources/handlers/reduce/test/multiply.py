@@ -9,6 +9,7 @@ argument_spec:
 
 handler_type: reducer
 required_capability: none
+is_associative: true
 """
 
 print("GET(reduce): %s" % (ctx.session_get('key2'),))
@@ -2,7 +2,12 @@
 
 #MR_USE_FAKE_QUEUE=1 \
 #MR_FAKE_QUEUE_SPOOL_PATH=$CWD/../fake_spool_path \
+#MR_USE_MEMORY_QUEUE=1 \
+#MR_USE_SPOOL_QUEUE=1 \
+#MR_SPOOL_QUEUE_PATH=$CWD/../spool_queue \
 #MR_MULTITHREADED=0 \
+#MR_DISPATCHER_FQ_CLASS=mr.queue.dispatcher.ThreadPoolDispatcher \
+#MR_DISPATCH_MAX_CONCURRENCY=20 \
 #MR_RESULT_WRITER_FQ_CLASS=mr.result_writers.file.FileResultWriter \
 #MR_RESULT_WRITER_FQ_CLASS=mr.result_writers.inline.InlineResultWriter \
 
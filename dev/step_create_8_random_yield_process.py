@@ -0,0 +1,3 @@
+#!/bin/sh
+
+DEBUG=1 ../mr/resources/scripts/mr_kv_step_create test_workflow step8_random_yield_process "Yield many pairs from a worker process" map_test_random_yield_process '' reduce_test_sum
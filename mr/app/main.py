@@ -8,6 +8,12 @@ dev_path = os.path.abspath(
 
 sys.path.insert(0, dev_path)
 
+# The dispatcher has to be created before anything connects to the KV (it 
+# might fork).
+
+import mr.queue.dispatcher
+mr.queue.dispatcher.get_dispatcher()
+
 import logging
 import flask
 import atexit
@@ -1,6 +1,78 @@
+_VALUE_SEPARATOR = ','
+_TOMBSTONE_SUFFIX = '!'
+
+def make_entry(version, value):
+    return str(version) + _VALUE_SEPARATOR + value
+
+def make_tombstone_entry(version):
+    return str(version) + _TOMBSTONE_SUFFIX
+
+def parse_entry(entry):
+    """Returns a (version, value) tuple. The value is None for a tombstone."""
+
+    if entry.endswith(_TOMBSTONE_SUFFIX) is True and \
+       entry[:-1].isdigit() is True:
+        return (int(entry[:-1]), None)
+
+    (version, _, value) = entry.partition(_VALUE_SEPARATOR)
+    return (int(version), value)
+
+
 class Cache(object):
+    """A simple string-to-string cache. A miss is always expressed as a 
+    KeyError. Any other exception is considered to be a failure of the cache 
+    itself.
+
+    Versioned entries are stored as the version followed by a comma and the
+    value, or by an exclamation mark if the entry is a tombstone.
+    """
+
     def set(self, key, value):
         raise NotImplementedError()
 
     def get(self, key):
         raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def set_entry_if_newer(self, key, version, entry):
+        """Store the versioned entry, unless the current entry already has a
+        version that's at least as new. This has to be atomic, since the
+        writers may be racing.
+        """
+
+        raise NotImplementedError()
+
+    def set_many_if_newer(self, items):
+        """Like set_if_newer(), for a list of (key, version, value) tuples.
+        Each entry is set atomically, but not the set as a whole.
+        """
+
+        for (key, version, value) in items:
+            self.set_if_newer(key, version, value)
+
+    def set_if_newer(self, key, version, value):
+        """Store the value along with the given (integer) version, unless the
+        entry already has a version that's at least as new.
+        """
+
+        self.set_entry_if_newer(key, version, make_entry(version, value))
+
+    def set_tombstone(self, key, version):
+        """Mark the entry as deleted at the given version. Older versions can't
+        be stored over it, and it reads as a miss.
+        """
+
+        self.set_entry_if_newer(key, version, make_tombstone_entry(version))
+
+    def get_versioned(self, key):
+        """Returns a (version, value) tuple for an entry stored with
+        set_if_newer().
+        """
+
+        (version, value) = parse_entry(self.get(key))
+        if value is None:
+            raise KeyError("Key has been deleted: [%s]" % (key,))
+
+        return (version, value)
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import mr.config.cache
+import mr.cache.cache
+
+
+class MemoryCache(mr.cache.cache.Cache):
+    """A cache that lives entirely in the current process. This is only useful 
+    for a single-server deployment, or for testing without a Redis server.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(MemoryCache, self).__init__(*args, **kwargs)
+
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+    def set(self, key, value):
+        expires_at = time.time() + mr.config.cache.ENTRY_TTL_S
+
+        with self.__lock:
+            self.__entries[key] = (expires_at, value)
+
+    def set_entry_if_newer(self, key, version, entry):
+        now = time.time()
+
+        with self.__lock:
+            try:
+                (expires_at, current_entry) = self.__entries[key]
+            except KeyError:
+                pass
+            else:
+                (current_version, _) = \
+                    mr.cache.cache.parse_entry(current_entry)
+
+                if expires_at >= now and current_version >= version:
+                    return
+
+            self.__entries[key] = \
+                (now + mr.config.cache.ENTRY_TTL_S, entry)
+
+    def get(self, key):
+        with self.__lock:
+            try:
+                (expires_at, value) = self.__entries[key]
+            except KeyError:
+                raise KeyError("Could not find key: [%s]" % (key,))
+
+            if expires_at < time.time():
+                del self.__entries[key]
+                raise KeyError("Key has expired: [%s]" % (key,))
+
+        return value
+
+    def delete(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
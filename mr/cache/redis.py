@@ -1,8 +1,25 @@
+from __future__ import absolute_import
+
 import redis
 
 import mr.config.cache
 import mr.cache.cache
 
+# Set the entry unless it already has a version at least as new as ours. The 
+# version prefixes the entry, and is followed by a comma (or an exclamation 
+# mark, for a tombstone).
+_SET_IF_NEWER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local current_version = tonumber(string.match(current, '^(%d+)[,!]'))
+    if current_version and current_version >= tonumber(ARGV[1]) then
+        return 0
+    end
+end
+
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
 
 class RedisCache(mr.cache.cache.Cache):
     def __init__(self, *args, **kwargs):
@@ -11,8 +28,10 @@ class RedisCache(mr.cache.cache.Cache):
                     host=mr.config.cache.REDIS_HOST, 
                     port=mr.config.cache.REDIS_PORT)
 
+        self.__set_if_newer = self.__r.register_script(_SET_IF_NEWER_SCRIPT)
+
     def set(self, key, value):
-        self.__r.set(key, value)
+        self.__r.set(key, value, ex=mr.config.cache.ENTRY_TTL_S)
 
     def get(self, key):
         value = self.__r.get(key)
@@ -20,3 +39,25 @@ class RedisCache(mr.cache.cache.Cache):
             raise KeyError("Could not find key: [%s]" % (key,))
 
         return value
+
+    def delete(self, key):
+        self.__r.delete(key)
+
+    def set_entry_if_newer(self, key, version, entry):
+        self.__set_if_newer(
+            keys=[key], 
+            args=[version, entry, mr.config.cache.ENTRY_TTL_S])
+
+    def set_many_if_newer(self, items):
+        # One round-trip for all of them.
+        pipeline = self.__r.pipeline(transaction=False)
+
+        for (key, version, value) in items:
+            self.__set_if_newer(
+                keys=[key], 
+                args=[version, 
+                      mr.cache.cache.make_entry(version, value), 
+                      mr.config.cache.ENTRY_TTL_S],
+                client=pipeline)
+
+        pipeline.execute()
@@ -1,15 +1,22 @@
 import os
 
 import mr.constants
-import mr.cache.redis
 
-_CACHE_CLS_MAP = {
-    mr.constants.CT_REDIS: mr.cache.redis.RedisCache,
+_CACHE_FQ_CLASS_MAP = {
+    mr.constants.CT_REDIS: 'mr.cache.redis.RedisCache',
+    mr.constants.CT_MEMORY: 'mr.cache.memory.MemoryCache',
 }
 
 _CACHE_TYPE = os.environ.get('MR_CACHE_TYPE', mr.constants.CT_REDIS)
 
-_CACHE_CLS = _CACHE_CLS_MAP[_CACHE_TYPE]
+CACHE_FQ_CLASS = _CACHE_FQ_CLASS_MAP[_CACHE_TYPE]
 
 REDIS_HOST = os.environ.get('MR_CACHE_REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.environ.get('MR_CACHE_REDIS_PORT', '6379'))
+
+# Entries will fall out of the cache after this long, even if they weren't 
+# explicitly removed (e.g. the children of a deleted directory).
+ENTRY_TTL_S = int(os.environ.get('MR_CACHE_ENTRY_TTL_S', '3600'))
+
+# Prefixed to every key that the KV stores in the cache.
+KV_KEY_PREFIX = os.environ.get('MR_CACHE_KV_KEY_PREFIX', 'mr.kv:')
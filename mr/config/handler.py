@@ -1,4 +1,5 @@
 import os
+import multiprocessing
 
 import mr.constants
 
@@ -10,6 +11,12 @@ REQUIRED_META_FIELDS = [
     'required_capability',
 ]
 
+# Meta fields that a handler may omit.
+OPTIONAL_META_FIELDS = [
+    'is_associative',
+    'execution',
+]
+
 CODE_EXTENSION_MAP = {
     'py': mr.constants.CODE_PYTHON,
 }
@@ -33,3 +40,13 @@ except KeyError:
 HANDLER_UPDATE_INTERVAL_S = int(os.environ.get(
                                     'MR_HANDLER_UPDATE_CHECK_INTERVAL_S', 
                                     '10'))
+
+# The number of worker processes that run handlers with an execution of 
+# "process", and how many arguments/results are sent to/from them at a time.
+PROCESS_POOL_SIZE = int(os.environ.get(
+                            'MR_HANDLER_PROCESS_POOL_SIZE', 
+                            str(multiprocessing.cpu_count())))
+
+PROCESS_BATCH_SIZE = int(os.environ.get(
+                            'MR_HANDLER_PROCESS_BATCH_SIZE', 
+                            '1000'))
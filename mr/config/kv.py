@@ -1,5 +1,6 @@
 import os
-import json
+
+import mr.constants
 
 ENTITY_ROOT = ('entities',)
 ENTITY_TREE_ROOT = ('entity_trees',)
@@ -9,7 +10,69 @@ REPR_DATA_TRUNCATE_WIDTH = 20
 
 DEFAULT_ATOMIC_UPDATE_MAX_ATTEMPTS = 5
 
-ENCODER = json.dumps
-DECODER = json.loads
+# The codec that new values are written with (see mr.models.kv.codecs): 
+# "json", "marshal", or "msgpack" (if installed). Existing values are read 
+# with whichever codec they were written with.
+CODEC = os.environ.get('MR_KV_CODEC', 'json')
+
+# Encoded values larger than this are compressed. Zero disables compression.
+CODEC_COMPRESSION_THRESHOLD_BYTES = int(os.environ.get(
+                                        'MR_KV_CODEC_COMPRESSION_THRESHOLD_BYTES', 
+                                        '4096'))
+
+# The consistency of reads for models that don't specify one. "linearizable" 
+# reads always go through the leader. "local" reads may be served by whichever 
+# member we're connected to.
+DEFAULT_READ_CONSISTENCY = os.environ.get(
+                            'MR_KV_READ_CONSISTENCY', 
+                            mr.constants.RC_LINEARIZABLE)
+
+# The number of concurrent reads made when loading many models at once.
+GET_MANY_CONCURRENCY = int(os.environ.get(
+                            'MR_KV_GET_MANY_CONCURRENCY', 
+                            '20'))
 
 IS_CACHED = bool(int(os.environ.get('MR_KV_CACHE', '0')))
+
+# Keep a process-local cache of the models that almost never change 
+# (workflows, jobs, steps, and handlers). Entries are invalidated by watching 
+# the KV, and will never be served once they're older than the maximum age.
+IS_MODEL_CACHED = bool(int(os.environ.get('MR_KV_MODEL_CACHE', '1')))
+MODEL_CACHE_MAX_AGE_S = float(os.environ.get(
+                                'MR_KV_MODEL_CACHE_MAX_AGE_S', 
+                                '60'))
+
+MODEL_CACHE_WATCH_FAULT_DELAY_S = 1
+
+# When many records are added to a queue at once, they're packed into blocks, 
+# and each block is stored as one node. A block is written once it has this 
+# many records or once its records have this many encoded bytes.
+QUEUE_BLOCK_MAX_RECORDS = int(os.environ.get(
+                                'MR_KV_QUEUE_BLOCK_MAX_RECORDS', 
+                                '1000'))
+
+QUEUE_BLOCK_MAX_BYTES = int(os.environ.get(
+                                'MR_KV_QUEUE_BLOCK_MAX_BYTES', 
+                                '65536'))
+
+# The number of nodes that are written to a queue's directory (or to any one 
+# of its bucket directories) before moving on to a new bucket. A queue is read 
+# one bucket at a time.
+QUEUE_BUCKET_MAX_NODES = int(os.environ.get(
+                                'MR_KV_QUEUE_BUCKET_MAX_NODES', 
+                                '16'))
+
+# The children of the trees that grow with the fan-out of an invocation (its 
+# relationships and completions) are spread over buckets named for this many 
+# hex characters of the hashes of their names, so that they're read one bucket 
+# at a time. Zero disables it. This can't be changed while any requests are in 
+# progress.
+INVOCATION_TREE_BUCKET_NAME_LENGTH = int(os.environ.get(
+                                        'MR_KV_INVOCATION_TREE_BUCKET_NAME_LENGTH', 
+                                        '1'))
+
+# The completions of the steps mapped by an invocation are counted with this 
+# many counters, so that wide fan-outs don't all compete to update one node.
+COMPLETION_COUNT_SHARDS = int(os.environ.get(
+                                'MR_KV_COMPLETION_COUNT_SHARDS', 
+                                '16'))
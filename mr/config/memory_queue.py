@@ -0,0 +1,15 @@
+import os
+
+# The most messages that may be waiting on one topic. Pushes wait for room for 
+# up to the timeout, and then fail.
+TOPIC_MAX_LENGTH = int(os.environ.get(
+                        'MR_MEMORY_QUEUE_TOPIC_MAX_LENGTH', 
+                        '100000'))
+
+PUSH_TIMEOUT_S = float(os.environ.get(
+                        'MR_MEMORY_QUEUE_PUSH_TIMEOUT_S', 
+                        '30'))
+
+# The number of greenlets that take messages off the topics. They only decode 
+# them and hand them to the dispatcher, so few are needed.
+CONSUMER_COUNT = int(os.environ.get('MR_MEMORY_QUEUE_CONSUMER_COUNT', '4'))
@@ -32,3 +32,21 @@ if not _SERVER_NODES:
 NODE_COLLECTION = nsq.node_collection.ServerNodes(_SERVER_NODES)
 
 MAX_IN_FLIGHT = int(os.environ.get('MR_NSQ_MAX_IN_FLIGHT', '20000'))
+
+# Rather than a PUB per message, buffer the messages for each topic and publish 
+# them with one MPUB once there are enough of them, or once the first has 
+# waited long enough.
+IS_PUBLISH_COALESCED = bool(int(os.environ.get(
+                                'MR_NSQ_COALESCE_PUBLISHES', 
+                                '1')))
+
+PUBLISH_BATCH_MAX_COUNT = int(os.environ.get(
+                                'MR_NSQ_PUBLISH_BATCH_MAX_COUNT', 
+                                '500'))
+
+# This should be below nsqd's --max-body-size .
+PUBLISH_BATCH_MAX_BYTES = int(os.environ.get(
+                                'MR_NSQ_PUBLISH_BATCH_MAX_BYTES', 
+                                str(1024 * 1024)))
+
+PUBLISH_LINGER_S = float(os.environ.get('MR_NSQ_PUBLISH_LINGER_S', '.002'))
@@ -7,14 +7,78 @@ _logger = logging.getLogger(__name__)
 
 _USE_FAKE_QUEUE = bool(int(os.environ.get('MR_USE_FAKE_QUEUE', '0')))
 
+# Keep the queue within the process. For single-node deployments and 
+# load-testing.
+_USE_MEMORY_QUEUE = bool(int(os.environ.get('MR_USE_MEMORY_QUEUE', '0')))
+
+# Keep the queue in a local, durable spool (see MR_SPOOL_QUEUE_PATH). For 
+# single-node deployments that can't run nsqd.
+_USE_SPOOL_QUEUE = bool(int(os.environ.get('MR_USE_SPOOL_QUEUE', '0')))
+
+# Whether the queue is shared by every process that pushes to it. Only NSQ is.
+IS_SHARED = False
+
 if _USE_FAKE_QUEUE is True:
     _logger.warning("'Fake' queue elected.")
     QUEUE_FACTORY_FQ_CLASS = 'mr.queue.backends.fake_queue.FakeQueueFactory'
+elif _USE_MEMORY_QUEUE is True:
+    _logger.warning("In-memory queue elected. Messages will not be shared "
+                    "with other processes nor survive a restart.")
+
+    QUEUE_FACTORY_FQ_CLASS = \
+        'mr.queue.backends.memory_queue.MemoryQueueFactory'
+elif _USE_SPOOL_QUEUE is True:
+    _logger.warning("Local spool queue elected. Messages will not be shared "
+                    "with other systems.")
+
+    QUEUE_FACTORY_FQ_CLASS = 'mr.queue.backends.spool_queue.SpoolQueueFactory'
 else:
     QUEUE_FACTORY_FQ_CLASS = 'mr.queue.backends.nsq_queue.NsqQueueFactory'
+    IS_SHARED = True
 
 IS_MULTITHREADED = bool(int(os.environ.get('MR_MULTITHREADED', '1')))
 
+# How dequeued messages are run (if multithreaded), and how many may run at 
+# once. The consumer only asks for as many messages as there are free slots. 
+# See mr.queue.dispatcher .
+DISPATCHER_FQ_CLASS = os.environ.get(
+                        'MR_DISPATCHER_FQ_CLASS', 
+                        'mr.queue.dispatcher.GeventPoolDispatcher')
+
+DISPATCH_MAX_CONCURRENCY = int(os.environ.get(
+                                'MR_DISPATCH_MAX_CONCURRENCY', 
+                                '20'))
+
+# If we consume the topic that a new step would be published to, and we have 
+# a free dispatch slot, handle it immediately rather than sending it through 
+# the queue. A step that's handled locally is never persisted to the queue: 
+# if this process goes down while it's running, it won't be redelivered, and 
+# the request won't complete. Only enable this if that's acceptable.
+IS_LOCAL_EXECUTION_ENABLED = bool(int(os.environ.get(
+                                        'MR_LOCAL_EXECUTION', 
+                                        '0')))
+
+# Wait for the steps that a message produces to be published before the 
+# message is finished. The producer might otherwise still be buffering them 
+# when the process goes down.
+IS_PUBLISH_CONFIRMED = bool(int(os.environ.get(
+                                'MR_QUEUE_CONFIRM_PUBLISH', 
+                                '1')))
+
+# When a mapper maps to downstream steps, the steps are created this many at a 
+# time, with this many concurrent operations, and each batch is published as 
+# one.
+MAP_FANOUT_BATCH_SIZE = int(os.environ.get('MR_MAP_FANOUT_BATCH_SIZE', '500'))
+MAP_FANOUT_CONCURRENCY = int(os.environ.get(
+                                'MR_MAP_FANOUT_CONCURRENCY', 
+                                '20'))
+
+# Messages queued before the binary envelope were pickled. Only accept them if 
+# the queue is entirely trusted.
+IS_PICKLED_MESSAGE_ACCEPTED = bool(int(os.environ.get(
+                                        'MR_QUEUE_ACCEPT_PICKLED_MESSAGES', 
+                                        '0')))
+
 TOPIC_NAME_MAP_TEMPLATE = 'mr.%(workflow_name)s.map.%(capability_name)s'
 TOPIC_NAME_REDUCE_TEMPLATE = 'mr.%(workflow_name)s.reduce.%(capability_name)s'
 
@@ -30,8 +94,6 @@ def get_current_workflows():
 
 CONSUMER_ENABLED = bool(int(os.environ.get('MR_CONSUME', '1')))
 
-DISPATCH_CLEANUP_INTERVAL_S = 1
-
 _CAPABILITIES = os.environ.get(
                     'MR_SYSTEM_CAPABILITIES', 
                     mr.constants.CAP_GENERAL)
@@ -0,0 +1,32 @@
+import os
+
+# Fold the results of mapped steps into partial reductions as they complete, 
+# when the reducer declares itself associative.
+IS_EAGER_REDUCTION_ENABLED = bool(int(os.environ.get(
+                                        'MR_REDUCE_EAGER', 
+                                        '1')))
+
+# The number of partial reductions that the results are spread over (to limit 
+# contention between completing steps).
+EAGER_REDUCTION_SHARD_COUNT = int(os.environ.get(
+                                    'MR_REDUCE_EAGER_SHARD_COUNT', 
+                                    '8'))
+
+# A partial reduction won't grow beyond this many (encoded) bytes. Results 
+# that don't fit are left to be read by the final reduction.
+EAGER_REDUCTION_MAX_BYTES = int(os.environ.get(
+                                    'MR_REDUCE_EAGER_MAX_BYTES', 
+                                    '262144'))
+
+# The number of times that we'll try to fold a result into a partial reduction 
+# that other steps keep changing, before leaving it to the final reduction. 
+# The reducer is rerun for every attempt.
+EAGER_REDUCTION_MAX_FOLD_ATTEMPTS = int(os.environ.get(
+                                        'MR_REDUCE_EAGER_MAX_FOLD_ATTEMPTS', 
+                                        '2'))
+
+# When an invocation maps to more than this many downstream steps, and its 
+# reducer is associative, the steps are grouped under intermediate invocations 
+# of this many each. The groups are reduced in parallel, and then their 
+# results are reduced. Zero disables this.
+TIER_FAN_IN = int(os.environ.get('MR_REDUCE_TIER_FAN_IN', '100'))
@@ -0,0 +1,18 @@
+import os
+
+# Sorting large sets of pairs (e.g. in the default combiner) holds at most 
+# about this many (serialized) bytes of pairs in memory. Beyond that, sorted 
+# runs are spilled to temporary files and then merged.
+RUN_MAX_BYTES = int(os.environ.get(
+                    'MR_SORT_RUN_MAX_BYTES', 
+                    str(32 * 1024 * 1024)))
+
+# Store the reduction results that will be reduced again (by the parent of the 
+# mapping) sorted by key, so that the parent can merge them as streams rather 
+# than sorting them.
+IS_REDUCTION_RESULT_SORTED = bool(int(os.environ.get(
+                                    'MR_SORT_REDUCTION_RESULTS', 
+                                    '1')))
+
+# Where the runs are spilled. Defaults to the system's temporary directory.
+SPILL_PATH = os.environ.get('MR_SORT_SPILL_PATH', '') or None
@@ -0,0 +1,26 @@
+import os
+
+# The directory that holds the log of each topic. Only one process may use it 
+# at a time.
+SPOOL_PATH = os.environ.get('MR_SPOOL_QUEUE_PATH', '')
+
+# A topic's log is split into segments of about this size, so that consumed 
+# messages can be reclaimed a segment at a time.
+SEGMENT_MAX_BYTES = int(os.environ.get(
+                        'MR_SPOOL_QUEUE_SEGMENT_MAX_BYTES', 
+                        str(64 * 1024 * 1024)))
+
+# Appended messages are synced to disk together, this long after the first of 
+# them, or as soon as this many bytes are waiting. Messages are only consumed, 
+# and pushes only complete, once they've been synced.
+FSYNC_INTERVAL_S = float(os.environ.get(
+                            'MR_SPOOL_QUEUE_FSYNC_INTERVAL_S', 
+                            '.01'))
+
+FSYNC_BATCH_BYTES = int(os.environ.get(
+                        'MR_SPOOL_QUEUE_FSYNC_BATCH_BYTES', 
+                        str(1024 * 1024)))
+
+# The number of greenlets that take messages off the topics. They only decode 
+# them and hand them to the dispatcher, so few are needed.
+CONSUMER_COUNT = int(os.environ.get('MR_SPOOL_QUEUE_CONSUMER_COUNT', '4'))
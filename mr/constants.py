@@ -6,6 +6,7 @@ ID_REQUEST = 'request'
 ID_STEP = 'step'
 ID_HANDLER = 'handler'
 ID_INVOCATION = 'invocation'
+ID_PARTIAL_REDUCTION = 'partial_reduction'
 
 # Code types.
 
@@ -32,6 +33,14 @@ IT_PNG = 'png'
 # Cache types.
 
 CT_REDIS = 'redis'
+CT_MEMORY = 'memory'
+
+# KV read consistencies.
+
+RC_LINEARIZABLE = 'linearizable'
+RC_LOCAL = 'local'
+
+READ_CONSISTENCIES = (RC_LINEARIZABLE, RC_LOCAL)
 
 # Timestamp formats.
 
@@ -0,0 +1,105 @@
+"""Sort (key, value) pairs that might not fit in memory. Pairs are collected 
+into bounded runs, each run is sorted and spilled to a temporary file, and the 
+runs are then merged.
+"""
+
+import logging
+import marshal
+import tempfile
+import heapq
+
+import mr.config.sort
+
+_logger = logging.getLogger(__name__)
+
+
+def _spill_run(run):
+    """Write a sorted run to a temporary file. The file is removed as soon as 
+    it's closed.
+    """
+
+    f = tempfile.TemporaryFile(dir=mr.config.sort.SPILL_PATH)
+
+    for (key, i, serialized) in run:
+        f.write(serialized)
+
+    f.seek(0)
+    return f
+
+def _read_run(f):
+    try:
+        while 1:
+            try:
+                yield marshal.load(f)
+            except EOFError:
+                break
+    finally:
+        f.close()
+
+def merge_sorted_pairs(sorted_pairs_gens):
+    """Merge streams of (key, value) pairs that are each already sorted by key 
+    into one sorted stream, reading only one pair ahead in each. Pairs with 
+    equal keys come out in the order of the streams they were read from.
+    """
+
+    def tag(j, pairs_gen):
+        for i, (key, value) in enumerate(pairs_gen):
+            yield (key, j, i, value)
+
+    tagged = [tag(j, pairs_gen) 
+              for (j, pairs_gen) 
+              in enumerate(sorted_pairs_gens)]
+
+    return ((key, value) 
+            for (key, j, i, value) 
+            in heapq.merge(*tagged))
+
+def sort_pairs(pairs_gen, max_run_bytes=None):
+    """Yield the given (key, value) pairs sorted by key. Pairs with equal keys 
+    keep their original order. Keys and values must be serializable by 
+    marshal (anything that can be stored to the KV is).
+    """
+
+    if max_run_bytes is None:
+        max_run_bytes = mr.config.sort.RUN_MAX_BYTES
+
+    spilled = []
+    run = []
+    run_bytes = 0
+
+    for i, (key, value) in enumerate(pairs_gen):
+        # We keep the serialized pair rather than the pair, so that we know 
+        # what we're holding onto. The index keeps the sort stable, and keeps 
+        # us from ever comparing values.
+        serialized = marshal.dumps((key, i, value))
+        run.append((key, i, serialized))
+        run_bytes += len(serialized)
+
+        if run_bytes >= max_run_bytes:
+            run.sort()
+
+            _logger.debug("Spilling sorted run (%d) of (%d) pairs and (%d) "
+                          "bytes.", len(spilled), len(run), run_bytes)
+
+            spilled.append(_spill_run(run))
+
+            run = []
+            run_bytes = 0
+
+    run.sort()
+
+    last_run = (marshal.loads(serialized) for (key, i, serialized) in run)
+
+    if spilled:
+        _logger.debug("Merging (%d) spilled runs and (%d) in-memory pairs.", 
+                      len(spilled), len(run))
+
+        runs = [_read_run(f) for f in spilled]
+        runs.append(last_run)
+
+        merged = heapq.merge(*runs)
+    else:
+        # Everything fit in memory.
+        merged = last_run
+
+    return ((key, value) for (key, i, value) in merged)
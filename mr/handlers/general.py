@@ -38,6 +38,12 @@ STAGED_HANDLER_CLS = collections.namedtuple(
                          'argument_names', 
                          'basic_scope'])
 
+COMPILED_HANDLER_CLS = collections.namedtuple(
+                        'COMPILED_HANDLER_CLS',
+                        ['meta', 
+                         'precompiled', 
+                         'template_scope'])
+
 HANDLER_CONTEXT_CLS = collections.namedtuple(
                         'HANDLER_CONTEXT_CLS',
                         ['request', 
@@ -123,6 +129,10 @@ class Handlers(object):
 
         self.__staged_handlers = {}
 
+        # Compiled handlers, keyed by (name, version).
+        self.__compiled_handlers = {}
+        self.__compile_lock = threading.Lock()
+
         self.__ucl_exit_ev = None
         self.__ucl_t = None
 
@@ -217,6 +227,7 @@ class Handlers(object):
 
         for updated_handler_name in updated_handler_names_s:
             del self.__staged_handlers[updated_handler_name]
+            self.__discard_compiled_handler(updated_handler_name)
 
             try:
                 hd = self.__source.get_handler(updated_handler_name)
@@ -230,10 +241,11 @@ class Handlers(object):
         for deleted_handler_name in deleted_handler_names_s:
             self.__library.delete_handler(deleted_handler_name)
             del self.__staged_handlers[deleted_handler_name]
+            self.__discard_compiled_handler(deleted_handler_name)
 
         self.__stage_handlers()
 
-    def __get_scope_objects(self, hd, context):
+    def __get_scope_objects(self, hd):
         fs = mr.fs.general.get_fs(self.__workflow)
 
         def path_join(*args):
@@ -265,17 +277,68 @@ class Handlers(object):
 
         return scope
 
-    def __compile_handler(self, hd, arg_names, context, scope=None):
-        if scope is None:
-            scope = {}
+    def __get_compiled_handler(self, hd, arg_names):
+        """Return the compiled form of the given handler. The compilation (and 
+        the construction of the parts of the scope that don't change between 
+        invocations) is only done once for every version of every handler. 
+        The scope objects (the filesystem, the loggers, and whatever the 
+        scope-factory provides) are built for every invocation, since they 
+        might carry state.
+        """
 
-        scope.update(mr.handlers.scope.SCOPE_INJECTED_TYPES)
-        scope.update(self.__get_scope_objects(hd, context))
+        key = (hd.name, hd.version)
+
+        try:
+            return self.__compiled_handlers[key]
+        except KeyError:
+            pass
+
+        with self.__compile_lock:
+            # Someone else might have compiled it while we were waiting.
+            try:
+                return self.__compiled_handlers[key]
+            except KeyError:
+                pass
+
+            _logger.debug("Compiling handler [%s] version [%s].", 
+                          hd.name, hd.version)
+
+            processor = mr.handlers.utility.get_processor(hd.source_type)
+
+            (meta, precompiled) = processor.precompile(
+                                    hd.name, 
+                                    arg_names, 
+                                    hd.source_code)
+
+            template_scope = {}
+            template_scope.update(mr.handlers.scope.SCOPE_INJECTED_TYPES)
+
+            compiled_handler = COMPILED_HANDLER_CLS(
+                                meta=meta,
+                                precompiled=precompiled,
+                                template_scope=template_scope)
+
+            self.__compiled_handlers[key] = compiled_handler
+
+            return compiled_handler
+
+    def __discard_compiled_handler(self, name):
+        """Forget any compiled versions of the given handler."""
+
+        with self.__compile_lock:
+            for key in self.__compiled_handlers.keys():
+                if key[0] == name:
+                    del self.__compiled_handlers[key]
+
+    def __bind_handler(self, hd, compiled_handler, scope):
+        """Bind a compiled handler to the scope of one invocation."""
 
         processor = mr.handlers.utility.get_processor(hd.source_type)
 
         handler_scope = {}
         handler_scope.update(scope)
+        handler_scope.update(compiled_handler.template_scope)
+        handler_scope.update(self.__get_scope_objects(hd))
 
         stdout_ = cStringIO.StringIO()
         stderr_ = cStringIO.StringIO()
@@ -324,17 +387,11 @@ class Handlers(object):
         if self.__hsf is not None:
             handler_scope.update(self.__hsf.get_scope(hd))
 
-        r = processor.compile(
-                hd.name, 
-                arg_names, 
-                hd.source_code, 
-                stdout=stdout_, 
-                stderr=stderr_, 
-                scope=handler_scope)
+        compiled = processor.bind(
+                    compiled_handler.precompiled, 
+                    scope=handler_scope)
  
-        (meta, compiled) = r
-
-        return (meta, compiled, stdout_, stderr_)
+        return (compiled_handler.meta, compiled, stdout_, stderr_)
 
     def __stage_handlers(self):
         """Push the handlers into the dictionary that we use to describe all 
@@ -364,6 +421,27 @@ class Handlers(object):
             _logger.warning("No handlers were presented by the library. No "
                             "code was compiled.")
 
+    def get_handler_version(self, name):
+        """Returns the version of the given handler that's staged."""
+
+        return self.__staged_handlers[name].definition.version
+
+    def restage_handler(self, name):
+        """Forget the staged and compiled forms of the given handler, and 
+        stage it again from the library. This is for processes that don't run 
+        the update-check (it's not carried over a fork).
+        """
+
+        _logger.info("Restaging handler: [%s]", name)
+
+        try:
+            del self.__staged_handlers[name]
+        except KeyError:
+            pass
+
+        self.__discard_compiled_handler(name)
+        self.__stage_handlers()
+
     def __get_session(self, map_invocation, allow_session_writes=True):
         """Return accessors of data that's stored on the map_invocation."""
 
@@ -439,13 +517,14 @@ class Handlers(object):
         final_scope.update(session_scope)
         final_scope.update(basic_scope)
 
-        compile_result = self.__compile_handler(
-                            hd, 
-                            arg_names, 
-                            context,
-                            scope=final_scope)
+        compiled_handler = self.__get_compiled_handler(hd, arg_names)
+
+        bind_result = self.__bind_handler(
+                        hd, 
+                        compiled_handler, 
+                        final_scope)
 
-        (meta, compiled, stdout, stderr) = compile_result
+        (meta, compiled, stdout, stderr) = bind_result
 
         processor = mr.handlers.utility.get_processor(hd.source_type)
 
@@ -0,0 +1,327 @@
+"""Runs handlers in a pool of worker processes. This is for CPU-bound 
+handlers, which would otherwise serialize on the GIL and block the event-loop 
+that also serves requests. 
+
+The workers are new interpreters (this module, run as a script) rather than 
+forks, so they don't inherit our KV and queue connections, greenlets, or 
+threads. Each opens its own connections, loads the workflows that it's asked 
+to run handlers for, and keeps its own cache of compiled handlers.
+
+The arguments that are generators and the results are sent over the process's
+pipe in batches. The process asks for each batch of arguments when it needs
+it, so the two sides never both block on writing.
+"""
+
+import logging
+import os
+import sys
+import fcntl
+import collections
+import itertools
+import multiprocessing
+import _multiprocessing
+import subprocess
+import traceback
+
+import gevent.queue
+import gevent.socket
+
+import mr.config.handler
+import mr.workflow_manager
+import mr.models.kv.workflow
+import mr.models.kv.request
+import mr.models.kv.invocation
+import mr.handlers.general
+
+_logger = logging.getLogger(__name__)
+
+# Messages to the worker.
+_M_RUN = 'run'
+_M_BATCH = 'batch'
+_M_END = 'end'
+
+# Messages from the worker.
+_M_MORE = 'more'
+_M_RESULTS = 'results'
+_M_DONE = 'done'
+_M_ERROR = 'error'
+
+
+class ProcessHandlerException(Exception):
+    def __init__(self, handler_name, traceback):
+        super(ProcessHandlerException, self).__init__(
+            "There was an exception while running handler [%s] in a worker "
+            "process:\n%s" % (handler_name, traceback))
+
+        self.__handler_name = handler_name
+        self.__traceback = traceback
+
+    @property
+    def handler_name(self):
+        return self.__handler_name
+
+    @property
+    def traceback(self):
+        return self.__traceback
+
+def _get_streamed_arguments_gen(conn):
+    while 1:
+        conn.send((_M_MORE, None))
+        (type_, batch) = conn.recv()
+
+        if type_ == _M_END:
+            break
+
+        for item in batch:
+            yield item
+
+def _get_sendable(item):
+    """A pair's value might be a generator (e.g. from a combiner)."""
+
+    if issubclass(item.__class__, tuple) is True:
+        return tuple(list(x)
+                     if issubclass(x.__class__, collections.Iterator)
+                     else x
+                     for x
+                     in item)
+
+    return item
+
+def _get_managed_workflow(workflow_name):
+    wm = mr.workflow_manager.get_wm()
+
+    try:
+        return wm.get(workflow_name)
+    except KeyError:
+        pass
+
+    _logger.info("Loading workflow into worker process: [%s]", workflow_name)
+
+    workflow = mr.models.kv.workflow.get(workflow_name)
+    wm.add(workflow)
+
+    return wm.get(workflow_name)
+
+def _run_one(conn, run_request):
+    managed_workflow = _get_managed_workflow(run_request['workflow_name'])
+    workflow = managed_workflow.workflow
+    handlers = managed_workflow.handlers
+
+    handler_name = run_request['handler_name']
+
+    # Our update-check might not have seen the update that the parent is 
+    # running with, yet.
+
+    try:
+        staged_version = handlers.get_handler_version(handler_name)
+    except KeyError:
+        staged_version = None
+
+    if staged_version != run_request['version']:
+        handlers.restage_handler(handler_name)
+
+    context = mr.handlers.general.HANDLER_CONTEXT_CLS(
+                request=mr.models.kv.request.get(
+                            workflow,
+                            run_request['request_id']),
+                invocation=mr.models.kv.invocation.get(
+                            workflow,
+                            run_request['invocation_id']))
+
+    arguments = run_request['arguments']
+
+    streamed_argument_name = run_request['streamed_argument_name']
+    if streamed_argument_name is not None:
+        arguments[streamed_argument_name] = _get_streamed_arguments_gen(conn)
+
+    (result, stdout, stderr) = handlers.run_handler(
+                                handler_name,
+                                arguments,
+                                context,
+                                allow_session_writes=\
+                                    run_request['allow_session_writes'])
+
+    batch_size = mr.config.handler.PROCESS_BATCH_SIZE
+
+    batch = []
+    for item in result:
+        batch.append(_get_sendable(item))
+
+        if len(batch) >= batch_size:
+            conn.send((_M_RESULTS, batch))
+            batch = []
+
+    if batch:
+        conn.send((_M_RESULTS, batch))
+
+def _set_blocking(fd):
+    # The pipe might have been made from (non-blocking) gevent sockets.
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+
+def _worker_main():
+    # Our end of the pipe is passed as stdin.
+    conn = _multiprocessing.Connection(os.dup(0))
+    _set_blocking(conn.fileno())
+
+    devnull_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull_fd, 0)
+    os.close(devnull_fd)
+
+    while 1:
+        try:
+            (type_, run_request) = conn.recv()
+        except EOFError:
+            break
+
+        assert type_ == _M_RUN
+
+        try:
+            _run_one(conn, run_request)
+        except:
+            _logger.exception("Handler [%s] failed in worker process.",
+                              run_request['handler_name'])
+
+            conn.send((_M_ERROR, traceback.format_exc()))
+        else:
+            conn.send((_M_DONE, None))
+
+
+class _Worker(object):
+    def __init__(self):
+        (self.__conn, child_conn) = multiprocessing.Pipe()
+        _set_blocking(self.__conn.fileno())
+
+        # The worker has to be able to import us the same way that we were.
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+
+        self.__p = subprocess.Popen(
+                    [sys.executable, '-m', _WORKER_MODULE_NAME],
+                    stdin=child_conn.fileno(),
+                    close_fds=True,
+                    env=env)
+
+        child_conn.close()
+
+        _logger.debug("Started handler worker process: (%d)", self.__p.pid)
+
+    def send(self, message):
+        self.__conn.send(message)
+
+    def recv(self):
+        # Don't block the other greenlets while we wait.
+        gevent.socket.wait_read(self.__conn.fileno())
+        return self.__conn.recv()
+
+    def terminate(self):
+        _logger.warning("Terminating handler worker process: (%d)",
+                        self.__p.pid)
+
+        self.__p.terminate()
+        self.__conn.close()
+        self.__p.wait()
+
+
+class _ProcessPool(object):
+    def __init__(self, size):
+        _logger.info("Starting (%d) handler worker processes.", size)
+
+        self.__idle = gevent.queue.Queue()
+
+        for i in xrange(size):
+            self.__idle.put(_Worker())
+
+    def __run_gen(self, run_request, streamed_arguments_gen):
+        batch_size = mr.config.handler.PROCESS_BATCH_SIZE
+
+        # This blocks until a worker is free.
+        worker = self.__idle.get()
+        is_finished = False
+
+        try:
+            worker.send((_M_RUN, run_request))
+
+            while 1:
+                (type_, data) = worker.recv()
+
+                if type_ == _M_MORE:
+                    batch = list(itertools.islice(
+                                    streamed_arguments_gen,
+                                    batch_size))
+
+                    if batch:
+                        worker.send((_M_BATCH, batch))
+                    else:
+                        worker.send((_M_END, None))
+                elif type_ == _M_RESULTS:
+                    for item in data:
+                        yield item
+                elif type_ == _M_DONE:
+                    is_finished = True
+                    break
+                elif type_ == _M_ERROR:
+                    is_finished = True
+
+                    raise ProcessHandlerException(
+                            run_request['handler_name'],
+                            data)
+        finally:
+            if is_finished is True:
+                self.__idle.put(worker)
+            else:
+                # We stopped reading partway through, so we don't know what
+                # state the worker is in.
+                worker.terminate()
+                self.__idle.put(_Worker())
+
+    def run_handler(self, workflow, handler, arguments, context,
+                    allow_session_writes=True):
+        """Returns a generator of the handler's results. An argument that's a
+        generator is streamed to the worker (there can be only one).
+        """
+
+        inline_arguments = {}
+        streamed_argument_name = None
+        streamed_arguments_gen = None
+
+        for name, value in arguments.iteritems():
+            if issubclass(value.__class__, collections.Iterator) is True:
+                assert streamed_argument_name is None, \
+                       "Only one argument can be streamed."
+
+                streamed_argument_name = name
+                streamed_arguments_gen = value
+            else:
+                inline_arguments[name] = value
+
+        run_request = {
+            'workflow_name': workflow.workflow_name,
+            'handler_name': handler.handler_name,
+            'version': handler.version,
+            'request_id': context.request.request_id,
+            'invocation_id': context.invocation.invocation_id,
+            'allow_session_writes': allow_session_writes,
+            'arguments': inline_arguments,
+            'streamed_argument_name': streamed_argument_name,
+        }
+
+        _logger.debug("Running handler [%s] in a worker process. STREAMED=[%s]",
+                      handler.handler_name, streamed_argument_name)
+
+        return self.__run_gen(run_request, streamed_arguments_gen)
+
+# This module, when it's run as a worker.
+_WORKER_MODULE_NAME = 'mr.handlers.process_pool'
+
+_pool = None
+def get_pool():
+    global _pool
+
+    if _pool is None:
+        _pool = _ProcessPool(mr.config.handler.PROCESS_POOL_SIZE)
+
+    return _pool
+
+if __name__ == '__main__':
+    _worker_main()
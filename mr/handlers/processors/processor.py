@@ -2,5 +2,20 @@ class Processor(object):
     def compile(self, name, arg_names, code):
         raise NotImplementedError()
 
+    def precompile(self, name, arg_names, code):
+        """Do the expensive part of compilation, once, and return a (meta, 
+        precompiled) tuple. The precompiled object can be bound to any number 
+        of scopes with bind().
+        """
+
+        raise NotImplementedError()
+
+    def bind(self, precompiled, scope={}):
+        """Return a callable for the given precompiled handler that will run 
+        within the given scope.
+        """
+
+        raise NotImplementedError()
+
     def run(self, compiled, arguments):
         raise NotImplementedError()
@@ -2,15 +2,22 @@ import sys
 import logging
 import hashlib
 import random
+import types
+import collections
 
 import mr.config
 import mr.handlers.processors.processor
 
 _logger = logging.getLogger(__name__)
 
+_PRECOMPILED_CLS = collections.namedtuple(
+                    '_PRECOMPILED_CLS', 
+                    ['code', 
+                     'function_name'])
+
 
 class PythonProcessor(mr.handlers.processors.processor.Processor):
-    def compile(self, name, arg_names, code, stdout=None, stderr=None, scope={}):
+    def precompile(self, name, arg_names, code):
         name = "(lambda handler '%s')" % (name,)
 
         # We create a bonafide function so that we get the benefit of argument-
@@ -42,11 +49,21 @@ class PythonProcessor(mr.handlers.processors.processor.Processor):
 
         c = compile(code, name, 'exec')
 
-        def copy_module(m):
-            x = type(m)(m.__name__, m.__doc__)
-            x.__dict__.update(m.__dict__)
-            return x
+        # Executing the module only defines the function (the body isn't run), 
+        # so it doesn't need the real scope. We just keep the function's code-
+        # object so that it can be bound to a fresh scope for every call.
+        locals_ = {}
+        exec c in { '__builtins__': __builtins__ }, locals_
+     
+        f = locals_[id_]
+
+        precompiled = _PRECOMPILED_CLS(
+                        code=f.__code__, 
+                        function_name=id_)
 
+        return (f.__doc__, precompiled)
+
+    def bind(self, precompiled, scope={}):
         scope_final = {
             '__builtins__': __builtins__, 
             '__name__': '__handler__', 
@@ -55,12 +72,15 @@ class PythonProcessor(mr.handlers.processors.processor.Processor):
         }
         
         scope_final.update(scope)
-        locals_ = {}
-        exec c in scope_final, locals_
-     
-        f = locals_[id_]
 
-        return (f.__doc__, f)
+        return types.FunctionType(
+                precompiled.code, 
+                scope_final, 
+                precompiled.function_name)
+
+    def compile(self, name, arg_names, code, stdout=None, stderr=None, scope={}):
+        (meta, precompiled) = self.precompile(name, arg_names, code)
+        return (meta, self.bind(precompiled, scope))
 
     def run(self, compiled, arguments):
         return compiled(*arguments)
@@ -193,12 +193,16 @@ class HandlerSync(object):
                                  in meta['argument_spec']]
 
         required_fields_s = set(mr.config.handler.REQUIRED_META_FIELDS)
+        optional_fields_s = set(mr.config.handler.OPTIONAL_META_FIELDS)
         available_fields_s = set(meta.keys())
 
-        if required_fields_s != available_fields_s:
+        if required_fields_s.issubset(available_fields_s) is False or \
+           available_fields_s.issubset(
+                required_fields_s | optional_fields_s) is False:
             raise ValueError("[%s] Handler has invalid/missing meta-fields: "
-                             "[%s] != [%s]" % 
-                             (name, required_fields_s, available_fields_s))
+                             "[%s] (+ [%s]) != [%s]" % 
+                             (name, required_fields_s, optional_fields_s, 
+                              available_fields_s))
 
         version = hashlib.sha1(doc_string + source_code).hexdigest()
 
@@ -267,7 +271,11 @@ class HandlerSync(object):
                     source_code=source_code,
                     version=version,
                     handler_type=handler_type,
-                    required_capability=meta['required_capability'])
+                    required_capability=meta['required_capability'],
+                    is_associative=meta.get('is_associative', False),
+                    execution=meta.get(
+                        'execution', 
+                        mr.models.kv.handler.EX_INLINE))
 
         self.__validate_handler(handler)
 
@@ -294,6 +302,10 @@ class HandlerSync(object):
         handler.version = version
         handler.handler_type = handler_type
         handler.required_capability = meta['required_capability']
+        handler.is_associative = meta.get('is_associative', False)
+        handler.execution = meta.get(
+                                'execution', 
+                                mr.models.kv.handler.EX_INLINE)
 
         self.__validate_handler(handler)
 
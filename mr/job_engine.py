@@ -10,6 +10,7 @@ import json
 import time
 import pprint
 import itertools
+import hashlib
 import collections
 
 import gevent.pool
@@ -19,20 +20,29 @@ import etcd.exceptions
 import mr.config
 import mr.config.queue
 import mr.config.result
+import mr.config.sort
+import mr.config.reduce
 import mr.models.kv.job
 import mr.models.kv.step
 import mr.models.kv.handler
 import mr.models.kv.invocation
+import mr.models.kv.partial_reduction
+import mr.models.kv.codecs
+import mr.models.kv.data_layer
 import mr.models.kv.trees.relationships
+import mr.models.kv.trees.completions
 import mr.models.kv.queues.dataset
 import mr.models.kv.request
 import mr.queue.queue_manager
+import mr.queue.dispatcher
 import mr.workflow_manager
 import mr.shared_types
 import mr.constants
 import mr.handlers.scope
 import mr.handlers.general
+import mr.handlers.process_pool
 import mr.utility
+import mr.external_sort
 import mr.log
 
 _logger = logging.getLogger(__name__)
@@ -61,45 +71,144 @@ _flow_logger = _logger.getChild('flow')
 #    l = _request_logger.getChild(request.request_id).getChild(path_type)
 #    getattr(l, severity)(message)
 
+class _PartialReductionTooLargeError(Exception):
+    pass
+
+
 class _QueuePusher(object):
     def __init__(self):
         self.__q = mr.queue.queue_manager.get_queue()
 
-    def queue_map_step_from_parameters(self, message_parameters):
-# TODO(dustin): We might increment a count of total steps processed on the 
-#               request.
-
-        if message_parameters.handler.required_capability != \
-                mr.constants.REQUIRED_CAP_NONE:
-            capability_name = message_parameters.handler.required_capability
+    def __get_capability_name(self, handler):
+        if handler.required_capability != mr.constants.REQUIRED_CAP_NONE:
+            return handler.required_capability
         else:
-            capability_name = mr.constants.CAP_GENERAL
+            return mr.constants.CAP_GENERAL
 
-        _logger.debug("Queueing MAP [%s]. CAPABILITY=[%s] WORKFLOW=[%s]", 
-                      message_parameters.invocation, capability_name, 
-                      message_parameters.workflow.workflow_name)
+    def __get_map_topic(self, message_parameters):
+        capability_name = self.__get_capability_name(
+                            message_parameters.handler)
 
         replacements = {
             'workflow_name': message_parameters.workflow.workflow_name,
             'capability_name': capability_name,
         }
 
-        topic = mr.config.queue.TOPIC_NAME_MAP_TEMPLATE % replacements
+        return mr.config.queue.TOPIC_NAME_MAP_TEMPLATE % replacements
+
+    def __wait_for_publish(self, completion):
+        """The producer might buffer what we push. Unless we're told not to, 
+        wait for it to be published so that the message that we're processing 
+        isn't finished before the steps that it produced are safely queued.
+        """
+
+        if mr.config.queue.IS_PUBLISH_CONFIRMED is True:
+            completion.wait()
+
+    def __try_handle_locally(self, direction, message_parameters):
+        """If local execution was enabled, we consume the topic that the 
+        given step would be published to, and we have a free dispatch slot, 
+        handle it here rather than sending it through the queue. Everything 
+        about the step has already been recorded, so it's handled exactly as 
+        if it had been dequeued. Returns False if it has to be published.
+
+        The step is never queued, so there's nothing to redeliver it if we go 
+        down while it's running, and the message that produced it might be 
+        finished before it is. This is why it's opt-in 
+        (MR_LOCAL_EXECUTION).
+        """
+
+        if mr.config.queue.IS_LOCAL_EXECUTION_ENABLED is False or \
+           mr.config.queue.CONSUMER_ENABLED is False:
+            return False
+
+        workflow_name = message_parameters.workflow.workflow_name
+        if workflow_name not in mr.config.queue.get_current_workflows():
+            return False
+
+        capability_name = self.__get_capability_name(
+                            message_parameters.handler)
+
+        local_capability_names_s = set([
+            c.lower() 
+            for c 
+            in mr.config.queue.LOCAL_SYSTEM_CAPABILITIES])
+
+        if capability_name.lower() not in local_capability_names_s:
+            return False
+
+        sp = get_step_processor()
+        handler = getattr(sp, 'handle_' + direction)
+
+        dispatcher = mr.queue.dispatcher.get_dispatcher()
+        if dispatcher.try_dispatch(handler, message_parameters) is False:
+            return False
 
-        self.__q.producer.push_one(
-            topic, 
-            mr.constants.D_MAP, 
-            message_parameters)
+        _logger.debug("Handling %s [%s] locally.", 
+                      direction.upper(), message_parameters.invocation)
+
+        return True
+
+    def queue_map_step_from_parameters(self, message_parameters):
+# TODO(dustin): We might increment a count of total steps processed on the 
+#               request.
+
+        if self.__try_handle_locally(
+                mr.constants.D_MAP, 
+                message_parameters) is True:
+            return
+
+        topic = self.__get_map_topic(message_parameters)
+
+        _logger.debug("Queueing MAP [%s]. TOPIC=[%s]", 
+                      message_parameters.invocation, topic)
+
+        completion = self.__q.producer.push_one(
+                        topic, 
+                        mr.constants.D_MAP, 
+                        message_parameters)
+
+        self.__wait_for_publish(completion)
+
+    def queue_map_steps_from_parameters(self, message_parameters_list):
+        """Queue many mappings, publishing the ones for each topic together."""
+
+        by_topic = collections.OrderedDict()
+        completions = []
+        for message_parameters in message_parameters_list:
+            if self.__try_handle_locally(
+                    mr.constants.D_MAP, 
+                    message_parameters) is True:
+                continue
+
+            topic = self.__get_map_topic(message_parameters)
+            by_topic.setdefault(topic, []).append(message_parameters)
+
+        for topic, topic_parameters_list in by_topic.iteritems():
+            _logger.debug("Queueing (%d) MAPs. TOPIC=[%s]", 
+                          len(topic_parameters_list), topic)
+
+            completion = self.__q.producer.push_many(
+                            topic, 
+                            mr.constants.D_MAP, 
+                            topic_parameters_list)
+
+            completions.append(completion)
+
+        # The topics are published concurrently.
+        for completion in completions:
+            self.__wait_for_publish(completion)
 
     def queue_initial_map_step_from_parameters(self, message_parameters):
         return self.queue_map_step_from_parameters(message_parameters)
 
     def queue_reduce_step_from_parameters(self, message_parameters, 
-                                          parent_invocation):
+                                          parent_invocation, partition=None):
         """We're reflecting (switch directions from mapping to reduction). The 
         current step is an action step (no mappings were done). The next 
         invocation will successively take the invocation-IDs of one parent to 
-        the next.
+        the next. If a partition is given, only that partition of the parent's 
+        dataset will be reduced.
         """
 
         reduce_step = mr.models.kv.step.get(
@@ -122,7 +231,8 @@ class _QueuePusher(object):
                                 parent_invocation_id=\
                                     parent_invocation.invocation_id,
                                 step_name=reduce_step.step_name,
-                                direction=mr.constants.D_REDUCE)
+                                direction=mr.constants.D_REDUCE,
+                                partition=partition)
 
         reduce_invocation.save()
 
@@ -141,11 +251,12 @@ class _QueuePusher(object):
         _logger.debug("Reduction [%s] will be performed over step: [%s].", 
                       reduce_parameters.invocation, reduce_step.step_name)
 
-        if reduce_handler.required_capability != \
-                mr.constants.REQUIRED_CAP_NONE:
-            capability_name = reduce_handler.required_capability
-        else:
-            capability_name = mr.constants.CAP_GENERAL
+        if self.__try_handle_locally(
+                mr.constants.D_REDUCE, 
+                reduce_parameters) is True:
+            return
+
+        capability_name = self.__get_capability_name(reduce_handler)
 
         _logger.debug("Queueing REDUCE [%s]. CAPABILITY=[%s] WORKFLOW=[%s]", 
                       reduce_parameters.invocation, capability_name, 
@@ -158,10 +269,12 @@ class _QueuePusher(object):
 
         topic = mr.config.queue.TOPIC_NAME_REDUCE_TEMPLATE % replacements
 
-        self.__q.producer.push_one(
-            topic, 
-            mr.constants.D_REDUCE, 
-            reduce_parameters)
+        completion = self.__q.producer.push_one(
+                        topic, 
+                        mr.constants.D_REDUCE, 
+                        reduce_parameters)
+
+        self.__wait_for_publish(completion)
 
 _pusher = None
 def _get_pusher():
@@ -178,7 +291,13 @@ class _StepProcessor(object):
     by the time we're called.
     """
 
-    def __queue_map_step(self, next_step, kv_tuple, original_parameters):
+    def __create_map_step(self, next_step, next_handler, kv_tuples, 
+                          original_parameters):
+        """Create the invocation, arguments, and relationship for one 
+        downstream mapping of one chunk of pairs. Returns the parameters to 
+        queue it with.
+        """
+
         request = original_parameters.request
         workflow = original_parameters.workflow
         job = original_parameters.job
@@ -187,10 +306,6 @@ class _StepProcessor(object):
 
         assert parent_map_invocation.invocation_id is not None
 
-        next_handler = mr.models.kv.handler.get(
-                        workflow, 
-                        next_step.map_handler_name)
-
         # The next invocation will have this [mapping] step as a parent.
         map_invocation = mr.models.kv.invocation.Invocation(
                                 invocation_id=None,
@@ -213,11 +328,11 @@ class _StepProcessor(object):
                 map_invocation, 
                 mr.models.kv.queues.dataset.DT_ARGUMENTS)
 
-        data = {
-            'p': kv_tuple,
-        }
+        data_gen = ({ 'p': kv_tuple } 
+                    for kv_tuple 
+                    in kv_tuples)
 
-        dq.add(data)
+        dq.add_many(data_gen)
 
         # Track the relationship.
 
@@ -228,18 +343,31 @@ class _StepProcessor(object):
 
         rt.add_entity(map_invocation)
 
-        # Queue the mapping.
+        return mr.shared_types.QUEUE_MESSAGE_PARAMETERS_CLS(
+                workflow=workflow,
+                invocation=map_invocation,
+                request=request,
+                job=job,
+                step=next_step,
+                handler=next_handler)
+
+    def __queue_map_steps(self, next_step, next_handler, chunks, 
+                          original_parameters, pool):
+        """Create a batch of downstream mappings (one per chunk of pairs) 
+        concurrently, and then publish them together.
+        """
 
-        mapped_parameters = mr.shared_types.QUEUE_MESSAGE_PARAMETERS_CLS(
-            workflow=workflow,
-            invocation=map_invocation,
-            request=request,
-            job=job,
-            step=next_step,
-            handler=next_handler)
+        def create(kv_tuples):
+            return self.__create_map_step(
+                    next_step, 
+                    next_handler, 
+                    kv_tuples, 
+                    original_parameters)
+
+        mapped_parameters_list = pool.map(create, chunks)
 
         pusher = _get_pusher()
-        pusher.queue_map_step_from_parameters(mapped_parameters)
+        pusher.queue_map_steps_from_parameters(mapped_parameters_list)
 
     def __call_handler(self, construction_context, workflow, handler_name, 
                        arguments, allow_session_writes=True):
@@ -250,6 +378,18 @@ class _StepProcessor(object):
         _logger.debug("Calling handler [%s] under workflow [%s].", 
                       handler_name, workflow.workflow_name)
 
+        handler = mr.models.kv.handler.get(workflow, handler_name)
+
+        if handler.execution == mr.models.kv.handler.EX_PROCESS:
+            pool = mr.handlers.process_pool.get_pool()
+
+            return pool.run_handler(
+                    workflow, 
+                    handler, 
+                    arguments, 
+                    construction_context, 
+                    allow_session_writes=allow_session_writes)
+
         r = handlers.run_handler(
                 handler_name, 
                 arguments, 
@@ -273,24 +413,12 @@ class _StepProcessor(object):
         return result
 
     def __default_combiner(self, map_result_gen):
-        """The default combiner: group by key."""
-
-        if mr.config.IS_DEBUG is True:
-            map_result_gen = list(map_result_gen)
-            _logger.debug("Combining (default):\n%s", 
-                          pprint.pformat(map_result_gen))
+        """The default combiner: group by key. The result is sorted without 
+        holding more than a bounded amount of it in memory.
+        """
 
         # itertools.groupby() requires it to be sorted, first.
-        sorted_result_gen = (p 
-                             for p 
-                             in sorted(
-                                    map_result_gen, 
-                                    key=lambda x: x[0]))
-
-        if mr.config.IS_DEBUG is True:
-            sorted_result_gen = list(sorted_result_gen)
-            _logger.debug("Pre-combine sort:\n%s",
-                          pprint.pformat(sorted_result_gen))
+        sorted_result_gen = mr.external_sort.sort_pairs(map_result_gen)
 
         grouped_result_gen = itertools.groupby(
                                 sorted_result_gen, 
@@ -300,17 +428,8 @@ class _StepProcessor(object):
             for k, value_list in grouped_result_gen:
                 yield (k, (v for (_, v) in value_list))
 
-        distilled_result_gen = make_distilled_result_gen()
-
-        if mr.config.IS_DEBUG is True:
-            distilled_result_gen = [(k, list(value_list)) 
-                                    for (k, value_list) 
-                                    in distilled_result_gen]
-
-            _logger.debug("Combiner result:\n%s", 
-                          pprint.pformat(distilled_result_gen))
-
-        return distilled_result_gen
+        # The result is logged when it's stored, in debug mode.
+        return make_distilled_result_gen()
 
     def __apply_combiner(self, workflow, current_step, map_invocation, 
                          map_result_gen, construction_context):
@@ -327,6 +446,123 @@ class _StepProcessor(object):
         else:
             return self.__default_combiner(map_result_gen)
 
+    def __get_chunks_gen(self, mapped_steps_gen, chunk_size):
+        """Group consecutive pairs into chunks. Each chunk will be the 
+        arguments of one downstream invocation.
+        """
+
+        mapped_steps_gen = iter(mapped_steps_gen)
+
+        while 1:
+            chunk = [(k, v) 
+                     for (k, v) 
+                     in itertools.islice(mapped_steps_gen, chunk_size)]
+
+            if not chunk:
+                break
+
+            yield chunk
+
+    def __map_chunks(self, mapped_step, mapped_handler, chunks_gen, 
+                     message_parameters, pool):
+        """Queue one downstream mapping per chunk, under the invocation of the 
+        given parameters. Returns the number of mappings.
+        """
+
+        invocation = message_parameters.invocation
+
+        i = 0
+        while 1:
+            chunks = list(itertools.islice(
+                            chunks_gen, 
+                            mr.config.queue.MAP_FANOUT_BATCH_SIZE))
+
+            if not chunks:
+                break
+
+            _logger.debug("Queueing mappings (%d)-(%d) from invocation [%s].",
+                          i, i + len(chunks) - 1, invocation)
+
+            self.__queue_map_steps(
+                    mapped_step, 
+                    mapped_handler, 
+                    chunks, 
+                    message_parameters, 
+                    pool)
+
+            i += len(chunks)
+
+        return i
+
+    def __map_tiers(self, mapped_step, mapped_handler, chunks_gen, 
+                    message_parameters, pool):
+        """Queue the downstream mappings in groups under intermediate 
+        invocations of the current step, so that each group is reduced 
+        separately (in parallel), and only the groups' results are reduced by 
+        the current invocation. Returns the number of groups.
+        """
+
+        workflow = message_parameters.workflow
+        invocation = message_parameters.invocation
+
+        rt = mr.models.kv.trees.relationships.RelationshipsTree(
+                workflow, 
+                invocation,
+                mr.models.kv.trees.relationships.RT_MAPPED)
+
+        i = 0
+        while 1:
+            group = list(itertools.islice(
+                            chunks_gen, 
+                            mr.config.reduce.TIER_FAN_IN))
+
+            if not group:
+                break
+
+            tier_invocation = mr.models.kv.invocation.Invocation(
+                                invocation_id=None,
+                                workflow_name=workflow.workflow_name,
+                                parent_invocation_id=invocation.invocation_id,
+                                step_name=invocation.step_name,
+                                direction=mr.constants.D_MAP,
+                                is_reduce_tier=True)
+
+            tier_invocation.save()
+
+            rt.add_entity(tier_invocation)
+
+            _logger.debug("Queueing (%d) mappings under tier (%d) [%s] of "
+                          "invocation [%s].", 
+                          len(group), i, tier_invocation, invocation)
+
+            tier_parameters = message_parameters._replace(
+                                invocation=tier_invocation)
+
+            step_count = self.__map_chunks(
+                            mapped_step, 
+                            mapped_handler, 
+                            iter(group), 
+                            tier_parameters, 
+                            pool)
+
+            tier_invocation = self.__set_mapped_count(
+                                workflow, 
+                                tier_invocation, 
+                                step_count)
+
+            self.__check_mapped_completions(tier_parameters, tier_invocation)
+
+            i += 1
+
+        return i
+
+    def __is_reducer_associative(self, workflow, reduce_handler_name):
+        reduce_handler = mr.models.kv.handler.get(
+                            workflow, 
+                            reduce_handler_name)
+
+        return reduce_handler.is_associative is True
+
     def __map_to_downstream(self, mapped_step_name, handler_name, 
                             mapped_steps_gen, workflow, invocation, 
                             message_parameters):
@@ -335,55 +571,66 @@ class _StepProcessor(object):
         """
 
         assert invocation.mapped_count is None
-        assert invocation.mapped_waiting is None
 
         mapped_step = mr.models.kv.step.get(workflow, mapped_step_name)
 
-        # This has to be an integer just in case one of the downstream steps 
-        # completes before we finish our accounting, here.
-
-        invocation.mapped_waiting = 0
-        invocation.save()
+        mapped_handler = mr.models.kv.handler.get(
+                            workflow, 
+                            mapped_step.map_handler_name)
 
-        i = 0
-        for (k, v) in mapped_steps_gen:
-            _logger.debug("Queueing mapping (%d) from invocation [%s].",
-                          i, invocation)
+        chunk_size = mapped_step.map_chunk_size or 1
+        chunks_gen = self.__get_chunks_gen(mapped_steps_gen, chunk_size)
 
-            self.__queue_map_step(
-                    mapped_step, 
-                    (k, v), 
-                    message_parameters)
+        pool = gevent.pool.Pool(mr.config.queue.MAP_FANOUT_CONCURRENCY)
 
-            i += 1
+        # If we map to more steps than one reduction should read, and our 
+        # reducer can reduce its own results, reduce them in tiers. We read 
+        # one chunk past the fan-in to find out.
 
-        step_count = i
+        fan_in = mr.config.reduce.TIER_FAN_IN
+        is_tiered = False
 
-        # Now, update the number of mapped steps into the invocation. 
+        if fan_in > 0 and \
+           self.__is_reducer_associative(
+                workflow, 
+                message_parameters.step.reduce_handler_name) is True:
+            head = list(itertools.islice(chunks_gen, fan_in + 1))
+            is_tiered = len(head) > fan_in
+            chunks_gen = itertools.chain(head, chunks_gen)
+
+        if is_tiered is True:
+            step_count = self.__map_tiers(
+                            mapped_step, 
+                            mapped_handler, 
+                            chunks_gen, 
+                            message_parameters, 
+                            pool)
+        else:
+            step_count = self.__map_chunks(
+                            mapped_step, 
+                            mapped_handler, 
+                            chunks_gen, 
+                            message_parameters, 
+                            pool)
+
+        # Now, record the number of mapped steps into the invocation. 
         #
-        # Because we either decrement or add maximum positive value, and the 
-        # value of mapped_waiting will never be glimpsed before decrementing 
-        # it, there won't be any chance of a completed step seeing the 
-        # mappd_waiting value equal zero more than once (which is our trigger 
-        # for a reduction), which will be the very last manipulation it 
-        # counters.
-
-        _logger.debug("Invocation [%s] has mapped (%d) steps.", 
-                      invocation, step_count)
+        # Any number of the downstream steps may have already completed. Each 
+        # completion (and this update) is followed by a check of the barrier, 
+        # so whichever of them happens last will see it complete.
 
-# TODO(dustin): We might need to check for whether a reduction is necessary 
-#               here. By the time we get here, we could've potentially finished 
-#               all steps, which nothing else checking for (0) waiting-steps.
+        _logger.debug("Invocation [%s] has mapped (%d) steps. TIERED=[%s]", 
+                      invocation, step_count, is_tiered)
 
-        invocation = self.__add_mapped_steps(
+        invocation = self.__set_mapped_count(
                         workflow, 
                         invocation, 
                         step_count)
 
-        _logger.debug("Invocation [%s] has had its counts updated: MC=(%d) "
-                      "MW=(%d)", 
-                      invocation, invocation.mapped_count, 
-                      invocation.mapped_waiting)
+        _logger.debug("Invocation [%s] has had its count updated: MC=(%d)", 
+                      invocation, invocation.mapped_count)
+
+        self.__check_mapped_completions(message_parameters, invocation)
 
     def __map_collect_result(self, handler_name, handler_result_gen, workflow, 
                              invocation, message_parameters):
@@ -418,28 +665,36 @@ class _StepProcessor(object):
         _flow_logger.debug("+ Writing POST-COMBINE dataset received from "
                            "mapper to itself: [%s]", invocation)
 
-        dq = mr.models.kv.queues.dataset.DatasetQueue(
-                workflow, 
-                invocation,
-                mr.models.kv.queues.dataset.DT_POST_COMBINE)
-
         if mr.config.IS_DEBUG is True:
             map_result_gen = [(k, list(v)) for (k, v) in map_result_gen]
             _logger.debug("Result to be stored:\n%s", 
                           pprint.pformat(map_result_gen))
 
-        i = 0
-        for (k, value_list) in map_result_gen:
-            data = { 
-                'k': k,
-                'vl': list(value_list),
-            }
+        partition_count = message_parameters.step.reduce_partition_count
 
-            dq.add(data)
-            i += 1
+        if partition_count is not None and partition_count > 1:
+            partitions = self.__store_partitioned_result(
+                            workflow, 
+                            invocation, 
+                            map_result_gen, 
+                            partition_count)
+        else:
+            partitions = []
 
-        _logger.debug("Result-set of size (%d) written for invocation [%s]. "
-                      "Queueing reduction.", i, invocation)
+        if not partitions:
+            dq = mr.models.kv.queues.dataset.DatasetQueue(
+                    workflow, 
+                    invocation,
+                    mr.models.kv.queues.dataset.DT_POST_COMBINE)
+
+            data_gen = ({ 'k': k, 'vl': list(value_list) }
+                        for (k, value_list) 
+                        in map_result_gen)
+
+            i = dq.add_many(data_gen)
+
+            _logger.debug("Result-set of size (%d) written for invocation "
+                          "[%s]. Queueing reduction.", i, invocation)
 
         # We're here because a map operation rendered a result (and did not map 
         # further downstream). It's tempting to want to reduce here, but we'd 
@@ -449,11 +704,75 @@ class _StepProcessor(object):
 
         pusher = _get_pusher()
 
-        # Do a reduction with this invocation as the parent (it will access our 
-        # results).
-        pusher.queue_reduce_step_from_parameters(
-            message_parameters, 
-            invocation)
+        if not partitions:
+            # Do a reduction with this invocation as the parent (it will access 
+            # our results).
+            pusher.queue_reduce_step_from_parameters(
+                message_parameters, 
+                invocation)
+        else:
+            # Reduce each partition in parallel.
+            for partition in partitions:
+                pusher.queue_reduce_step_from_parameters(
+                    message_parameters, 
+                    invocation,
+                    partition=partition)
+
+    def __store_partitioned_result(self, workflow, invocation, map_result_gen, 
+                                   partition_count):
+        """Hash the combined result into partitions by key, and store each to 
+        its own dataset. The result is sorted by partition (which may spill to 
+        disk) so that each dataset can be written in turn, and so that every 
+        partition stays sorted by key. Returns the partitions that received 
+        results, which are also recorded on the invocation.
+        """
+
+        partitioned_gen = mr.external_sort.sort_pairs(
+                            ((mr.models.kv.queues.dataset.get_partition(
+                                k, 
+                                partition_count), k), 
+                             list(value_list))
+                            for (k, value_list) 
+                            in map_result_gen)
+
+        partitions = []
+        for partition, records in itertools.groupby(
+                                    partitioned_gen, 
+                                    lambda x: x[0][0]):
+            dq = mr.models.kv.queues.dataset.DatasetQueue(
+                    workflow, 
+                    invocation,
+                    mr.models.kv.queues.dataset.DT_POST_COMBINE,
+                    partition=partition)
+
+            data_gen = ({ 'k': k, 'vl': value_list }
+                        for ((_, k), value_list) 
+                        in records)
+
+            i = dq.add_many(data_gen)
+
+            _logger.debug("Result-set partition (%d) of size (%d) written for "
+                          "invocation [%s].", partition, i, invocation)
+
+            partitions.append(partition)
+
+        if not partitions:
+            return partitions
+
+        def get_cb():
+            return mr.models.kv.invocation.get(
+                    workflow, 
+                    invocation.invocation_id)
+
+        def set_cb(obj):
+            obj.reduce_partitions = partitions
+
+        mr.models.kv.invocation.Invocation.atomic_update(get_cb, set_cb)
+
+        _logger.debug("Invocation [%s] result was partitioned (%d) ways. "
+                      "Queueing reductions.", invocation, len(partitions))
+
+        return partitions
 
     def handle_map(self, message_parameters):
         """Handle one dequeued map job."""
@@ -571,21 +890,7 @@ class _StepProcessor(object):
 
             raise
 
-    def __decrement_invocation(self, workflow, invocation):
-        def get_cb():
-            obj = mr.models.kv.invocation.get(
-                    workflow, 
-                    invocation.invocation_id)
-
-            return obj
-
-        def set_cb(obj):
-            obj.mapped_waiting -= 1
-
-        obj = mr.models.kv.invocation.Invocation.atomic_update(get_cb, set_cb)
-        return obj
-
-    def __add_mapped_steps(self, workflow, invocation, step_count):
+    def __set_mapped_count(self, workflow, invocation, step_count):
         def get_cb():
             return mr.models.kv.invocation.get(
                     workflow, 
@@ -593,10 +898,57 @@ class _StepProcessor(object):
 
         def set_cb(obj):
             obj.mapped_count = step_count
-            obj.mapped_waiting += step_count
 
         return mr.models.kv.invocation.Invocation.atomic_update(get_cb, set_cb)
 
+    def __check_mapped_completions(self, message_parameters, 
+                                   parent_invocation):
+        """If all of the steps mapped by the given invocation have completed, 
+        queue its reduction. This is called after every change to the barrier 
+        (by the mapper and by each completed step). More than one caller may 
+        see it complete, but only one will claim it.
+        """
+
+        if parent_invocation.mapped_count is None:
+            # The mapper is still queueing steps. It'll check once it's done.
+            _logger.debug("Invocation [%s] is still mapping.", 
+                          parent_invocation)
+
+            return
+
+        ct = mr.models.kv.trees.completions.CompletionsTree(
+                message_parameters.workflow, 
+                parent_invocation)
+
+        completed_count = ct.get_completed_count()
+
+        _logger.debug("Invocation [%s] has (%d) of (%d) mapped steps "
+                      "completed.", 
+                      parent_invocation, completed_count, 
+                      parent_invocation.mapped_count)
+
+        if completed_count < parent_invocation.mapped_count:
+            return
+
+        if ct.claim() is False:
+            _logger.debug("Reduction of invocation [%s] was already claimed.", 
+                          parent_invocation)
+
+            return
+
+        # All mapped steps of the invocation have now been reported.
+
+        _logger.debug("All mapped steps of invocation [%s] have completed, "
+                      "and it will be reduced.", parent_invocation)
+
+        pusher = _get_pusher()
+
+        # Queue a reduction of the invocation. It will access all of the 
+        # results that have been posted back to it.
+        pusher.queue_reduce_step_from_parameters(
+            message_parameters, 
+            parent_invocation)
+
     def handle_reduce(self, message_parameters):
         """Corresponds to steps received with a type of mr.constants.D_REDUCE.
 
@@ -624,7 +976,7 @@ class _StepProcessor(object):
                                 workflow, 
                                 reduce_invocation.parent_invocation_id)
 
-            if map_invocation.mapped_waiting is None:
+            if map_invocation.mapped_count is None:
                 _logger.debug("Processing REDUCE [%s] -of- original MAP "
                               "invocation [%s] that rendered a DATASET.",
                               reduce_invocation, map_invocation)
@@ -697,92 +1049,116 @@ class _StepProcessor(object):
                            "downstream mappings.", 
                            message_parameters.invocation)
 
-        def get_results_gen():
-            """Enumerate all (key, value_list) from all results of all 
-            invocations mapped from this invocation.
+        _logger.debug("Aggregating results of mapping: [%s]", map_invocation)
 
-            Note that, no matter how good the combiner is, if one step maps 
-            into downstream steps than there could very well have duplicate 
-            keys (which is a relatively normal circumstance, but entirely 
-            unavoidable of multidimensional-mappings).
-            """
+        parent_tree = mr.models.kv.trees.relationships.RelationshipsTree(
+                        workflow, 
+                        map_invocation,
+                        mr.models.kv.trees.relationships.RT_MAPPED)
 
-            _logger.debug("Aggregating results of mapping: [%s]", 
-                          map_invocation)
+        ct = mr.models.kv.trees.completions.CompletionsTree(
+                workflow, 
+                map_invocation)
 
-            parent_tree = mr.models.kv.trees.relationships.RelationshipsTree(
-                            workflow, 
-                            map_invocation,
-                            mr.models.kv.trees.relationships.RT_MAPPED)
+        completions = ct.get_completions()
 
-            for mapped_invocation in parent_tree.list_entities():
-                # A relationship of each of the datasets being reduced to the 
-                # invocation that we're pushing it to.
+        # If the results were reduced as they arrived, start with the partial 
+        # reductions (which are sorted), and skip the results that they 
+        # include.
 
-                rt = mr.models.kv.trees.relationships.RelationshipsTree(
-                        workflow, 
-                        mapped_invocation,
-                        mr.models.kv.trees.relationships.RT_REDUCED)
-
-                # Store the reduction's invocation ID.
-                
-                data = {
-                    'ri': message_parameters.invocation.invocation_id,
-                }
-                
-                rt.add_entity(map_invocation, data=data)
+        results_gens = []
+        folded_invocation_ids_s = set()
+        for pr in mr.models.kv.partial_reduction.list_for_invocation(
+                    workflow, 
+                    map_invocation):
+            _logger.debug("Partial reduction [%s] includes (%d) results.", 
+                          pr.shard_name, len(pr.folded_invocation_ids))
 
-                # Yield through the reduction datasets of each of the mappings 
-                # that we branched to.
+            results_gens.append(iter(pr.results))
+            folded_invocation_ids_s.update(pr.folded_invocation_ids)
 
-                _flow_logger.debug("  Reading constituent POST-REDUCE result "
-                                   "under parent [%s] for reducer [%s] from mapper: [%s]", 
-                                   map_invocation, 
-                                   message_parameters.invocation, 
-                                   mapped_invocation)
+        are_all_sorted = True
+        for mapped_invocation in parent_tree.list_entities():
+            # A relationship of each of the datasets being reduced to the 
+            # invocation that we're pushing it to.
 
-                dq = mr.models.kv.queues.dataset.DatasetQueue(
-                        workflow, 
-                        mapped_invocation,
-                        mr.models.kv.queues.dataset.DT_POST_REDUCE)
+            rt = mr.models.kv.trees.relationships.RelationshipsTree(
+                    workflow, 
+                    mapped_invocation,
+                    mr.models.kv.trees.relationships.RT_REDUCED)
 
-                for data in dq.list_data():
-                    yield data
+            # Store the reduction's invocation ID.
+            
+            data = {
+                'ri': message_parameters.invocation.invocation_id,
+            }
+            
+            rt.add_entity(map_invocation, data=data)
 
-        results_gen = get_results_gen()
+            if mapped_invocation.invocation_id in folded_invocation_ids_s:
+                continue
 
-        if mr.config.IS_DEBUG is True:
-            results_gen = list(results_gen)
+            # We'll read through the reduction datasets of each of the 
+            # mappings that we branched to.
 
-            _logger.debug("(%d) results will be reduced by step [%s] for "
-                          "original invocation [%s].",
-                          len(results_gen), step.reduce_handler_name, 
-                          map_invocation)
+            _flow_logger.debug("  Reading constituent POST-REDUCE result "
+                               "under parent [%s] for reducer [%s] from mapper: [%s]", 
+                               map_invocation, 
+                               message_parameters.invocation, 
+                               mapped_invocation)
 
-            print('')
-            for (i, data) in enumerate(results_gen):
-                (k, v) = data['p']
-                print("Result (%d)\nKey: %s\n Value: %s" % 
-                      (i, k, v))
+            # If its dataset was partitioned, each partition was stored 
+            # separately (and, so, sorted separately).
 
-            print('')
+            for dq in mr.models.kv.queues.dataset.get_partitioned(
+                        workflow, 
+                        mapped_invocation,
+                        mr.models.kv.queues.dataset.DT_POST_REDUCE):
+                results_gens.append(data['p'] for data in dq.list_data())
+
+            completion_data = completions.get(
+                                mapped_invocation.invocation_id, 
+                                {})
+
+            if mr.models.kv.trees.completions.is_result_sorted(
+                    completion_data) is False:
+                are_all_sorted = False
+
+        # Now group ("merge") the values for common keys. Note that, no matter 
+        # how good the combiner is, if one step maps into downstream steps 
+        # than there could very well have duplicate keys (which is a 
+        # relatively normal circumstance, but entirely unavoidable of 
+        # multidimensional-mappings).
+        #
+        # If every result was stored sorted, we can stream them through a 
+        # merge. Otherwise, we have to sort them (which will spill to disk 
+        # for large sets). Either way, only one key's values are held at a 
+        # time.
 
-        results_gen = (data['p'] for data in results_gen)
+        if are_all_sorted is True:
+            _logger.debug("Merging (%d) sorted results.", len(results_gens))
 
-        # Now group ("merge") the values for common keys. Since the individual 
-        # reducers and mappers can't be required to yield pairs sorted by key, 
-        # this will have a high [memory] cost for large sets, and requires us 
-        # to run the generators.
+            sorted_results_gen = mr.external_sort.merge_sorted_pairs(
+                                    results_gens)
+        else:
+            _logger.debug("Sorting (%d) results.", len(results_gens))
 
-        grouped_results = {}
-        for (k, v) in results_gen:
-            try:
-                grouped_results[k].append(v)
-            except KeyError:
-                grouped_results[k] = [v]
+            sorted_results_gen = mr.external_sort.sort_pairs(
+                                    itertools.chain(*results_gens))
+
+        grouped_results_gen = ((k, [v for (_, v) in kv_gen])
+                               for (k, kv_gen) 
+                               in itertools.groupby(
+                                    sorted_results_gen, 
+                                    lambda x: x[0]))
+
+        if mr.config.IS_DEBUG is True:
+            grouped_results_gen = list(grouped_results_gen)
 
-        # We're not in Python3, so we have to use <dict>.iteritems().
-        grouped_results_gen = grouped_results.iteritems()
+            _logger.debug("(%d) keys will be reduced by step [%s] for "
+                          "original invocation [%s]:\n%s",
+                          len(grouped_results_gen), step.reduce_handler_name, 
+                          map_invocation, pprint.pformat(grouped_results_gen))
 
         handler_arguments = {
             'results': grouped_results_gen,
@@ -805,18 +1181,10 @@ class _StepProcessor(object):
                           step.reduce_handler_name, map_invocation,
                           pprint.pformat(reduce_result_gen))
 
-        if map_invocation.parent_invocation_id is not None:
-            decrement_invocation = mr.models.kv.invocation.get(
-                                    workflow, 
-                                    map_invocation.parent_invocation_id)
-        else:
-            decrement_invocation = None
-
         self.__store_reduction_result(
             message_parameters,
             reduce_result_gen, 
-            map_invocation,
-            decrement_invocation=decrement_invocation)
+            map_invocation)
 
     def __handle_mapped_dataset_reduce(self, message_parameters, step, 
                                        map_invocation, workflow, request):
@@ -829,12 +1197,16 @@ class _StepProcessor(object):
                            "by mapper: [%s]", 
                            message_parameters.invocation, map_invocation)
 
-        # Establish the dataset that was rendered by the one map.
+        # Establish the dataset that was rendered by the one map (or the one 
+        # partition of it that we're reducing).
+
+        partition = message_parameters.invocation.partition
 
         dq = mr.models.kv.queues.dataset.DatasetQueue(
                 workflow, 
                 map_invocation,
-                mr.models.kv.queues.dataset.DT_POST_COMBINE)
+                mr.models.kv.queues.dataset.DT_POST_COMBINE,
+                partition=partition)
 
         results_gen = dq.list_data()
 
@@ -866,8 +1238,15 @@ class _StepProcessor(object):
         data = {
             'ri': message_parameters.invocation.invocation_id,
         }
-        
-        rt.add_entity(map_invocation, data=data)
+
+        if partition is None:
+            rt.add_entity(map_invocation, data=data)
+        else:
+            # Only the first of the partition reductions is recorded.
+            try:
+                rt.add_entity(map_invocation, data=data)
+            except mr.models.kv.data_layer.KvPreconditionException:
+                pass
 
         results_gen = ((data['k'], data['vl']) for data in results_gen)
 
@@ -895,24 +1274,194 @@ class _StepProcessor(object):
                           step.reduce_handler_name, map_invocation, 
                           pprint.pformat(reduce_result_gen))
 
-        if map_invocation.parent_invocation_id is not None:
-            decrement_invocation = mr.models.kv.invocation.get(
-                                    workflow, 
-                                    map_invocation.parent_invocation_id)
-        else:
-            decrement_invocation = None
-
         self.__store_reduction_result(
             message_parameters,
             reduce_result_gen, 
             map_invocation,
-            decrement_invocation=decrement_invocation)
+            partition=partition)
+
+    def __is_eagerly_reduced(self, workflow, parent_invocation):
+        """Whether results being reported to the given invocation are to be 
+        folded into its partial reductions as they arrive.
+        """
+
+        if mr.config.reduce.IS_EAGER_REDUCTION_ENABLED is False:
+            return False
+
+        parent_step = mr.models.kv.step.get(
+                        workflow, 
+                        parent_invocation.step_name)
+
+        return self.__is_reducer_associative(
+                workflow, 
+                parent_step.reduce_handler_name)
+
+    def __fold_partial_reduction(self, message_parameters, parent_invocation, 
+                                 mapped_invocation, reduce_results):
+        """Reduce the result of one mapped invocation together with one of the 
+        partial reductions of its parent. The final reduction of the parent 
+        will then only have to reduce the partials. If the result can't be 
+        folded, the final reduction will read it like any other.
+        """
+
+        workflow = message_parameters.workflow
+
+        parent_step = mr.models.kv.step.get(
+                        workflow, 
+                        parent_invocation.step_name)
+
+        shard_count = mr.config.reduce.EAGER_REDUCTION_SHARD_COUNT
+        shard_name = str(int(hashlib.sha1(
+                                mapped_invocation.invocation_id).hexdigest(), 
+                             16) % shard_count)
+
+        construction_context = mr.handlers.general.HANDLER_CONTEXT_CLS(
+                                request=message_parameters.request,
+                                invocation=parent_invocation)
+
+        def get_shard():
+            try:
+                return mr.models.kv.partial_reduction.get(
+                        workflow, 
+                        parent_invocation, 
+                        shard_name)
+            except KeyError:
+                return mr.models.kv.partial_reduction.PartialReduction(
+                        shard_name=shard_name,
+                        workflow_name=workflow.workflow_name,
+                        invocation_id=parent_invocation.invocation_id,
+                        folded_invocation_ids=[],
+                        results=[])
+
+        # Our own result is only sorted once, however many attempts it takes.
+        sorted_results = list(mr.external_sort.sort_pairs(reduce_results))
+
+        def fold(shard_results):
+            merged_gen = mr.external_sort.merge_sorted_pairs([
+                            shard_results, 
+                            sorted_results])
+
+            grouped_results_gen = ((k, [v for (_, v) in kv_gen])
+                                   for (k, kv_gen) 
+                                   in itertools.groupby(
+                                        merged_gen, 
+                                        lambda x: x[0]))
+
+            handler_arguments = {
+                'results': grouped_results_gen,
+            }
+
+            reduce_result_gen = self.__call_handler(
+                                    construction_context,
+                                    workflow,
+                                    parent_step.reduce_handler_name, 
+                                    handler_arguments,
+                                    allow_session_writes=False)
+
+            results = list(mr.external_sort.sort_pairs(reduce_result_gen))
+
+            encoded_size = len(mr.models.kv.codecs.encode(
+                                results, 
+                                compression_threshold_bytes=0))
+
+            if encoded_size > mr.config.reduce.EAGER_REDUCTION_MAX_BYTES:
+                raise _PartialReductionTooLargeError(
+                        "Partial reduction [%s] of invocation [%s] would be "
+                        "(%d) bytes." % 
+                        (shard_name, parent_invocation, encoded_size))
+
+            return results
+
+        _logger.debug("Folding result of [%s] into partial reduction [%s] of "
+                      "[%s].", mapped_invocation, shard_name, 
+                      parent_invocation)
+
+        # The reducer isn't run within an atomic-update, since it'd be rerun 
+        # for every conflict. We fold against a snapshot of the shard, and 
+        # only fold again if the shard has changed by the time that we save. 
+        # A shard that keeps changing is left to the final reduction.
+
+        # (state, results)
+        last_fold = None
+
+        i = mr.config.reduce.EAGER_REDUCTION_MAX_FOLD_ATTEMPTS
+        try:
+            while i > 0:
+                pr = get_shard()
+
+                # The message might have been redelivered.
+                if mapped_invocation.invocation_id in \
+                        pr.folded_invocation_ids:
+                    return
+
+                if last_fold is None or last_fold[0] != pr.state_string:
+                    last_fold = (pr.state_string, fold(pr.results))
+
+                pr.results = last_fold[1]
+                pr.folded_invocation_ids.append(
+                    mapped_invocation.invocation_id)
+
+                try:
+                    pr.save(enforce_pristine=True)
+                except mr.models.kv.data_layer.KvPreconditionException:
+                    # The shard was changed (or created) by another step.
+                    _logger.debug("Partial reduction [%s] of [%s] changed "
+                                  "while folding.", shard_name, 
+                                  parent_invocation)
+                else:
+                    return
+
+                i -= 1
+        except _PartialReductionTooLargeError:
+            _logger.warning("Could not fold result of [%s] into partial "
+                            "reduction [%s] of [%s]. It will be reduced "
+                            "with the final reduction.", 
+                            mapped_invocation, shard_name, parent_invocation,
+                            exc_info=True)
+
+            return
+
+        _logger.warning("Partial reduction [%s] of [%s] kept changing. The "
+                        "result of [%s] will be reduced with the final "
+                        "reduction.", shard_name, parent_invocation, 
+                        mapped_invocation)
+
+    def __check_partition_completions(self, message_parameters, 
+                                      partitioned_invocation):
+        """Record the completion of the reduction of one partition of the 
+        given invocation's dataset. Returns True for exactly one caller, once 
+        every partition has been reduced.
+        """
+
+        ct = mr.models.kv.trees.completions.CompletionsTree(
+                message_parameters.workflow, 
+                partitioned_invocation)
+
+        ct.add_completion(message_parameters.invocation)
+
+        partition_count = len(partitioned_invocation.reduce_partitions)
+        completed_count = ct.get_completed_count()
+
+        _logger.debug("Invocation [%s] has (%d) of (%d) partitions reduced.", 
+                      partitioned_invocation, completed_count, 
+                      partition_count)
+
+        if completed_count < partition_count:
+            return False
+
+        if ct.claim() is False:
+            _logger.debug("Completion of partitioned invocation [%s] was "
+                          "already claimed.", partitioned_invocation)
+
+            return False
+
+        return True
 
     def __store_reduction_result(self, message_parameters, reduce_result_gen,
-                                 store_to_invocation, 
-                                 decrement_invocation=None):
+                                 store_to_invocation, partition=None):
         """Store the reduction result. This is code common to both/all kinds of 
-        reduction.
+        reduction. If the result is of one partition, it's only reported 
+        upward once all of the partitions have been stored.
         """
 
         workflow = message_parameters.workflow
@@ -924,67 +1473,89 @@ class _StepProcessor(object):
                       store_to_invocation, store_to_invocation.direction)
 
         _flow_logger.debug("+ Writing POST-REDUCE dataset from [%s] to [%s] "
-                           "and decrementing [%s].",
+                           "and reporting completion to [%s].",
                            message_parameters.invocation, store_to_invocation,
-                           decrement_invocation)
+                           store_to_invocation.parent_invocation_id)
 
         dq = mr.models.kv.queues.dataset.DatasetQueue(
                 workflow, 
                 store_to_invocation,
-                mr.models.kv.queues.dataset.DT_POST_REDUCE)
+                mr.models.kv.queues.dataset.DT_POST_REDUCE,
+                partition=partition)
 
-        i = 0
-        for (k, v) in reduce_result_gen:
-            data = {
-                # Pair
-                'p': (k, v),
-            }
+        # If the parent of the mapping will be reducing this result along with 
+        # the others, store it sorted so that they can be merged.
+        is_result_sorted = \
+            store_to_invocation.parent_invocation_id is not None and \
+            mr.config.sort.IS_REDUCTION_RESULT_SORTED is True
 
-            dq.add(data)
-            i += 1
+        if is_result_sorted is True:
+            reduce_result_gen = mr.external_sort.sort_pairs(reduce_result_gen)
+
+        if store_to_invocation.parent_invocation_id is not None:
+            parent_invocation = mr.models.kv.invocation.get(
+                                    workflow, 
+                                    store_to_invocation.parent_invocation_id)
+
+            # Partial reductions track whole results, not partitions of them.
+            is_folded = partition is None and \
+                        self.__is_eagerly_reduced(workflow, parent_invocation)
+        else:
+            is_folded = False
+
+        if is_folded is True:
+            # We'll need the result twice.
+            reduce_result_gen = list(reduce_result_gen)
+
+        # Pairs.
+        data_gen = ({ 'p': (k, v) } 
+                    for (k, v) 
+                    in reduce_result_gen)
+
+        i = dq.add_many(data_gen)
 
         assert i > 0, "No reduction results to store by [%s] to [%s]." % \
                       (message_parameters.invocation, store_to_invocation)
 
         _logger.debug("We've posted the reduction result to invocation: "
-                      "[%s]", store_to_invocation)
+                      "[%s] PARTITION=[%s]", store_to_invocation, partition)
 
-        if decrement_invocation is not None:
-            _logger.debug("Decrementing invocation: [%s] WAITING=(%d)",
-                          decrement_invocation,
-                          decrement_invocation.mapped_waiting)
+        if partition is not None and \
+           self.__check_partition_completions(
+                message_parameters, 
+                store_to_invocation) is False:
+            return
 
-            # Decrement the "waiting" counter on the parent of the parent 
-            # (the step that mapped the steps that produced the results 
-            # that we're reducing), or notify that the job is done (if 
-            # there is no parent's parent).
+        if store_to_invocation.parent_invocation_id is not None:
+            # Report our completion to the parent of the parent (the step that 
+            # mapped the steps that produced the results that we're reducing), 
+            # or notify that the job is done (if there is no parent's parent).
 
-            decrement_invocation = self.__decrement_invocation(
-                                    workflow, 
-                                    decrement_invocation)
+            if is_folded is True:
+                self.__fold_partial_reduction(
+                    message_parameters, 
+                    parent_invocation, 
+                    store_to_invocation, 
+                    reduce_result_gen)
 
-            if decrement_invocation.mapped_waiting == 0:
-                # We've posted the reduction of the results of our map step 
-                # to its parent, and all mapped steps of that parent have 
-                # now been reported.
+            ct = mr.models.kv.trees.completions.CompletionsTree(
+                    workflow, 
+                    parent_invocation)
 
-                _logger.debug("Invocation [%s] mapped-waiting count has "
-                              "dropped to (0), and will be reduced.", 
-                              decrement_invocation)
+            ct.add_completion(
+                store_to_invocation, 
+                is_result_sorted=is_result_sorted)
 
-                pusher = _get_pusher()
+            # Read the parent again, now that our marker is in place. If its 
+            # mapped-count wasn't recorded yet, the mapper will see our marker 
+            # when it checks.
+            parent_invocation = mr.models.kv.invocation.get(
+                                    workflow, 
+                                    parent_invocation.invocation_id)
 
-                # Queue a reduction with our parent's parent (the parent of 
-                # the original mapping). It will access all of the results 
-                # that have been posted back to it.
-                pusher.queue_reduce_step_from_parameters(
-                    message_parameters, 
-                    decrement_invocation)
-            else:
-                _logger.debug("Invocation [%s] mapped-waiting "
-                              "count after REDUCE: (%d)", 
-                              decrement_invocation,
-                              decrement_invocation.mapped_waiting)
+            self.__check_mapped_completions(
+                message_parameters, 
+                parent_invocation)
         else:
             # We've reduced our way back up to the original request.
 
@@ -1057,12 +1628,16 @@ class _RequestReceiver(object):
         _flow_logger.debug("  Reading POST-REDUCE dataset as final result: "
                            "[%s]", invocation)
 
-        dq = mr.models.kv.queues.dataset.DatasetQueue(
+        dqs = mr.models.kv.queues.dataset.get_partitioned(
                 workflow, 
                 invocation, 
                 mr.models.kv.queues.dataset.DT_POST_REDUCE)
 
-        result_pair_gen = (d['p'] for d in dq.list_data())
+        result_pair_gen = (d['p'] 
+                           for dq 
+                           in dqs 
+                           for d 
+                           in dq.list_data())
 
         if mr.config.IS_DEBUG is True:
             result_pair_gen = list(result_pair_gen)
@@ -1116,12 +1691,11 @@ class _RequestReceiver(object):
                 invocation,
                 mr.models.kv.queues.dataset.DT_ARGUMENTS)
 
-        for (k, v) in arguments:
-            data = {
-                'p': (k, v),
-            }
+        data_gen = ({ 'p': (k, v) } 
+                    for (k, v) 
+                    in arguments)
 
-            dq.add(data)
+        dq.add_many(data_gen)
 
         request = mr.models.kv.request.Request(
                     request_id=None,
@@ -0,0 +1,202 @@
+"""The codecs that values are encoded with before they're stored to the KV.
+Every encoded value starts with a single header character that identifies the
+codec that it was written with, so values written with different codecs can
+live side-by-side. Values without a recognized header were written before
+codecs were introduced, and are decoded as JSON.
+
+Binary payloads are base64-encoded, since the KV only stores text.
+
+A block is several already-encoded values joined into one value, so records 
+that are packed together don't have to be encoded a second time.
+"""
+
+import logging
+import json
+import marshal
+import zlib
+import base64
+
+import mr.config.kv
+
+_logger = logging.getLogger(__name__)
+
+# None of these can start a JSON document.
+HEADER_JSON = 'J'
+HEADER_MARSHAL = 'M'
+HEADER_MSGPACK = 'P'
+HEADER_ZLIB = 'Z'
+HEADER_BLOCK = 'B'
+
+# Encoded values never contain this (JSON escapes it, and everything else is 
+# base64).
+_BLOCK_SEPARATOR = '\n'
+
+_codecs_by_name = {}
+_codecs_by_header = {}
+
+
+class Codec(object):
+    """The base-class of all codecs. A codec only translates the payload; the
+    header is managed by the registry. An encoded payload may not contain a
+    newline, so that encoded values can be packed into blocks.
+    """
+
+    name = None
+    header = None
+
+    def encode(self, data):
+        raise NotImplementedError()
+
+    def decode(self, payload):
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    name = 'json'
+    header = HEADER_JSON
+
+    def encode(self, data):
+        return json.dumps(data)
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class MarshalCodec(Codec):
+    """Much faster than JSON to both encode and decode. Tuples and strings
+    keep their types rather than becoming lists and unicode.
+    """
+
+    name = 'marshal'
+    header = HEADER_MARSHAL
+
+    def encode(self, data):
+        return base64.b64encode(marshal.dumps(data))
+
+    def decode(self, payload):
+        return marshal.loads(base64.b64decode(payload))
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    header = HEADER_MSGPACK
+
+    def __init__(self, msgpack_module):
+        self.__msgpack = msgpack_module
+
+    def encode(self, data):
+        return base64.b64encode(self.__msgpack.packb(data))
+
+    def decode(self, payload):
+        return self.__msgpack.unpackb(base64.b64decode(payload))
+
+
+def register(codec):
+    _logger.debug("Registering codec [%s] with header [%s].",
+                  codec.name, codec.header)
+
+    if len(codec.header) != 1:
+        raise ValueError("Codec header must be one character: [%s]" %
+                         (codec.header,))
+
+    if codec.header in (HEADER_ZLIB, HEADER_BLOCK):
+        raise ValueError("Codec header is reserved: [%s]" % (codec.header,))
+
+    _codecs_by_name[codec.name] = codec
+    _codecs_by_header[codec.header] = codec
+
+def get_codec(name):
+    try:
+        return _codecs_by_name[name]
+    except KeyError:
+        raise ValueError("Codec not registered: [%s]" % (name,))
+
+def encode(data, codec_name=None, compression_threshold_bytes=None):
+    """Encode the given data with the given codec (or the configured one). If
+    the encoded value is larger than the threshold, it'll be compressed.
+    """
+
+    if codec_name is None:
+        codec_name = mr.config.kv.CODEC
+
+    if compression_threshold_bytes is None:
+        compression_threshold_bytes = \
+            mr.config.kv.CODEC_COMPRESSION_THRESHOLD_BYTES
+
+    codec = get_codec(codec_name)
+    encoded = codec.header + codec.encode(data)
+
+    return _compress(encoded, compression_threshold_bytes)
+
+def encode_block(encoded_list, compression_threshold_bytes=None):
+    """Join values that were each encoded (without compression) into one 
+    value. The block as a whole will be compressed if it's larger than the 
+    threshold.
+    """
+
+    if compression_threshold_bytes is None:
+        compression_threshold_bytes = \
+            mr.config.kv.CODEC_COMPRESSION_THRESHOLD_BYTES
+
+    encoded = HEADER_BLOCK + _BLOCK_SEPARATOR.join(encoded_list)
+
+    return _compress(encoded, compression_threshold_bytes)
+
+def _compress(encoded, compression_threshold_bytes):
+    if compression_threshold_bytes > 0 and \
+       len(encoded) > compression_threshold_bytes:
+        encoded = HEADER_ZLIB + base64.b64encode(zlib.compress(encoded))
+
+    return encoded
+
+def _decompress(encoded):
+    if encoded[:1] == HEADER_ZLIB:
+        encoded = zlib.decompress(base64.b64decode(encoded[1:]))
+
+    return encoded
+
+def decode(encoded):
+    """Decode a value that was written with any registered codec (compressed
+    or not), or a value written before codecs were introduced.
+    """
+
+    encoded = _decompress(encoded)
+
+    return _decode_one(encoded)
+
+def decode_many(encoded):
+    """Return a list of the value(s) stored in the given value: the values 
+    of a block, or the one value.
+    """
+
+    encoded = _decompress(encoded)
+
+    if encoded[:1] == HEADER_BLOCK:
+        return [_decode_one(encoded_one)
+                for encoded_one
+                in encoded[1:].split(_BLOCK_SEPARATOR)]
+
+    return [_decode_one(encoded)]
+
+def _decode_one(encoded):
+    header = encoded[:1]
+
+    if header == HEADER_BLOCK:
+        raise ValueError("Value is a block. Use decode_many().")
+
+    try:
+        codec = _codecs_by_header[header]
+    except KeyError:
+        return json.loads(encoded)
+
+    return codec.decode(encoded[1:])
+
+register(JsonCodec())
+register(MarshalCodec())
+
+try:
+    import msgpack
+except ImportError:
+    pass
+else:
+    register(MsgpackCodec(msgpack))
@@ -9,6 +9,8 @@ _logger.setLevel(logging.INFO)
 
 
 class CommonKv(object):
+    __slots__ = ()
+
     @classmethod
     def key_from_identity(cls, parent, identity):
         if issubclass(parent.__class__, tuple) is False:
@@ -1,17 +1,22 @@
 import logging
 import sys
 import os
+import threading
+import time
 
 os.environ['ETCD_GEVENT'] = '1'
 
+import requests.exceptions
 import etcd.client
 import etcd.exceptions
 
+import mr.constants
 import mr.config
 import mr.config.etcd
 import mr.config.cache
 import mr.config.kv
 import mr.models.kv.common
+import mr.utility
 
 logging.getLogger('etcd').setLevel(logging.INFO)
 
@@ -20,6 +25,41 @@ _logger.setLevel(logging.INFO)
 
 _etcd = etcd.client.Client(**mr.config.etcd.CLIENT_CONFIG)
 
+# Children that are directories are buckets of further children, which let us 
+# read a large directory one bounded window at a time. The names of ordered 
+# buckets sort in the order that the buckets were created. None of them may 
+# start with an underscore, since *etcd* hides those from listings.
+_BUCKET_PREFIX = 'b'
+
+_last_bucket_stamp = 0
+_bucket_stamp_lock = threading.Lock()
+
+def make_bucket_name(suffix):
+    return _BUCKET_PREFIX + suffix
+
+def _is_bucket(node, name):
+    # Other subdirectories (e.g. the partitions of a dataset) are separate 
+    # collections.
+    return node.is_directory is True and name.startswith(_BUCKET_PREFIX)
+
+def make_ordered_bucket_name(after_bucket_name=None):
+    """Return a bucket name that sorts after every other name that we've 
+    issued, and after the given name (which may have been issued elsewhere).
+    """
+
+    global _last_bucket_stamp
+
+    with _bucket_stamp_lock:
+        stamp = max(int(time.time() * 1000000), _last_bucket_stamp + 1)
+
+        if after_bucket_name is not None:
+            after_stamp = int(after_bucket_name[len(_BUCKET_PREFIX):])
+            stamp = max(stamp, after_stamp + 1)
+
+        _last_bucket_stamp = stamp
+
+    return make_bucket_name('%020d' % (stamp,))
+
 
 class KvException(Exception):
     pass
@@ -33,6 +73,10 @@ class KvWaitFaultException(KvException):
     pass
 
 
+class KvAtomicUpdateException(KvException):
+    pass
+
+
 class StateCapture(object):
     """This class allows us to persist the current state of a set of models, 
     and to later make sure that a set of models has reached or exceeded the 
@@ -90,39 +134,182 @@ class StateCapture(object):
         return faulted
 
 
+_cache = None
+
+def _get_cache():
+    global _cache
+
+    if _cache is None:
+        _logger.info("Loading KV cache: [%s]", mr.config.cache.CACHE_FQ_CLASS)
+
+        cache_cls = mr.utility.load_cls_from_string(
+                        mr.config.cache.CACHE_FQ_CLASS)
+
+        _cache = cache_cls()
+
+    return _cache
+
+
 class DataLayerKv(mr.models.kv.common.CommonKv):
+    """Our access to the KV. If caching is enabled, every write goes through to 
+    the KV and is then pushed to the cache, and reads are served from the 
+    cache first. The KV's modified-index is stored along with every cached 
+    value, so that compare-and-swap updates against a cached state stay 
+    correct. A cache failure is never fatal: we'll just use the KV.
+    """
+
     def __init__(self, *args, **kwargs):
         super(DataLayerKv, self).__init__(*args, **kwargs)
         
-        module = sys.modules[__name__]
+        if mr.config.kv.IS_CACHED is True:
+            self.__cache = _get_cache()
+        else:
+            self.__cache = None
 
-# TODO(dustin): Finish implementing KV-cache layer.
-#        if mr.config.kv.IS_CACHED is True:
-#            try:
-#                cache = getattr(module, '_cache')
-#            except AttributeError:
-#                cache = mr.config.cache.CACHE_CLS()
-#                setattr(module, '_cache', cache)
+    def __get_cache_key(self, key):
+        return mr.config.cache.KV_KEY_PREFIX + key
+
+    def __cache_get(self, key):
+        """Return a (modified-index, value) tuple from the cache, or raise 
+        KeyError on a miss or a cache failure.
+        """
 
-    def get(self, identity, wait_for_state=None):
+        try:
+            return self.__cache.get_versioned(self.__get_cache_key(key))
+        except KeyError:
+            raise
+        except:
+            _logger.exception("KV cache read failed: [%s]", key)
+            raise KeyError(key)
+
+    def __cache_set(self, key, modified_index, value):
+        # Racing writers (or a listing) might try to store older states after 
+        # newer ones.
+        try:
+            self.__cache.set_if_newer(
+                self.__get_cache_key(key), 
+                modified_index, 
+                value)
+        except:
+            _logger.exception("KV cache write failed: [%s]", key)
+
+            # Make sure that we don't leave an old value behind.
+            self.__cache_delete(key)
+
+    def __cache_set_many(self, items):
+        """Warm the cache with a list of (key, modified-index, value) tuples 
+        that were just read from the KV, in one round-trip.
+        """
+
+        if not items:
+            return
+
+        try:
+            self.__cache.set_many_if_newer(
+                [(self.__get_cache_key(key), modified_index, value)
+                 for (key, modified_index, value) 
+                 in items])
+        except:
+            # Unlike with a write, anything left in the cache is no older than 
+            # it was before we read.
+            _logger.exception("KV cache warming failed for (%d) keys.", 
+                              len(items))
+
+    def __cache_set_tombstone(self, key, modified_index):
+        # A reader that read the value before it was deleted mustn't be able to 
+        # store it again.
+        try:
+            self.__cache.set_tombstone(
+                self.__get_cache_key(key), 
+                modified_index)
+        except:
+            _logger.exception("KV cache tombstone failed: [%s]", key)
+
+            self.__cache_delete(key)
+
+    def __cache_delete(self, key):
+        try:
+            self.__cache.delete(self.__get_cache_key(key))
+        except:
+            _logger.exception("KV cache delete failed: [%s]", key)
+
+    def __get_node(self, key, wait_for_state=None, consistency=None):
+        """Read the node with the given consistency. A local read falls back to 
+        the leader if the member doesn't have the node yet, or if it only has 
+        a state older than wait_for_state.
+        """
+
+        if consistency is None:
+            consistency = mr.config.kv.DEFAULT_READ_CONSISTENCY
+
+        if consistency == mr.constants.RC_LOCAL:
+            try:
+                response = _etcd.node.get(key, force_consistent=False)
+            except KeyError:
+                _logger.debug("Local read missed. Reading from leader: [%s]", 
+                              key)
+            else:
+                if wait_for_state is None or \
+                   response.node.modified_index >= int(wait_for_state):
+                    return response
+
+                _logger.debug("Local read was stale (%d) < (%s). Reading from "
+                              "leader: [%s]", 
+                              response.node.modified_index, wait_for_state, 
+                              key)
+        elif consistency != mr.constants.RC_LINEARIZABLE:
+            raise ValueError("Read consistency not valid: [%s]" % 
+                             (consistency,))
+
+        return _etcd.node.get(key, force_consistent=True)
+
+    def get(self, identity, wait_for_state=None, consistency=None):
         key = self.__class__.flatten_identity(identity)
 
-        # We ignore the wait_for_state parameter because we'll always get the 
-        # most-current result.
-        response = _etcd.node.get(key, force_consistent=True)
+        if self.__cache is not None:
+            try:
+                (modified_index, value) = self.__cache_get(key)
+            except KeyError:
+                pass
+            else:
+                if wait_for_state is None or \
+                   modified_index >= int(wait_for_state):
+                    return (modified_index, value)
+
+        response = self.__get_node(
+                    key, 
+                    wait_for_state=wait_for_state, 
+                    consistency=consistency)
+
+        if self.__cache is not None:
+            self.__cache_set(
+                key, 
+                response.node.modified_index, 
+                response.node.value)
 
         return (
             response.node.modified_index,
             response.node.value
         )
 
-    def exists(self, identity, wait_for_state=None):
+    def exists(self, identity, wait_for_state=None, consistency=None):
         key = self.__class__.flatten_identity(identity)
         
+        if self.__cache is not None:
+            try:
+                (modified_index, value) = self.__cache_get(key)
+            except KeyError:
+                pass
+            else:
+                if wait_for_state is None or \
+                   modified_index >= int(wait_for_state):
+                    return True
+
         try:
-            # We ignore the wait_for_state parameter because we'll always get 
-            # the most-current result.
-            _etcd.node.get(key, force_consistent=True)
+            self.__get_node(
+                key, 
+                wait_for_state=wait_for_state, 
+                consistency=consistency)
         except KeyError:
             return False
         else:
@@ -130,19 +317,37 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
 
     def set(self, identity, encoded_data):
         key = self.__class__.flatten_identity(identity)
-        return _etcd.node.set(key, encoded_data)
+        response = _etcd.node.set(key, encoded_data)
+
+        if self.__cache is not None:
+            self.__cache_set(key, response.node.modified_index, encoded_data)
+
+        return response
 
     def update_only(self, identity, encoded_data, check_against_state=None):
         key = self.__class__.flatten_identity(identity)
 
         try:
-            return _etcd.node.compare_and_swap(
+            response = _etcd.node.compare_and_swap(
                         key, 
                         encoded_data, 
                         prev_exists=True, 
                         current_index=check_against_state)
         except etcd.exceptions.EtcdPreconditionException:
             pass
+        else:
+            if self.__cache is not None:
+                self.__cache_set(
+                    key, 
+                    response.node.modified_index, 
+                    encoded_data)
+
+            return response
+
+        # Whatever state we were comparing against might have come from the 
+        # cache. Drop it so that the caller's refresh will see the real state.
+        if self.__cache is not None:
+            self.__cache_delete(key)
 
         # Re-raising here rather than in the catch above makes for cleaner 
         # logging (no exception-from-exception messages).
@@ -156,6 +361,12 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
         except etcd.exceptions.EtcdPreconditionException:
             pass
         else:
+            if self.__cache is not None:
+                self.__cache_set(
+                    key, 
+                    response.node.created_index, 
+                    encoded_data)
+
             return response.node.created_index
 
         # Re-raising here rather than in the catch above makes for cleaner 
@@ -164,7 +375,19 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
 
     def delete(self, identity):
         key = self.__class__.flatten_identity(identity)
-        return _etcd.node.delete(key)
+
+        try:
+            response = _etcd.node.delete(key)
+        except:
+            if self.__cache is not None:
+                self.__cache_delete(key)
+
+            raise
+
+        if self.__cache is not None:
+            self.__cache_set_tombstone(key, response.node.modified_index)
+
+        return response
 
     def directory_create_only(self, identity):
         key = self.__class__.flatten_identity(identity)
@@ -172,17 +395,59 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
 
     def directory_delete(self, identity):
         key = self.__class__.flatten_identity(identity)
-        return _etcd.directory.delete_recursive(key)
+
+        if self.__cache is None:
+            return _etcd.directory.delete_recursive(key)
+
+        child_keys = list(self.__walk_keys(key))
+
+        try:
+            response = _etcd.directory.delete_recursive(key)
+        except:
+            for child_key in child_keys:
+                self.__cache_delete(child_key)
+
+            raise
+
+        # Only evict once they're gone, or a concurrent read might cache them 
+        # again.
+        for child_key in child_keys:
+            self.__cache_set_tombstone(child_key, response.node.modified_index)
+
+        return response
 
     def directory_exists(self, identity):
         key = self.__class__.flatten_identity(identity)
         _etcd.node.get(key)
 
+    def __get_children(self, root_key):
+        # Always list from the leader. A member has no index that we could 
+        # check to tell whether it has seen every child, so a stale listing 
+        # would silently drop data.
+        response = _etcd.node.get(root_key, force_consistent=True)
+        return response.node.children
+
     def list(self, root_identity):
+        """Enumerate the (name, value) of the immediate children. 
+        Subdirectories are skipped.
+        """
+
         root_key = self.__class__.flatten_identity(root_identity)
 
-        response = _etcd.node.get(root_key)
-        for child in response.node.children:
+        # The membership of the directory always comes from the KV, but we'll 
+        # warm the cache with the children (all at once).
+        children = [child
+                    for child
+                    in self.__get_children(root_key)
+                    if child.is_directory is False]
+
+        if self.__cache is not None:
+            self.__cache_set_many(
+                [(child.key, child.modified_index, child.value)
+                 for child 
+                 in children])
+
+        for child in children:
             # Derive the identity for this child as well (clip the search-key 
             # path-prefix from the child-key).
             yield (child.key[len(root_key) + 1:], child.value)
@@ -195,9 +460,74 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
 #               values, which we don't need at all right here. This needs to be 
 #               an improvement within *etcd*.
 
-        response = _etcd.node.get(root_key)
-        for child in response.node.children:
-            yield child.key[len(root_key) + 1:]
+        for child in self.__get_children(root_key):
+            if child.is_directory is False:
+                yield child.key[len(root_key) + 1:]
+
+    def get_layout(self, root_identity):
+        """Returns a 2-tuple of the number of immediate children that aren't 
+        directories, and the names of the buckets.
+        """
+
+        root_key = self.__class__.flatten_identity(root_identity)
+
+        node_count = 0
+        bucket_names = []
+        for child in self.__get_children(root_key):
+            name = child.key[len(root_key) + 1:]
+
+            if child.is_directory is False:
+                node_count += 1
+            elif _is_bucket(child, name) is True:
+                bucket_names.append(name)
+
+        return (node_count, bucket_names)
+
+    def list_paged(self, root_identity):
+        """Like list(), but the immediate subdirectories that are buckets are 
+        read one at a time, so we only ever hold one bucket's worth of 
+        children. Buckets are read in name-order, after the immediate 
+        children. Children in buckets are named relative to the root (e.g. 
+        "<bucket>/<child>").
+        """
+
+        root_key = self.__class__.flatten_identity(root_identity)
+
+        bucket_names = []
+        children = []
+        for child in self.__get_children(root_key):
+            name = child.key[len(root_key) + 1:]
+
+            if child.is_directory is False:
+                children.append(child)
+            elif _is_bucket(child, name) is True:
+                bucket_names.append(name)
+
+        if self.__cache is not None:
+            self.__cache_set_many(
+                [(child.key, child.modified_index, child.value)
+                 for child 
+                 in children])
+
+        for child in children:
+            yield (child.key[len(root_key) + 1:], child.value)
+
+        # Each bucket is warmed in one go by list().
+        for bucket_name in sorted(bucket_names):
+            for name, value in self.list(root_identity + (bucket_name,)):
+                yield (bucket_name + '/' + name, value)
+
+    def __walk_keys(self, root_key):
+        """Yield the keys of every node under the given directory, reading one 
+        directory at a time.
+        """
+
+        for child in self.__get_children(root_key):
+            if child.is_directory is True:
+                for key in self.__walk_keys(child.key):
+                    yield key
+            else:
+                yield child.key
 
     def wait(self, identity):
         """Wait for a change to exactly one node (not recursive)."""
@@ -209,6 +539,12 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
         except etcd.exceptions.EtcdWaitFaultException:
             pass
         else:
+            if self.__cache is not None:
+                self.__cache_set(
+                    key, 
+                    response.node.modified_index, 
+                    response.node.value)
+
             return (
                 response.node.modified_index,
                 response.node.value
@@ -216,16 +552,47 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
 
         raise KvWaitFaultException()
 
-    def directory_wait(self, identity, recursive=True):
-        """Wait for a change to exactly one node (not recursive)."""
+    def get_current_index(self, identity):
+        """Return the current index of the KV as a whole. Waiting from the 
+        next index won't miss any change that follows this call.
+        """
+
+        key = self.__class__.flatten_identity(identity)
+
+        # The index is only returned as a header. It's also returned with the 
+        # error if the node doesn't exist (yet).
+        try:
+            r = _etcd.node.client.send(
+                    2, 
+                    'get', 
+                    _etcd.node.get_fq_node_path(key), 
+                    parameters={ 'consistent': 'true' }, 
+                    return_raw=True)
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or \
+               e.response.status_code != requests.codes.not_found:
+                raise
+
+            r = e.response
+
+        return int(r.headers['X-Etcd-Index'])
+
+    def directory_wait(self, identity, recursive=True, wait_index=None):
+        """Wait for a change to the directory. If wait_index is given, return 
+        the first change at or after that index, even if it happened before we 
+        started waiting.
+        """
 
         key = self.__class__.flatten_identity(identity)
         
         try:
-            response = _etcd.directory.wait(
-                        key, 
-                        recursive=recursive, 
-                        force_consistent=True)
+            if wait_index is None:
+                response = _etcd.directory.wait(
+                            key, 
+                            recursive=recursive, 
+                            force_consistent=True)
+            else:
+                response = self.__wait_from_index(key, recursive, wait_index)
         except etcd.exceptions.EtcdWaitFaultException:
             pass
         else:
@@ -235,15 +602,52 @@ class DataLayerKv(mr.models.kv.common.CommonKv):
 
         raise KvWaitFaultException()
 
+    def __wait_from_index(self, key, recursive, wait_index):
+        # The client doesn't support waiting from an index.
+
+        parameters = { 
+            'wait': 'true', 
+            'waitIndex': str(wait_index), 
+            'consistent': 'true',
+        }
+
+        if recursive is True:
+            parameters['recursive'] = 'true'
+
+        try:
+            return _etcd.directory.client.send(
+                    2, 
+                    'get', 
+                    _etcd.directory.get_fq_node_path(key), 
+                    parameters=parameters)
+        except (requests.exceptions.ChunkedEncodingError, 
+                etcd.exceptions.EtcdEmptyResponseError):
+            # The wait timed-out.
+            raise etcd.exceptions.EtcdWaitFaultException()
+
 # TODO(dustin): Test and replace our existing implementation with this.
     def atomic_update(self, identity, update_value_cb):
         key = self.__class__.flatten_identity(identity)
-        response = etcd.node.atomic_update(key, update_value_cb)
 
-        return (
-            response.node.modified_index,
-            response.node.value
-        )
+        try:
+            response = _etcd.node.atomic_update(key, update_value_cb)
+        except etcd.exceptions.EtcdAtomicWriteError:
+            pass
+        else:
+            if self.__cache is not None:
+                self.__cache_set(
+                    key, 
+                    response.node.modified_index, 
+                    response.node.value)
+
+            return (
+                response.node.modified_index,
+                response.node.value
+            )
+
+        # Re-raising here rather than in the catch above makes for cleaner 
+        # logging (no exception-from-exception messages).
+        raise KvAtomicUpdateException("Atomic update failed: [%s]" % (key,))
 
 
 class QueueLayerKv(mr.models.kv.common.CommonKv):
@@ -253,6 +657,12 @@ class QueueLayerKv(mr.models.kv.common.CommonKv):
     members will allow random/selective access, and not be removed until 
     explicitly desired. Therefore, the only real difference between a queue and 
     a normal directory, is the guaranteed ordering in the return.
+
+    The first nodes are written directly into the queue's directory. After 
+    that, they're written into a succession of bucket directories, so that the 
+    queue can be read one bucket at a time. An instance continues from wherever 
+    the previous writer stopped, but this assumes that a queue isn't written 
+    by more than one instance at the same time.
     """
 
     def __init__(self, root_identity):
@@ -265,9 +675,68 @@ class QueueLayerKv(mr.models.kv.common.CommonKv):
                       root_identity, root_key)
 
         self.__io = _etcd.inorder.get_inorder(root_key)
+        self.__root_key = root_key
 
         self.__dl = DataLayerKv()
 
+        # The resource that we're currently adding to, and how many nodes it 
+        # has. This is found on the first write.
+        self.__write_io = None
+        self.__write_io_count = 0
+        self.__write_bucket_name = None
+
+    def __get_write_io(self):
+        """Return the in-order resource that the next node should be added to, 
+        starting a new bucket whenever the current one is full.
+        """
+
+        if self.__write_io is None:
+            (self.__write_io, self.__write_io_count) = \
+                self.__load_write_position()
+
+        if self.__write_io_count >= mr.config.kv.QUEUE_BUCKET_MAX_NODES:
+            bucket_name = make_ordered_bucket_name(
+                            after_bucket_name=self.__write_bucket_name)
+
+            bucket_key = self.__root_key + '/' + bucket_name
+
+            _logger.debug("Starting new queue bucket: [%s]", bucket_key)
+
+            self.__write_io = _etcd.inorder.get_inorder(bucket_key)
+            self.__write_io_count = 0
+            self.__write_bucket_name = bucket_name
+
+        self.__write_io_count += 1
+        return self.__write_io
+
+    def __load_write_position(self):
+        """Find the resource that the last node was added to, and how many 
+        nodes it has, so that we continue from wherever the last writer of 
+        this queue stopped.
+        """
+
+        try:
+            (node_count, bucket_names) = self.__dl.get_layout(
+                                            self.__root_identity)
+        except KeyError:
+            return (self.__io, 0)
+
+        if not bucket_names:
+            return (self.__io, node_count)
+
+        bucket_name = max(bucket_names)
+        (node_count, _) = self.__dl.get_layout(
+                            self.__root_identity + (bucket_name,))
+
+        self.__write_bucket_name = bucket_name
+        bucket_key = self.__root_key + '/' + bucket_name
+
+        return (_etcd.inorder.get_inorder(bucket_key), node_count)
+
+    def __get_child_identity(self, key):
+        # Keys of nodes in buckets are qualified with the bucket name.
+        return self.__root_identity + tuple(key.split('/'))
+
     @property
     def root_identity(self):
         return self.__root_identity
@@ -285,33 +754,39 @@ class QueueLayerKv(mr.models.kv.common.CommonKv):
         later.
         """
 
-        r = self.__io.add(encoded_data)
+        io = self.__get_write_io()
+        r = io.add(encoded_data)
 
         # With *etcd*, the name of the queued item is its modified-index.
-        return str(r.node.modified_index)
+        name = str(r.node.modified_index)
+
+        if io is not self.__io:
+            name = r.node.key[len(self.__root_key) + 1:]
+
+        return name
 
     def update(self, key, encoded_data):
         self.__dl.update_only(
-            self.__root_identity + (key,), 
+            self.__get_child_identity(key), 
             encoded_data)
 
     def get(self, key):
-        return self.__dl.get(self.__root_identity + (key,))
+        return self.__dl.get(self.__get_child_identity(key))
 
     def list(self):
-        return self.__dl.list(self.__root_identity)
+        return self.__dl.list_paged(self.__root_identity)
 
     def list_keys(self):
-        return self.__dl.list_keys(self.__root_identity)
+        return (k for (k, d) in self.__dl.list_paged(self.__root_identity))
 
     def list_data(self):
-        return (d for (k, d) in self.__dl.list(self.__root_identity))
+        return (d for (k, d) in self.__dl.list_paged(self.__root_identity))
 
     def delete_key(self, key):
-        self.__io.pop(key)
+        self.__dl.delete(self.__get_child_identity(key))
 
     def delete(self):
-        self.__io.delete()
+        self.__dl.directory_delete(self.__root_identity)
 
     def wait_for_change(self):
         """Wait for a change to exactly one node (not recursive)."""
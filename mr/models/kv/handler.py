@@ -15,6 +15,12 @@ HT_REDUCER = 'reducer'
 
 HANDLER_TYPES = (HT_MAPPER, HT_COMBINER, HT_REDUCER)
 
+# Execution types: where the handler runs.
+EX_INLINE = 'inline'
+EX_PROCESS = 'process'
+
+EXECUTIONS = (EX_INLINE, EX_PROCESS)
+
 _MAPPER_ARGS_S = set(['arguments'])
 _COMBINER_ARGS_S = set(['results'])
 _REDUCER_ARGS_S = set(['results'])
@@ -27,6 +33,7 @@ class ArgumentMarshalError(Exception):
 class Handler(mr.models.kv.model.Model):
     entity_class = mr.constants.ID_HANDLER
     key_field = 'handler_name'
+    is_cached = True
 
     handler_name = mr.models.kv.model.Field()
     workflow_name = mr.models.kv.model.Field()
@@ -43,6 +50,18 @@ class Handler(mr.models.kv.model.Model):
                                                     mr.constants.\
                                                         REQUIRED_CAP_NONE)
 
+    # A reducer can declare that it's associative and commutative (reducing 
+    # its own results along with more values gives the same result), so that 
+    # results can be reduced as they arrive.
+    is_associative = mr.models.kv.model.Field(is_required=False, 
+                                              default_value=False)
+
+    # CPU-bound handlers can be run in a pool of worker processes rather than 
+    # in the process that received the message.
+    execution = mr.models.kv.model.EnumField(EXECUTIONS, 
+                                             is_required=False, 
+                                             default_value=EX_INLINE)
+
     def get_identity(self):
         return (self.workflow_name, self.handler_name)
 
@@ -105,9 +124,10 @@ class Handler(mr.models.kv.model.Model):
 
             yield (name, datum)
 
-def get(workflow, handler_name):
+def get(workflow, handler_name, wait_for_state=None):
     obj = Handler.get_and_build(
             (workflow.workflow_name, handler_name),
-            handler_name)
+            handler_name,
+            wait_for_state=wait_for_state)
 
     return obj
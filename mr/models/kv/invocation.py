@@ -14,13 +14,25 @@ class Invocation(mr.models.kv.model.Model):
     parent_invocation_id = mr.models.kv.model.Field(is_required=False)
     step_name = mr.models.kv.model.Field()
 
-    # The mapper will set this before it yields any downstream steps. Not set 
-    # for other step-types.
+    # The mapper will set this once it has queued all of its downstream steps. 
+    # Not set for other step-types. The downstream steps report their 
+    # completion to a CompletionsTree.
     mapped_count = mr.models.kv.model.Field(is_required=False)
 
-    # This will be assigned at the same time as mapped_count, and decremented 
-    # as downstream children of an invoked step are finished.
-    mapped_waiting = mr.models.kv.model.Field(is_required=False)
+    # Set on the intermediate invocations that group the downstream steps of 
+    # a wide mapping, so that they can be reduced in tiers. These are never 
+    # mapped, themselves.
+    is_reduce_tier = mr.models.kv.model.Field(is_required=False, 
+                                              default_value=False)
+
+    # Set on a mapper that rendered a dataset, if that dataset was hashed into 
+    # partitions. These are the partitions that received results (each is 
+    # reduced by its own invocation, and the reductions report their 
+    # completion to a CompletionsTree).
+    reduce_partitions = mr.models.kv.model.Field(is_required=False)
+
+    # Set on the reductions of partitioned datasets.
+    partition = mr.models.kv.model.Field(is_required=False)
 
     # Contains scalar exception traceback.
     error = mr.models.kv.model.Field(is_required=False)
@@ -30,10 +42,17 @@ class Invocation(mr.models.kv.model.Model):
     def get_identity(self):
         return (self.workflow_name, self.invocation_id)
 
-def get(workflow, invocation_id):
+def get(workflow, invocation_id, wait_for_state=None):
     m = Invocation.get_and_build(
             (workflow.workflow_name, 
              invocation_id), 
-            invocation_id)
+            invocation_id, 
+            wait_for_state=wait_for_state)
 
     return m
+
+def get_many(workflow, invocation_ids):
+    return Invocation.get_many(
+            ((workflow.workflow_name, invocation_id), invocation_id)
+            for invocation_id 
+            in invocation_ids)
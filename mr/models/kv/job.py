@@ -7,6 +7,8 @@ import mr.models.kv.workflow
 class Job(mr.models.kv.model.Model):
     entity_class = mr.constants.ID_JOB
     key_field = 'job_name'
+    is_cached = True
+    read_consistency = mr.constants.RC_LOCAL
 
     job_name = mr.models.kv.model.Field()
     workflow_name = mr.models.kv.model.Field()
@@ -16,7 +18,10 @@ class Job(mr.models.kv.model.Model):
     def get_identity(self):
         return (self.workflow_name, self.job_name)
 
-def get(workflow, job_name):
-    m = Job.get_and_build((workflow.workflow_name, job_name), job_name)
+def get(workflow, job_name, wait_for_state=None):
+    m = Job.get_and_build(
+            (workflow.workflow_name, job_name), 
+            job_name, 
+            wait_for_state=wait_for_state)
 
     return m
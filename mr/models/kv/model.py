@@ -4,12 +4,17 @@ import random
 import hashlib
 import collections
 import datetime
+import threading
+import time
+import itertools
 
+import gevent.pool
 import etcd.exceptions
 
 import mr.constants
 import mr.config.kv
 import mr.models.kv.common
+import mr.models.kv.codecs
 import mr.models.kv.data_layer
 import mr.compat
 
@@ -24,12 +29,17 @@ class ValidationError(Exception):
 
 
 class Field(object):
+    # Used to keep the fields of a model in the order that they're declared.
+    __creation_counter = itertools.count()
+
     def __init__(self, is_required=True, default_value=None, empty_value=None):
 # TODO(dustin): Check the existing field assignments to determine if we need to adjust their default_value or empty_value parameters (if given).
         self.__is_required = is_required
         self.__default_value = default_value
         self.__empty_value = empty_value
 
+        self.__creation_order = next(Field.__creation_counter)
+
     def validate(self, name, value):
         """Raise ValidationError on error."""
 
@@ -46,6 +56,10 @@ class Field(object):
     def default_value(self):
         return self.__default_value
 
+    @property
+    def creation_order(self):
+        return self.__creation_order
+
 # We want to get everything using this as the default (not Field).
 TextField = Field
 
@@ -79,10 +93,157 @@ class TimestampField(Field):
 _dl = mr.models.kv.data_layer.DataLayerKv()
 
 
+class _ModelCache(object):
+    """A process-local, read-through cache of the stored values of models that 
+    almost never change. 
+
+    Every entity-class has a generation number. A watch is kept on the entity-
+    class's directory in the KV, and the generation is incremented whenever 
+    anything in it changes (or whenever we can't be sure that we've seen every 
+    change). An entry is only served if it was read during the current 
+    generation. Since the generation is captured *before* the read, a value 
+    that's read concurrently with a change will never be served.
+    """
+
+    def __init__(self):
+        self.__entries = {}
+        self.__generations = {}
+        self.__watchers = {}
+        self.__lock = threading.Lock()
+
+    def get_generation(self, entity_class):
+        return self.__generations.get(entity_class, 0)
+
+    def get(self, entity_class, key):
+        (generation, stored_at, state, value) = \
+            self.__entries[(entity_class, key)]
+
+        if generation != self.get_generation(entity_class) or \
+           (time.time() - stored_at) > mr.config.kv.MODEL_CACHE_MAX_AGE_S:
+            raise KeyError(key)
+
+        return (state, value)
+
+    def set(self, entity_class, key, generation, state, value):
+        self.__entries[(entity_class, key)] = \
+            (generation, time.time(), state, value)
+
+    def invalidate(self, entity_class, key=None):
+        with self.__lock:
+            if key is not None:
+                self.__entries.pop((entity_class, key), None)
+            else:
+                self.__generations[entity_class] = \
+                    self.get_generation(entity_class) + 1
+
+    def watch(self, entity_class, parent):
+        """Make sure that changes to the entities of the given class are being 
+        watched-for.
+        """
+
+        if entity_class in self.__watchers:
+            return
+
+        with self.__lock:
+            if entity_class in self.__watchers:
+                return
+
+            _logger.debug("Watching for changes to [%s] entities: [%s]", 
+                          entity_class, parent)
+
+            # Nothing can be cached until this returns, so the watch will see 
+            # every change to anything that we cache.
+            wait_index = _dl.get_current_index(parent) + 1
+
+            t = threading.Thread(
+                    target=self.__watch, 
+                    args=(entity_class, parent, wait_index))
+
+            t.daemon = True
+            t.start()
+
+            self.__watchers[entity_class] = t
+
+    def __watch(self, entity_class, parent, wait_index):
+        # We always wait from the index after the last change that we saw, so 
+        # nothing that happens between waits is missed.
+        while 1:
+            try:
+                (modified_index,) = _dl.directory_wait(
+                                        parent, 
+                                        wait_index=wait_index)
+            except mr.models.kv.data_layer.KvWaitFaultException:
+                # The wait timed-out. Nothing has changed.
+                continue
+            except:
+                # The index might have fallen out of the KV's history. We 
+                # can't tell what we missed.
+                _logger.exception("Watch on [%s] entities failed. Entries "
+                                  "will be invalidated.", entity_class)
+
+                time.sleep(mr.config.kv.MODEL_CACHE_WATCH_FAULT_DELAY_S)
+
+                try:
+                    wait_index = _dl.get_current_index(parent) + 1
+                except:
+                    _logger.exception("Could not read the current index for "
+                                      "[%s] entities.", entity_class)
+            else:
+                wait_index = modified_index + 1
+
+            self.invalidate(entity_class)
+
+_model_cache = _ModelCache()
+
+
+class _ModelMeta(type):
+    """Collect the fields of every model once, when the class is defined. The 
+    fields are removed from the class and replaced with slots, so that the 
+    values live directly on the instance.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = []
+        for base in bases:
+            fields.extend(getattr(base, 'fields', ()))
+
+        own_fields = [(k, v) 
+                      for (k, v) 
+                      in namespace.items() 
+                      if issubclass(v.__class__, Field) is True]
+
+        own_fields.sort(key=lambda x: x[1].creation_order)
+
+        for k, v in own_fields:
+            del namespace[k]
+
+        fields.extend(own_fields)
+
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + \
+                                 tuple(k for (k, v) in own_fields)
+
+        namespace['fields'] = tuple(fields)
+        namespace['field_map'] = dict(fields)
+
+        return type.__new__(mcs, name, bases, namespace)
+
+
 class Model(mr.models.kv.common.CommonKv):
+    __metaclass__ = _ModelMeta
+    __slots__ = ('__state', '__is_stored')
+
     entity_class = None
     key_field = None
 
+    # Set to True for models that are rarely changed, to serve them from a 
+    # process-local cache.
+    is_cached = False
+
+    # The read consistency (see mr.constants.READ_CONSISTENCIES) for models 
+    # that are never (or only rarely) changed, and can be read from any 
+    # member. If None, the configured default is used.
+    read_consistency = None
+
     def __init__(self, is_stored=False, *args, **data):
         assert issubclass(is_stored.__class__, bool) is True
 
@@ -111,31 +272,22 @@ class Model(mr.models.kv.common.CommonKv):
 
                 data[cls.key_field] = key
 
-            # Make sure we received all of the fields.
-
-            all_fields = set(self.__get_field_names())
-            actual_fields = set(data.keys())
-
             # Make sure that only valid fields were given.
 
-            invalid_fields = actual_fields - all_fields
+            field_map = cls.field_map
+
+            invalid_fields = [k for k in data.iterkeys() if k not in field_map]
             if invalid_fields:
                 raise ValueError("Invalid fields were given: %s" % (invalid_fields,))
 
-            # Fill-in any missing fields.
-
-            for field_name in (all_fields - actual_fields):
-                data[field_name] = getattr(cls, field_name).default_value
+            # Fill-in any missing fields, and validate.
 
-            # Determine which fields had empty data.
+            for name, field_obj in cls.fields:
+                try:
+                    datum = data[name]
+                except KeyError:
+                    datum = field_obj.default_value
 
-            data_info = [(field_name, 
-                          getattr(cls, field_name), 
-                          data[field_name]) 
-                         for field_name 
-                         in all_fields]
-
-            for name, field_obj, datum in data_info:
                 if field_obj.is_empty(datum) is False:
                     field_obj.validate(name, datum)
                 elif field_obj.is_required:
@@ -156,6 +308,28 @@ class Model(mr.models.kv.common.CommonKv):
 
             raise
 
+    def __load_from_stored_data(self, key, data):
+        """Load data that came from storage. It was validated before it was 
+        stored, so we don't validate it again.
+        """
+
+        cls = self.__class__
+
+        setattr(self, cls.key_field, key)
+
+        for name, field_obj in cls.fields:
+            if name == cls.key_field:
+                continue
+
+            try:
+                datum = data[name]
+            except KeyError:
+                datum = field_obj.default_value
+
+            setattr(self, name, datum)
+
+        self.__is_stored = True
+
     def __str__(self):
         cls = self.__class__
 
@@ -196,22 +370,6 @@ class Model(mr.models.kv.common.CommonKv):
                 indent=4, 
                 separators=(',', ': '))
 
-    def __get_required_field_names(self):
-        cls = self.__class__
-
-        for field_name in self.__get_field_names():
-            if getattr(cls, field_name).is_required is True:
-                yield field_name
-
-    def __get_field_names(self):
-        cls = self.__class__
-
-        # We use None so we don't error with the private attributes.
-
-        for attr in dir(self):
-            if issubclass(getattr(cls, attr, None).__class__, Field):
-                yield attr
-
     def get_data(self):
         """Return a dictionary of data. If the value is considered to be
         "empty" by the particular field-type, then coalesce it to whatever the 
@@ -220,19 +378,18 @@ class Model(mr.models.kv.common.CommonKv):
 
         cls = self.__class__
 
-        data = []
-        for k in self.__get_field_names():
+        data = {}
+        for k, field_obj in cls.fields:
             if k == cls.key_field:
                 continue
 
             datum = getattr(self, k)
-            field_obj = getattr(cls, k)
-            if getattr(cls, k).is_empty(datum) is True:
+            if field_obj.is_empty(datum) is True:
                 datum = field_obj.default_value
 
-            data.append((k, datum))
+            data[k] = datum
 
-        return dict(data)
+        return data
 
     def get_key(self):
         cls = self.__class__
@@ -329,10 +486,14 @@ class Model(mr.models.kv.common.CommonKv):
         _logger.debug("Refreshing entity with identity and key: [%s] [%s]", 
                       identity, key)
 
-        (attributes, data) = cls.__get_entity(identity)
-        data[cls.key_field] = key
+        # Always go to the leader. We're probably refreshing because we know 
+        # that it changed.
+        (attributes, data) = cls.__get_entity(
+                                identity, 
+                                is_cache_allowed=False, 
+                                consistency=mr.constants.RC_LINEARIZABLE)
 
-        self.__load_from_data(data, is_stored=True)
+        self.__load_from_stored_data(key, data)
         self.__class__.__apply_attributes(self, attributes)
 
     @property
@@ -348,8 +509,11 @@ class Model(mr.models.kv.common.CommonKv):
 
     @classmethod
     def __build_from_stored_data(cls, key, data):
-        data[cls.key_field] = key
-        return cls(is_stored=True, **data)
+        obj = cls.__new__(cls)
+        obj.__state = None
+        obj.__load_from_stored_data(key, data)
+
+        return obj
 
     @classmethod
     def __apply_attributes(cls, obj, attributes):
@@ -357,15 +521,70 @@ class Model(mr.models.kv.common.CommonKv):
         # None value, and might potentially be confusing.
         obj.__state = attributes['state']
 
+    def get_snapshot(self):
+        """Returns the key, data, and state of the entity as it was last 
+        loaded or saved, so that it can be rebuilt elsewhere without a read. 
+        Returns None if the entity hasn't been loaded or saved.
+        """
+
+        if self.__state is None:
+            return None
+
+        return (self.get_key(), self.get_data(), self.__state)
+
+    @classmethod
+    def build_from_snapshot(cls, snapshot):
+        """Rebuild an entity from the result of get_snapshot()."""
+
+        (key, data, state) = snapshot
+
+        obj = cls.__build_from_stored_data(key, data)
+
+        attributes = {
+            'state': state,
+        }
+
+        cls.__apply_attributes(obj, attributes)
+
+        return obj
+
     @classmethod
-    def get_and_build(cls, identity, key):
-        (attributes, data) = cls.__get_entity(identity)
+    def get_and_build(cls, identity, key, consistency=None, 
+                      wait_for_state=None):
+        """Load the entity. The consistency overrides the model's 
+        read-consistency for this one read. If wait_for_state is given, a 
+        state older than it won't be accepted from the cache or from a local 
+        read.
+        """
+
+        (attributes, data) = cls.__get_entity(
+                                identity, 
+                                consistency=consistency,
+                                wait_for_state=wait_for_state)
 
         obj = cls.__build_from_stored_data(key, data)
         cls.__apply_attributes(obj, attributes)
 
         return obj
 
+    @classmethod
+    def get_many(cls, identities_and_keys, consistency=None, 
+                 concurrency=None):
+        """Load many entities with concurrent reads. Takes (identity, key) 
+        tuples (as would be passed to get_and_build()), and yields the models 
+        in the same order.
+        """
+
+        if concurrency is None:
+            concurrency = mr.config.kv.GET_MANY_CONCURRENCY
+
+        def get_and_build(identity_and_key):
+            (identity, key) = identity_and_key
+            return cls.get_and_build(identity, key, consistency=consistency)
+
+        pool = gevent.pool.Pool(concurrency)
+        return pool.imap(get_and_build, identities_and_keys)
+
     @classmethod
     def __create_entity(cls, identity, data={}):
         parent = mr.config.kv.ENTITY_ROOT + (cls.entity_class,)
@@ -418,27 +637,76 @@ class Model(mr.models.kv.common.CommonKv):
         cls.__delete(parent, identity)
 
     @classmethod
-    def __get_entity(cls, identity):
+    def __get_entity(cls, identity, is_cache_allowed=True, consistency=None, 
+                     wait_for_state=None):
         parent = mr.config.kv.ENTITY_ROOT + (cls.entity_class,)
 
         _logger.debug("Getting [%s] entity with parent [%s]: [%s]", 
                       cls.entity_class, parent, identity)
 
-        return cls.__get_encoded(parent, identity)
+        return cls.__get_encoded(
+                parent, 
+                identity, 
+                is_cache_allowed=is_cache_allowed,
+                consistency=consistency,
+                wait_for_state=wait_for_state)
 
     @classmethod
-    def __get_encoded(cls, parent, identity):
+    def __get_encoded(cls, parent, identity, is_cache_allowed=True, 
+                      consistency=None, wait_for_state=None):
         key = cls.key_from_identity(parent, identity)
-        
-        (state, value) = _dl.get(key)
+
+        if consistency is None:
+            consistency = cls.read_consistency
+
+        if is_cache_allowed is True and \
+           cls.is_cached is True and \
+           mr.config.kv.IS_MODEL_CACHED is True:
+            (state, value) = cls.__get_cached(
+                                parent, 
+                                key, 
+                                consistency, 
+                                wait_for_state)
+        else:
+            (state, value) = _dl.get(
+                                key, 
+                                wait_for_state=wait_for_state, 
+                                consistency=consistency)
 
         return (
             {
                 'state': str(state), 
             },
-            mr.config.kv.DECODER(value)
+            mr.models.kv.codecs.decode(value)
         )
 
+    @classmethod
+    def __get_cached(cls, parent, key, consistency, wait_for_state):
+        try:
+            (state, value) = _model_cache.get(cls.entity_class, key)
+        except KeyError:
+            pass
+        else:
+            if wait_for_state is None or int(state) >= int(wait_for_state):
+                return (state, value)
+
+        _model_cache.watch(cls.entity_class, parent)
+
+        generation = _model_cache.get_generation(cls.entity_class)
+        (state, value) = _dl.get(
+                            key, 
+                            wait_for_state=wait_for_state, 
+                            consistency=consistency)
+
+        _model_cache.set(cls.entity_class, key, generation, state, value)
+
+        return (state, value)
+
+    @classmethod
+    def __invalidate_cached(cls, key):
+        if cls.is_cached is True:
+            _model_cache.invalidate(cls.entity_class, key)
+
     def wait_for_change(self):
         cls = self.__class__
 
@@ -466,7 +734,7 @@ class Model(mr.models.kv.common.CommonKv):
             {
                 'state': str(state), 
             },
-            mr.config.kv.DECODER(value)
+            mr.models.kv.codecs.decode(value)
         )
 
     @classmethod
@@ -474,20 +742,31 @@ class Model(mr.models.kv.common.CommonKv):
                               check_against_state=None):
         key = cls.key_from_identity(parent, identity)
 
-        return _dl.update_only(
-                key, 
-                mr.config.kv.ENCODER(value), 
-                check_against_state=check_against_state)
+        try:
+            return _dl.update_only(
+                    key, 
+                    mr.models.kv.codecs.encode(value), 
+                    check_against_state=check_against_state)
+        finally:
+            cls.__invalidate_cached(key)
 
     @classmethod
     def __create_only_encoded(cls, parent, identity, value):
         key = cls.key_from_identity(parent, identity)
-        return _dl.create_only(key, mr.config.kv.ENCODER(value))
+
+        try:
+            return _dl.create_only(key, mr.models.kv.codecs.encode(value))
+        finally:
+            cls.__invalidate_cached(key)
 
     @classmethod
     def __delete(cls, parent, identity):
         key = cls.key_from_identity(parent, identity)
-        return _dl.delete(key)
+
+        try:
+            return _dl.delete(key)
+        finally:
+            cls.__invalidate_cached(key)
 
     @classmethod
     def list(cls, *args):
@@ -506,7 +785,7 @@ class Model(mr.models.kv.common.CommonKv):
         for name, data in _dl.list(key):
             # Don't just decode the data, but derive the identity for this 
             # child as well (clip the search-key path-prefix from the child-key).
-            yield (name, mr.config.kv.DECODER(data))
+            yield (name, mr.models.kv.codecs.decode(data))
 
     @classmethod
     def list_children(cls, *args):
@@ -0,0 +1,43 @@
+import mr.constants
+import mr.models.kv.model
+
+
+class PartialReduction(mr.models.kv.model.Model):
+    """One shard of the running reduction of the results of the steps mapped by 
+    one invocation. Only used for associative reducers.
+    """
+
+    entity_class = mr.constants.ID_PARTIAL_REDUCTION
+    key_field = 'shard_name'
+
+    shard_name = mr.models.kv.model.Field()
+    workflow_name = mr.models.kv.model.Field()
+
+    # The mapping invocation whose children are being reduced.
+    invocation_id = mr.models.kv.model.Field()
+
+    # The mapped invocations whose results have been folded-in.
+    folded_invocation_ids = mr.models.kv.model.Field()
+
+    # The reduced (key, value) pairs, sorted by key.
+    results = mr.models.kv.model.Field()
+
+    def get_identity(self):
+        return (self.workflow_name, self.invocation_id, self.shard_name)
+
+def get(workflow, invocation, shard_name):
+    m = PartialReduction.get_and_build(
+            (workflow.workflow_name, 
+             invocation.invocation_id, 
+             shard_name), 
+            shard_name)
+
+    return m
+
+def list_for_invocation(workflow, invocation):
+    try:
+        return list(PartialReduction.list(
+                        workflow.workflow_name, 
+                        invocation.invocation_id))
+    except KeyError:
+        return []
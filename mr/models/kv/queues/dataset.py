@@ -1,4 +1,6 @@
 import logging
+import json
+import hashlib
 
 import mr.models.kv.queues.queue
 
@@ -11,19 +13,29 @@ DT_POST_REDUCE = 'post_reduce'
 
 _DATASET_TYPES = (DT_ARGUMENTS, DT_POST_COMBINE, DT_POST_REDUCE)
 
+# The types that can be hashed into partitions (by key).
+_PARTITIONED_DATASET_TYPES = (DT_POST_COMBINE, DT_POST_REDUCE)
+
 
 class DatasetQueue(mr.models.kv.queues.queue.Queue):
     queue_class = 'dataset'
 
-    def __init__(self, workflow, invocation, dataset_type, *args, **kwargs):
+    def __init__(self, workflow, invocation, dataset_type, partition=None, 
+                 *args, **kwargs):
         assert dataset_type in _DATASET_TYPES
+        assert partition is None or \
+               dataset_type in _PARTITIONED_DATASET_TYPES
 
         self.__workflow = workflow
         self.__invocation = invocation
         self.__dataset_type = dataset_type
+        self.__partition = partition
 
         log_key = ('%s-%s' % (str(invocation), self.__dataset_type))
 
+        if partition is not None:
+            log_key += ('-%d' % (partition,))
+
         super(DatasetQueue, self).__init__(
             *args, 
             log_key=log_key, 
@@ -34,13 +46,42 @@ class DatasetQueue(mr.models.kv.queues.queue.Queue):
         contains the children.
         """
 
-        return (self.__class__.queue_class, 
-                self.__workflow.workflow_name, 
-                self.__invocation.invocation_id,
-                self.__dataset_type)
+        identity = (self.__class__.queue_class, 
+                    self.__workflow.workflow_name, 
+                    self.__invocation.invocation_id,
+                    self.__dataset_type)
+
+        # The partitions are stored under the unpartitioned dataset, so that 
+        # they're removed along with it.
+        if self.__partition is not None:
+            identity += (str(self.__partition),)
+
+        return identity
 
     def __write_debug(self, message):
         if mr.config.IS_DEBUG is True:
             _logger.debug("QUEUE(%s): %s", self.__get_root_identity(), message)        
 
 
+
+def get_partition(key, partition_count):
+    """Returns the partition that the given key hashes into. This has to be 
+    the same on every worker, so we can't use hash().
+    """
+
+    digest = hashlib.sha1(json.dumps(key)).hexdigest()
+    return int(int(digest, 16) % partition_count)
+
+def get_partitioned(workflow, invocation, dataset_type):
+    """Returns the datasets that together hold the given dataset of the given 
+    invocation: one for each of its partitions, if its results were 
+    partitioned.
+    """
+
+    if dataset_type not in _PARTITIONED_DATASET_TYPES or \
+       invocation.reduce_partitions is None:
+        return [DatasetQueue(workflow, invocation, dataset_type)]
+
+    return [DatasetQueue(workflow, invocation, dataset_type, partition=p)
+            for p 
+            in invocation.reduce_partitions]
@@ -2,11 +2,15 @@ import logging
 
 import mr.config
 import mr.config.kv
+import mr.models.kv.codecs
 import mr.models.kv.data_layer
 
 _logger = logging.getLogger(__name__)
 _logger.setLevel(logging.INFO)
 
+# Separates the key of a block from the position of a record within it.
+_RECORD_SEPARATOR = '#'
+
 
 class Queue(mr.models.kv.data_layer.QueueLayerKv):
     queue_class = None
@@ -71,9 +75,64 @@ class Queue(mr.models.kv.data_layer.QueueLayerKv):
     def add(self, data):
         self.__write_log("add: %s", data)
 
-        encoded_data = mr.config.kv.ENCODER(data)
+        encoded_data = mr.models.kv.codecs.encode(data)
+        return super(Queue, self).add(encoded_data)
+
+    def add_many(self, data_gen, max_records=None, max_bytes=None):
+        """Pack the given records into blocks, and store each block as one 
+        node. The records will be enumerated in the same order by list_data(). 
+        Returns the number of records written.
+        """
+
+        self.__write_log("add_many")
+
+        if max_records is None:
+            max_records = mr.config.kv.QUEUE_BLOCK_MAX_RECORDS
+
+        if max_bytes is None:
+            max_bytes = mr.config.kv.QUEUE_BLOCK_MAX_BYTES
+
+        # Each record is encoded once, and the encoded records are joined 
+        # into the block.
+        block = []
+        block_bytes = 0
+        i = 0
+        for data in data_gen:
+            encoded_data = mr.models.kv.codecs.encode(
+                            data, 
+                            compression_threshold_bytes=0)
+
+            block.append(encoded_data)
+            block_bytes += len(encoded_data)
+            i += 1
+
+            if len(block) >= max_records or block_bytes >= max_bytes:
+                self.__add_block(block)
+
+                block = []
+                block_bytes = 0
+
+        if block:
+            self.__add_block(block)
+
+        return i
+
+    def __add_block(self, block):
+        encoded_data = mr.models.kv.codecs.encode_block(block)
         return super(Queue, self).add(encoded_data)
 
+    def __get_record_keys(self, key, count):
+        """Records in a block are addressed by the key of the block and their 
+        position in it.
+        """
+
+        if count == 1:
+            return [key]
+
+        return [('%s%s%d' % (key, _RECORD_SEPARATOR, j)) 
+                for j 
+                in xrange(count)]
+
     def add_entity(self, entity):
         self.__write_log("add_entity: %s", entity)
 
@@ -83,14 +142,24 @@ class Queue(mr.models.kv.data_layer.QueueLayerKv):
     def get(self, key):
         self.__write_log("get: %s", key)
 
-        (state, encoded_data) = super(Queue, self).get(key)
-        return mr.config.kv.DECODER(encoded_data)
+        (node_key, _, position) = key.partition(_RECORD_SEPARATOR)
+
+        (state, encoded_data) = super(Queue, self).get(node_key)
+        records = mr.models.kv.codecs.decode_many(encoded_data)
+
+        if position == '':
+            if len(records) != 1:
+                raise ValueError("Key refers to a block of (%d) records: [%s]" % 
+                                 (len(records), key))
+
+            return records[0]
+
+        return records[int(position)]
 
     def get_entity(self, key):
         self.__write_log("get_entity: %s", key)
 
-        encoded_data = self.get(key)
-        data = mr.config.kv.DECODER(encoded_data)
+        data = self.get(key)
         return self.get_entity_from_data(data)
 
     def list_data(self, head_count=None):
@@ -98,41 +167,43 @@ class Queue(mr.models.kv.data_layer.QueueLayerKv):
 
         self.__write_log("list_data")
 
-# TODO(dustin): We'll have to use paging as implemented by *etcd* when, er, implement it.
+        # The nodes are read a bucket at a time.
         i = 0
         for encoded_data in super(Queue, self).list_data():
-            if head_count is not None and i >= head_count:
-                break
+            for data in mr.models.kv.codecs.decode_many(encoded_data):
+                if head_count is not None and i >= head_count:
+                    return
 
-            yield mr.config.kv.DECODER(encoded_data)
-            i += 1
+                yield data
+                i += 1
 
     def list_keys_with_data(self, head_count=None):
         """Used if data was stored to the entry."""
 
         self.__write_log("list_keys_with_data")
 
-# TODO(dustin): We'll have to use paging as implemented by *etcd* when, er, implement it.
         i = 0
         for key, encoded_data in super(Queue, self).list():
-            if head_count is not None and i >= head_count:
-                break
+            records = mr.models.kv.codecs.decode_many(encoded_data)
+            record_keys = self.__get_record_keys(key, len(records))
 
-            yield (key, mr.config.kv.DECODER(encoded_data))
-            i += 1
+            for record_key, data in zip(record_keys, records):
+                if head_count is not None and i >= head_count:
+                    return
+
+                yield (record_key, data)
+                i += 1
 
     def list_entities(self, head_count=None):
         """Used if an entity was encoded and stored as the data."""
 
         self.__write_log("list_entities")
 
-# TODO(dustin): We'll have to use paging as implemented by *etcd* when, er, implement it.
         i = 0
-        for encoded_data in self.list_data():
+        for data in self.list_data():
             if head_count is not None and i >= head_count:
                 break
 
-            data = mr.config.kv.DECODER(encoded_data)
             yield self.get_entity_from_data(data)
             i += 1
 
@@ -141,12 +212,10 @@ class Queue(mr.models.kv.data_layer.QueueLayerKv):
 
         self.__write_log("list_keys_with_entities")
 
-# TODO(dustin): We'll have to use paging as implemented by *etcd* when, er, implement it.
         i = 0
-        for key, encoded_data in self.list():
+        for key, data in self.list_keys_with_data():
             if head_count is not None and i >= head_count:
                 break
 
-            data = mr.config.kv.DECODER(encoded_data)
             yield (key, self.get_entity_from_data(data))
             i += 1
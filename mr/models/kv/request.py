@@ -23,7 +23,10 @@ class Request(mr.models.kv.model.Model):
     def get_identity(self):
         return (self.workflow_name, self.request_id)
 
-def get(workflow, request_id):
-    m = Request.get_and_build((workflow.workflow_name, request_id), request_id)
+def get(workflow, request_id, wait_for_state=None):
+    m = Request.get_and_build(
+            (workflow.workflow_name, request_id), 
+            request_id, 
+            wait_for_state=wait_for_state)
 
     return m
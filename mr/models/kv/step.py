@@ -8,6 +8,8 @@ import mr.models.kv.workflow
 class Step(mr.models.kv.model.Model):
     entity_class = mr.constants.ID_STEP
     key_field = 'step_name'
+    is_cached = True
+    read_consistency = mr.constants.RC_LOCAL
 
     step_name = mr.models.kv.model.Field()
     workflow_name = mr.models.kv.model.Field()
@@ -17,6 +19,15 @@ class Step(mr.models.kv.model.Model):
     combine_handler_name = mr.models.kv.model.Field(is_required=False)
     reduce_handler_name = mr.models.kv.model.Field()
 
+    # The number of consecutive pairs mapped to this step that are passed to 
+    # one invocation of it. If not set, every pair gets its own invocation.
+    map_chunk_size = mr.models.kv.model.Field(is_required=False)
+
+    # The number of partitions that the results of this step's mappers are 
+    # hashed into (by key), each of which is reduced by its own invocation. If 
+    # not set, all of a mapper's results are reduced by one invocation.
+    reduce_partition_count = mr.models.kv.model.Field(is_required=False)
+
     def presave(self):
 
         # We leave it as an exercise to whomever modifies us, to test that
@@ -27,10 +38,22 @@ class Step(mr.models.kv.model.Model):
                 self.combine_handler_name != \
                  self.reduce_handler_name
 
+        assert self.map_chunk_size is None or \
+               (issubclass(self.map_chunk_size.__class__, (int, long)) and \
+                self.map_chunk_size > 0)
+
+        assert self.reduce_partition_count is None or \
+               (issubclass(self.reduce_partition_count.__class__, 
+                           (int, long)) and \
+                self.reduce_partition_count > 0)
+
     def get_identity(self):
         return (self.workflow_name, self.step_name)
 
-def get(workflow, step_name):
-    m = Step.get_and_build((workflow.workflow_name, step_name), step_name)
+def get(workflow, step_name, wait_for_state=None):
+    m = Step.get_and_build(
+            (workflow.workflow_name, step_name), 
+            step_name, 
+            wait_for_state=wait_for_state)
 
     return m
@@ -0,0 +1,185 @@
+import logging
+import hashlib
+
+import mr.config.kv
+import mr.models.kv.trees.tree
+import mr.models.kv.invocation
+import mr.models.kv.data_layer
+import mr.models.kv.codecs
+
+_logger = logging.getLogger(__name__)
+_logger.setLevel(logging.INFO)
+
+# The child that's created by whoever is allowed to queue the reduction.
+# Invocation IDs are hex, so this will never collide with one.
+_CLAIM_NAME = '_claim'
+
+# The directory of the counters that the completions are counted with, so that 
+# checking the barrier doesn't require listing them. It's hidden from the 
+# listing of the completions.
+_COUNTS_NAME = '_counts'
+
+_dl = mr.models.kv.data_layer.DataLayerKv()
+
+
+class CompletionsTree(mr.models.kv.trees.tree.Tree):
+    """A completion barrier for the steps mapped by one invocation. Each mapped
+    step adds its own marker, so that a redelivered completion is only counted 
+    once, and then increments one of several counters (chosen by the step), so 
+    that the completions don't all compete to update one node. The barrier is 
+    checked by reading all of the counters at once.
+    """
+
+    tree_class = 'completions'
+    bucket_name_length = mr.config.kv.INVOCATION_TREE_BUCKET_NAME_LENGTH
+
+    def __init__(self, workflow, map_invocation):
+        assert issubclass(
+                map_invocation.__class__,
+                mr.models.kv.invocation.Invocation)
+
+        self.__workflow = workflow
+        self.__map_invocation = map_invocation
+
+    def get_root_tree_identity(self):
+        """Returns a complete tuple that'll be flattened to the path that
+        contains the children.
+        """
+
+        return (self.__class__.tree_class,
+                self.__workflow.workflow_name,
+                self.__map_invocation.invocation_id)
+
+    def get_child_model_entity(self, invocation_id):
+        """Returns the model object for the given child."""
+
+        return mr.models.kv.invocation.get(self.__workflow, invocation_id)
+
+    def get_name_from_child_entity(self, invocation):
+        """Derive the name/key from the given entity, with which to represent
+        the child.
+        """
+
+        return invocation.invocation_id
+
+    def add_completion(self, invocation, is_result_sorted=False):
+        """Mark the given mapped invocation as complete, noting whether its
+        POST-REDUCE result was stored sorted by key. Returns False if it was
+        already marked (the message was redelivered).
+        """
+
+        data = {
+            'rs': is_result_sorted,
+        }
+
+        try:
+            self.add_entity(invocation, data=data)
+        except mr.models.kv.data_layer.KvPreconditionException:
+            _logger.warning("Completion was already recorded: [%s] => [%s]",
+                            invocation, self.__map_invocation)
+
+            # We might have died between recording the completion and counting 
+            # it. This is rare, so it's alright to list.
+            self.__recount(invocation)
+
+            return False
+
+        self.__increment_count(invocation)
+
+        return True
+
+    def __get_count_shard(self, name):
+        hash_ = hashlib.sha1(name).hexdigest()
+        return int(hash_[:8], 16) % mr.config.kv.COMPLETION_COUNT_SHARDS
+
+    def __get_count_identity(self, shard):
+        return self.get_root_identity() + (_COUNTS_NAME, str(shard))
+
+    def __update_count(self, shard, update_count_cb, initial_count):
+        identity = self.__get_count_identity(shard)
+
+        try:
+            _dl.create_only(
+                identity, 
+                mr.models.kv.codecs.encode(initial_count))
+        except mr.models.kv.data_layer.KvPreconditionException:
+            pass
+        else:
+            return
+
+        def update_value_cb(encoded_count):
+            count = mr.models.kv.codecs.decode(encoded_count)
+            return mr.models.kv.codecs.encode(update_count_cb(count))
+
+        # An update only fails because another completion on the same counter 
+        # was counted in the meantime, so we'll always get through.
+        while 1:
+            try:
+                _dl.atomic_update(identity, update_value_cb)
+            except mr.models.kv.data_layer.KvAtomicUpdateException:
+                _logger.debug("Completion counter (%d) of [%s] is busy. "
+                              "Retrying.", shard, self.__map_invocation)
+            else:
+                break
+
+    def __increment_count(self, invocation):
+        shard = self.__get_count_shard(invocation.invocation_id)
+        self.__update_count(shard, lambda count: count + 1, 1)
+
+    def __recount(self, invocation):
+        # Only the counter that this completion would've incremented.
+        shard = self.__get_count_shard(invocation.invocation_id)
+
+        listed_count = sum(1
+                           for name
+                           in self.list_keys()
+                           if name != _CLAIM_NAME and
+                              self.__get_count_shard(name) == shard)
+
+        self.__update_count(
+            shard, 
+            lambda count: max(count, listed_count), 
+            listed_count)
+
+    def get_completions(self):
+        """Returns a dictionary of invocation-IDs to the data recorded with
+        their completions.
+        """
+
+        try:
+            return dict((name, data)
+                        for (name, data)
+                        in self.list()
+                        if name != _CLAIM_NAME)
+        except KeyError:
+            return {}
+
+    def get_completed_count(self):
+        # The counters are read together (from the leader, since a member 
+        # that's behind would give us a count that might never reach the 
+        # mapped-count).
+        identity = self.get_root_identity() + (_COUNTS_NAME,)
+
+        try:
+            return sum(mr.models.kv.codecs.decode(encoded_count)
+                       for (name, encoded_count)
+                       in _dl.list(identity))
+        except KeyError:
+            return 0
+
+    def claim(self):
+        """Returns True for exactly one caller. Used to make sure that only one
+        of the steps that observe the barrier as complete acts on it.
+        """
+
+        try:
+            self.add(_CLAIM_NAME)
+        except mr.models.kv.data_layer.KvPreconditionException:
+            return False
+
+        return True
+
+def is_result_sorted(completion_data):
+    """Whether the completion data indicates a result stored sorted by key."""
+
+    return completion_data.get('rs', False) is True
@@ -1,3 +1,4 @@
+import mr.config.kv
 import mr.models.kv.trees.tree
 import mr.models.kv.invocation
 
@@ -8,6 +9,7 @@ RT_REDUCED = 'reduced'
 
 class RelationshipsTree(mr.models.kv.trees.tree.Tree):
     tree_class = 'relationships'
+    bucket_name_length = mr.config.kv.INVOCATION_TREE_BUCKET_NAME_LENGTH
 
     def __init__(self, workflow, from_invocation, relationship_type):
         assert issubclass(
@@ -33,6 +35,13 @@ class RelationshipsTree(mr.models.kv.trees.tree.Tree):
 
         return mr.models.kv.invocation.get(self.__workflow, invocation_id)
 
+    def get_child_model_entities(self, invocation_ids):
+        """Returns the model objects for the given children, in order."""
+
+        return mr.models.kv.invocation.get_many(
+                self.__workflow, 
+                invocation_ids)
+
     def get_name_from_child_entity(self, invocation):
         """Derive the name/key from the given entity, with which to represent 
         the child.
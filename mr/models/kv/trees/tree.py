@@ -1,6 +1,9 @@
 import logging
+import hashlib
+import itertools
 
 import mr.config.kv
+import mr.models.kv.codecs
 import mr.models.kv.data_layer
 
 _logger = logging.getLogger(__name__)
@@ -23,6 +26,12 @@ _dl = mr.models.kv.data_layer.DataLayerKv()
 class Tree(mr.models.kv.common.CommonKv):
     tree_class = None
 
+    # If set (and not zero), the children are spread over buckets named for 
+    # this many characters of the hash of their names, so that the tree can be 
+    # read one bucket at a time. This can't be changed for trees that already 
+    # exist.
+    bucket_name_length = None
+
     def __repr__(self):
         cls = self.__class__
 
@@ -40,6 +49,15 @@ class Tree(mr.models.kv.common.CommonKv):
 
         raise NotImplementedError()
 
+    def get_child_model_entities(self, child_names):
+        """Returns the model objects for the given children, in order. 
+        Override this to load them in bulk.
+        """
+
+        return (self.get_child_model_entity(child_name) 
+                for child_name 
+                in child_names)
+
     def get_name_from_child_entity(self, entity):
         """Derive the name/key from the given entity, with which to represent 
         the child.
@@ -67,64 +85,89 @@ class Tree(mr.models.kv.common.CommonKv):
 
             return self.__root_identity
 
+    def get_root_identity(self):
+        """Returns the identity of the directory that contains the children."""
+
+        return self.__get_root_identity()
+
+    def __get_child_identity(self, name):
+        cls = self.__class__
+
+        identity = self.__get_root_identity()
+
+        if cls.bucket_name_length:
+            hash_ = hashlib.sha1(name).hexdigest()[:cls.bucket_name_length]
+            identity += (mr.models.kv.data_layer.make_bucket_name(hash_),)
+
+        return identity + (name,)
+
+    def __list(self):
+        """Enumerate (name, encoded data) for every child, reading one bucket 
+        at a time.
+        """
+
+        identity = self.__get_root_identity()
+        for name, encoded_data in _dl.list_paged(identity):
+            # Clip the bucket, if there is one.
+            yield (name.split('/')[-1], encoded_data)
+
     def add(self, name, data={}):
-        identity = self.__get_root_identity() + (name,)
-        return _dl.create_only(identity, mr.config.kv.ENCODER(data))
+        identity = self.__get_child_identity(name)
+        return _dl.create_only(identity, mr.models.kv.codecs.encode(data))
 
     def set(self, name, data={}):
-        identity = self.__get_root_identity() + (name,)
-        return _dl.set(identity, mr.config.kv.ENCODER(data))
+        identity = self.__get_child_identity(name)
+        return _dl.set(identity, mr.models.kv.codecs.encode(data))
 
     def get(self, name):
-        identity = self.__get_root_identity() + (name,)
+        identity = self.__get_child_identity(name)
         (state, encoded_data) = _dl.get(identity)
-        return mr.config.kv.DECODER(encoded_data)
+        return mr.models.kv.codecs.decode(encoded_data)
 
     def get_data_for_entity(self, entity):
         name = self.get_name_from_child_entity(entity)
-        identity = self.__get_root_identity() + (name,)
+        identity = self.__get_child_identity(name)
         (state, encoded_data) = _dl.get(identity)
-        return mr.config.kv.DECODER(encoded_data)
+        return mr.models.kv.codecs.decode(encoded_data)
 
     def add_entity(self, entity, data={}):
         name = self.get_name_from_child_entity(entity)
         return self.add(name, data)
 
     def update(self, name, data={}):
-        identity = self.__get_root_identity() + (name,)
-        return _dl.update_only(identity, mr.config.kv.ENCODER(data))
+        identity = self.__get_child_identity(name)
+        return _dl.update_only(identity, mr.models.kv.codecs.encode(data))
 
     def update_entity(self, entity, data={}):
         name = self.get_name_from_child_entity(entity)
         return self.update(name, data)
 
     def list(self):
-        identity = self.__get_root_identity()
-        for name, encoded_data in _dl.list(identity):
-            yield (name, mr.config.kv.DECODER(encoded_data))
+        for name, encoded_data in self.__list():
+            yield (name, mr.models.kv.codecs.decode(encoded_data))
 
     def list_keys(self):
         """Yield each the path names of each child."""
 
-        identity = self.__get_root_identity()
-        return _dl.list_keys(identity)
+        return (name for (name, encoded_data) in self.__list())
 
     def list_data(self):
-        identity = self.__get_root_identity()
-        for name, encoded_data in _dl.list(identity):
-            yield mr.config.kv.DECODER(encoded_data)
+        for name, encoded_data in self.__list():
+            yield mr.models.kv.codecs.decode(encoded_data)
 
     def list_entities(self):
-        identity = self.__get_root_identity()
-        for name in _dl.list_keys(identity):
-            yield self.get_child_model_entity(name)
+        names = (name for (name, encoded_data) in self.__list())
+        return self.get_child_model_entities(names)
 
     def list_entities_and_data(self):
-        identity = self.__get_root_identity()
-        return ((self.get_child_model_entity(name), 
-                 mr.config.kv.DECODER(encoded_data)) 
-                for name, encoded_data 
-                in _dl.list(identity))
+        (children_for_names, children) = itertools.tee(self.__list())
+
+        names = (name for (name, encoded_data) in children_for_names)
+        entities = self.get_child_model_entities(names)
+
+        return ((entity, mr.models.kv.codecs.decode(encoded_data)) 
+                for (entity, (name, encoded_data)) 
+                in itertools.izip(entities, children))
 
     def create(self):
         identity = self.__get_root_identity()
@@ -9,6 +9,7 @@ _logger = logging.getLogger(__name__)
 class Workflow(mr.models.kv.model.Model):
     entity_class = mr.constants.ID_WORKFLOW
     key_field = 'workflow_name'
+    is_cached = True
 
     workflow_name = mr.models.kv.model.Field()
     description = mr.models.kv.model.Field()
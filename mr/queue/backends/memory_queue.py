@@ -0,0 +1,222 @@
+"""A queue that lives entirely within the process. For single-node deployments,
+and for load-testing the engine without NSQ. Nothing survives a restart.
+
+Every topic has its own bounded deque. Every push also enqueues a token naming
+its topic on a single ready-queue, which the consumer greenlets block on, so
+messages are taken in the order that they were pushed, across topics, and
+nothing polls.
+"""
+
+import logging
+import collections
+
+import gevent
+import gevent.lock
+import gevent.queue
+
+import mr.config.memory_queue
+import mr.queue.queue_factory
+import mr.queue.queue_consumer
+import mr.queue.queue_producer
+import mr.queue.queue_control
+import mr.queue.message_handler
+
+_logger = logging.getLogger(__name__)
+
+
+class TopicFullException(Exception):
+    pass
+
+
+class _Topic(object):
+    def __init__(self, topic, max_length):
+        self.__topic = topic
+        self.__messages = collections.deque()
+        self.__slots = gevent.lock.BoundedSemaphore(max_length)
+
+    def put(self, raw_message):
+        if self.__slots.acquire(
+                timeout=mr.config.memory_queue.PUSH_TIMEOUT_S) is False:
+            raise TopicFullException(
+                    "Topic [%s] stayed full for (%s) seconds." %
+                    (self.__topic, mr.config.memory_queue.PUSH_TIMEOUT_S))
+
+        self.__messages.append(raw_message)
+
+    def get(self):
+        raw_message = self.__messages.popleft()
+        self.__slots.release()
+
+        return raw_message
+
+    def __len__(self):
+        return len(self.__messages)
+
+
+class _MemoryBroker(object):
+    """The topics, shared by the producer and the consumer."""
+
+    def __init__(self, consumed_topics):
+        self.__consumed_topics_s = set(consumed_topics)
+        self.__topics = {}
+        self.__ready_q = gevent.queue.Queue()
+
+    def __get_topic(self, topic):
+        try:
+            return self.__topics[topic]
+        except KeyError:
+            if topic not in self.__consumed_topics_s:
+                _logger.warning("Nothing in this process consumes topic "
+                                "[%s]. Its messages will be held but never "
+                                "processed.", topic)
+
+            t = _Topic(topic, mr.config.memory_queue.TOPIC_MAX_LENGTH)
+            self.__topics[topic] = t
+
+            return t
+
+    def put(self, topic, raw_message):
+        self.__get_topic(topic).put(raw_message)
+
+        if topic in self.__consumed_topics_s:
+            self.__ready_q.put(topic)
+
+    def get(self):
+        """Block until there's a message. Returns a 2-tuple of the topic and
+        the message, or None if the consumers are being stopped.
+        """
+
+        topic = self.__ready_q.get()
+        if topic is None:
+            return None
+
+        return (topic, self.__topics[topic].get())
+
+    def wake(self, count):
+        """Wake the given number of consumers with nothing to consume."""
+
+        for i in xrange(count):
+            self.__ready_q.put(None)
+
+    def get_depths(self):
+        return dict((topic, len(t))
+                    for (topic, t)
+                    in self.__topics.iteritems())
+
+
+class _MemoryQueueControl(mr.queue.queue_control.QueueControl):
+    def __init__(self, producer, consumer):
+        super(_MemoryQueueControl, self).__init__()
+
+        self.__p = producer
+        self.__c = consumer
+
+    def start_producer(self):
+        _logger.info("Starting in-memory producer.")
+
+    def start_consumer(self):
+        _logger.info("Starting in-memory consumer.")
+
+        self.__c.start()
+
+    def stop_producer(self):
+        _logger.info("Stopping in-memory producer.")
+
+    def stop_consumer(self):
+        _logger.info("Stopping in-memory consumer.")
+
+        self.__c.stop()
+
+
+class _MemoryQueueProducer(mr.queue.queue_producer.QueueProducer):
+    def __init__(self, broker):
+        super(_MemoryQueueProducer, self).__init__()
+
+        self.__broker = broker
+
+    def is_alive(self):
+        return True
+
+    def push_one_raw(self, topic, raw_message):
+        _logger.debug("Pushing message to topic: [%s]", topic)
+
+        self.__broker.put(topic, raw_message)
+
+    def push_many_raw(self, topic, raw_message_list):
+        _logger.debug("Pushing MANY messages to topic: [%s]", topic)
+
+        for raw_message in raw_message_list:
+            self.__broker.put(topic, raw_message)
+
+    def get_depths(self):
+        """Returns a dictionary of topics to the number of messages waiting
+        on them.
+        """
+
+        return self.__broker.get_depths()
+
+
+class _MemoryQueueConsumer(mr.queue.queue_consumer.QueueConsumer):
+    def __init__(self, broker):
+        super(_MemoryQueueConsumer, self).__init__()
+
+        self.__broker = broker
+        self.__mh = mr.queue.message_handler.MessageHandler()
+        self.__greenlets = []
+
+    def is_alive(self):
+        return bool(self.__greenlets) and \
+               all(not g.dead for g in self.__greenlets)
+
+    def __consume(self):
+        while 1:
+            item = self.__broker.get()
+            if item is None:
+                break
+
+            (topic, raw_message) = item
+
+            _logger.debug("Received message from topic: [%s]", topic)
+
+            try:
+                # This blocks while the dispatcher is full.
+                self.__mh.process_message(raw_message)
+            except:
+                # We don't want the message to reappear, later.
+                _logger.exception("There was an error while handling a "
+                                  "message from topic [%s]. Squashing it.",
+                                  topic)
+
+    def start(self):
+        count = mr.config.memory_queue.CONSUMER_COUNT
+
+        _logger.info("Starting (%d) in-memory consumers.", count)
+
+        self.__greenlets = [gevent.spawn(self.__consume)
+                            for i
+                            in xrange(count)]
+
+    def stop(self):
+        self.__broker.wake(len(self.__greenlets))
+        gevent.joinall(self.__greenlets)
+
+        self.__greenlets = []
+
+
+class MemoryQueueFactory(mr.queue.queue_factory.QueueFactory):
+    def __init__(self, topics):
+        broker = _MemoryBroker(topics)
+
+        self.__producer = _MemoryQueueProducer(broker)
+        self.__consumer = _MemoryQueueConsumer(broker)
+
+        self.__control = _MemoryQueueControl(self.__producer, self.__consumer)
+
+    def get_control(self):
+        return self.__control
+
+    def get_producer(self):
+        return self.__producer
+
+    def get_consumer(self):
+        return self.__consumer
@@ -1,5 +1,7 @@
 import logging
 
+import gevent
+
 import nsq.consumer
 import nsq.producer
 import nsq.node_collection
@@ -12,6 +14,7 @@ import mr.queue.queue_consumer
 import mr.queue.queue_producer
 import mr.queue.queue_control
 import mr.queue.message_handler
+import mr.queue.dispatcher
 
 logging.getLogger('nsq').setLevel(logging.INFO)
 
@@ -125,7 +128,8 @@ class _NsqQueueControl(mr.queue.queue_control.QueueControl):
         _logger.info("Stopping NSQ producer.")
 
         try:
-            self.__c.resource.stop()
+            self.__p.flush()
+            self.__p.resource.stop()
         except:
             _logger.exception("Could not stop the queue producer.")
         else:
@@ -146,6 +150,116 @@ class _NsqQueueControl(mr.queue.queue_control.QueueControl):
         raise SystemError("Could not stop the queue consumer.")
 
 
+class _PublishBatch(object):
+    """The messages buffered for one topic."""
+
+    def __init__(self):
+        self.raw_messages = []
+        self.size = 0
+        self.completion = mr.queue.queue_producer.PushCompletion()
+
+    def add(self, raw_message):
+        self.raw_messages.append(raw_message)
+
+        # Each message is prefixed with its length.
+        self.size += len(raw_message) + 4
+
+
+class _PublishCoalescer(object):
+    """Buffer the messages for each topic, and publish each buffer with a 
+    single MPUB when it reaches a count or size limit, or when its first 
+    message has lingered long enough. Every message in a buffer shares the 
+    buffer's completion.
+    """
+
+    def __init__(self, publish_cb):
+        self.__publish_cb = publish_cb
+        self.__batches = {}
+        self.__flushes = set()
+
+    def push(self, topic, raw_message_list):
+        batch = self.__batches.get(topic)
+        if batch is None:
+            batch = _PublishBatch()
+            self.__batches[topic] = batch
+
+            gevent.spawn_later(
+                mr.config.nsq_queue.PUBLISH_LINGER_S, 
+                self.__flush_if_current, 
+                topic, 
+                batch)
+
+        for raw_message in raw_message_list:
+            batch.add(raw_message)
+
+        if len(batch.raw_messages) >= \
+                mr.config.nsq_queue.PUBLISH_BATCH_MAX_COUNT or \
+           batch.size >= mr.config.nsq_queue.PUBLISH_BATCH_MAX_BYTES:
+            self.__flush_if_current(topic, batch)
+
+        return batch.completion
+
+    def __flush_if_current(self, topic, batch):
+        # It might've already been flushed for reaching a limit.
+        if self.__batches.get(topic) is not batch:
+            return
+
+        del self.__batches[topic]
+
+        g = gevent.spawn(self.__publish, topic, batch)
+        self.__flushes.add(g)
+        g.link(self.__flushes.discard)
+
+    def __get_chunks_gen(self, raw_messages):
+        """A list of messages pushed together might exceed the limits by 
+        itself.
+        """
+
+        chunk = []
+        size = 0
+        for raw_message in raw_messages:
+            message_size = len(raw_message) + 4
+
+            if chunk and \
+               (len(chunk) >= mr.config.nsq_queue.PUBLISH_BATCH_MAX_COUNT or
+                size + message_size > 
+                    mr.config.nsq_queue.PUBLISH_BATCH_MAX_BYTES):
+                yield chunk
+
+                chunk = []
+                size = 0
+
+            chunk.append(raw_message)
+            size += message_size
+
+        if chunk:
+            yield chunk
+
+    def __publish(self, topic, batch):
+        _logger.debug("Publishing (%d) coalesced messages (%d bytes) to "
+                      "topic: [%s]", len(batch.raw_messages), batch.size, 
+                      topic)
+
+        try:
+            for chunk in self.__get_chunks_gen(batch.raw_messages):
+                self.__publish_cb(topic, chunk)
+        except Exception as e:
+            _logger.exception("Could not publish (%d) coalesced messages to "
+                              "topic: [%s]", len(batch.raw_messages), topic)
+
+            batch.completion.set_failed(e)
+        else:
+            batch.completion.set_published()
+
+    def flush(self):
+        """Publish everything that's buffered, and wait for it."""
+
+        for topic, batch in self.__batches.items():
+            self.__flush_if_current(topic, batch)
+
+        gevent.joinall(list(self.__flushes))
+
+
 class _NsqQueueProducer(mr.queue.queue_producer.QueueProducer):
     """Producer interface to the NSQ queue."""
 
@@ -156,13 +270,25 @@ class _NsqQueueProducer(mr.queue.queue_producer.QueueProducer):
 
         self.__p = nsq.producer.Producer(node_collection)
 
+        if mr.config.nsq_queue.IS_PUBLISH_COALESCED is True:
+            self.__coalescer = _PublishCoalescer(self.__mpub)
+        else:
+            self.__coalescer = None
+
     def is_alive(self):
 # TODO(dustin): This isn't yet being implemented/facilitated.
         return self.__p.is_alive
 
+    def __mpub(self, topic, raw_message_list):
+        c = self.__p.connection_election.elect_connection()
+        c.mpub(topic, raw_message_list)
+
     def push_one_raw(self, topic, raw_message):
         _logger.debug("Pushing message to topic: [%s]", topic)
 
+        if self.__coalescer is not None:
+            return self.__coalescer.push(topic, [raw_message])
+
         c = self.__p.connection_election.elect_connection()
         c.pub(topic, raw_message)
 
@@ -171,8 +297,14 @@ class _NsqQueueProducer(mr.queue.queue_producer.QueueProducer):
         # generator.
         _logger.debug("Pushing MANY messages to topic: [%s]", topic)
 
-        c = self.__p.connection_election.elect_connection()
-        c.mpub(topic, raw_message_list)
+        if self.__coalescer is not None:
+            return self.__coalescer.push(topic, raw_message_list)
+
+        self.__mpub(topic, raw_message_list)
+
+    def flush(self):
+        if self.__coalescer is not None:
+            self.__coalescer.flush()
 
     @property
     def resource(self):
@@ -192,12 +324,35 @@ class _NsqQueueConsumer(mr.queue.queue_consumer.QueueConsumer):
                         for topic 
                         in topics]
 
+        self.__dispatcher = mr.queue.dispatcher.get_dispatcher()
+
+        # Messages are only dispatched as there are free slots, so there's no 
+        # point in having more in flight than slots.
+        max_in_flight = min(
+                            mr.config.nsq_queue.MAX_IN_FLIGHT, 
+                            self.__dispatcher.max_concurrency)
+
         self.__c = nsq.consumer.Consumer(
                 context_list,
                 node_collection, 
-                mr.config.nsq_queue.MAX_IN_FLIGHT, 
+                max_in_flight, 
+                rdy=self.__get_rdy,
                 message_handler_cls=_NsqMessageHandler)
 
+    def __get_rdy(self, node, connection_count, consumer):
+        """Called whenever a connection's RDY count is replenished. Ask for 
+        this connection's share of the free dispatch slots. We always ask for 
+        at least one, or the connection would never be replenished again.
+        """
+
+        free_count = self.__dispatcher.free_count
+        rdy = max(1, free_count // max(1, connection_count))
+
+        _logger.debug("Setting RDY for [%s] to (%d) with (%d) free dispatch "
+                      "slots.", node, rdy, free_count)
+
+        return rdy
+
     def is_alive(self):
 # TODO(dustin): This isn't yet being implemented/facilitated.
         return self.__c.is_alive
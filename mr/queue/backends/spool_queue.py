@@ -0,0 +1,596 @@
+"""A durable queue in a local directory, for systems that can't run nsqd.
+
+Every topic has its own append-only log, split into segments that are named
+for the (logical) offset of their first record:
+
+    <spool>/<topic>/<offset>.log
+
+Each record is its length, the CRC32 of the message, and the message. Appends
+are synced to disk in batches, and a message is only consumed (and its push
+only completes) once it has been synced. The offset that the consumer has
+reached in each topic is kept in a small memory-mapped file next to the
+segments, and a segment is deleted once the consumer is entirely past it.
+
+There's a single consumer offset per topic. A message is acknowledged once it
+has been handed to the dispatcher, so a message that hadn't been dispatched
+yet when the process went down will be delivered again, but one that was
+still being handled by a pooled dispatcher won't be. Delivery is only
+at-least-once through to the end of the step with the synchronous dispatcher.
+Only one process may use a spool at a time.
+"""
+
+import logging
+import os
+import os.path
+import errno
+import struct
+import zlib
+import mmap
+import fcntl
+import bisect
+import collections
+
+import gevent
+import gevent.event
+
+import mr.config.spool_queue
+import mr.queue.queue_factory
+import mr.queue.queue_consumer
+import mr.queue.queue_producer
+import mr.queue.queue_control
+import mr.queue.message_handler
+
+_logger = logging.getLogger(__name__)
+
+# Length and CRC32 of the message.
+_RECORD_HEADER = struct.Struct('!II')
+_OFFSET = struct.Struct('!Q')
+
+_SEGMENT_FILENAME_TEMPLATE = '%020d.log'
+_SEGMENT_FILENAME_SUFFIX = '.log'
+_OFFSET_FILENAME = 'consumer.offset'
+_LOCK_FILENAME = 'spool.lock'
+
+
+class _Condition(object):
+    """A condition-variable for greenlets. Since greenlets only switch when
+    they block, there's no lock to hold between checking for something and
+    waiting for it.
+    """
+
+    def __init__(self):
+        self.__waiters = collections.deque()
+
+    def wait(self):
+        ev = gevent.event.Event()
+        self.__waiters.append(ev)
+
+        ev.wait()
+
+    def notify(self, n=1):
+        for i in xrange(min(n, len(self.__waiters))):
+            self.__waiters.popleft().set()
+
+    def notify_all(self):
+        self.notify(len(self.__waiters))
+
+
+class _TopicLog(object):
+    """The segments and consumer offset of one topic."""
+
+    def __init__(self, spool_path, topic):
+        self.__topic = topic
+        self.__path = os.path.join(spool_path, topic)
+
+        try:
+            os.makedirs(self.__path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self.__segments = sorted(
+                            int(filename[:-len(_SEGMENT_FILENAME_SUFFIX)])
+                            for filename
+                            in os.listdir(self.__path)
+                            if filename.endswith(_SEGMENT_FILENAME_SUFFIX))
+
+        if not self.__segments:
+            self.__segments = [0]
+            open(self.__get_segment_filepath(0), 'w').close()
+
+        self.__end_offset = self.__recover_active_segment()
+        self.__synced_offset = self.__end_offset
+        self.__completion = None
+
+        self.__fd = os.open(
+                        self.__get_segment_filepath(self.__segments[-1]),
+                        os.O_WRONLY | os.O_APPEND)
+
+        self.__read_f = None
+        self.__read_base_offset = None
+
+        self.__open_offset()
+
+        self.is_busy = False
+
+    def __get_segment_filepath(self, base_offset):
+        filename = _SEGMENT_FILENAME_TEMPLATE % (base_offset,)
+        return os.path.join(self.__path, filename)
+
+    def __read_record(self, f):
+        """Returns the message, or None if there isn't a whole, intact record
+        at the current position.
+        """
+
+        header = f.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return None
+
+        (length, crc) = _RECORD_HEADER.unpack(header)
+
+        raw_message = f.read(length)
+        if len(raw_message) < length or \
+           zlib.crc32(raw_message) & 0xffffffff != crc:
+            return None
+
+        return raw_message
+
+    def __recover_active_segment(self):
+        """We might've gone down while appending. Truncate anything after the
+        last intact record of the last segment, and return the end offset.
+        """
+
+        base_offset = self.__segments[-1]
+        filepath = self.__get_segment_filepath(base_offset)
+
+        with open(filepath, 'r+b') as f:
+            position = 0
+            while self.__read_record(f) is not None:
+                position = f.tell()
+
+            f.seek(0, os.SEEK_END)
+            if f.tell() > position:
+                _logger.warning("Truncating (%d) bytes of partial records "
+                                "from spool segment: [%s]",
+                                f.tell() - position, filepath)
+
+                f.truncate(position)
+
+        return base_offset + position
+
+    def __open_offset(self):
+        filepath = os.path.join(self.__path, _OFFSET_FILENAME)
+
+        if os.path.exists(filepath) is False:
+            with open(filepath, 'wb') as f:
+                f.write(_OFFSET.pack(self.__segments[0]))
+
+        self.__offset_f = open(filepath, 'r+b')
+        self.__offset_mm = mmap.mmap(self.__offset_f.fileno(), _OFFSET.size)
+
+        # The segments that the offset is in might've been lost.
+        offset = self.consumer_offset
+        if offset < self.__segments[0] or offset > self.__end_offset:
+            _logger.warning("Consumer offset (%d) of topic [%s] is outside "
+                            "of the log (%d, %d). Resetting.", offset,
+                            self.__topic, self.__segments[0],
+                            self.__end_offset)
+
+            self.__set_consumer_offset(
+                min(max(offset, self.__segments[0]), self.__end_offset))
+
+    def __set_consumer_offset(self, offset):
+        _OFFSET.pack_into(self.__offset_mm, 0, offset)
+
+    def __roll(self):
+        self.sync()
+        os.close(self.__fd)
+
+        base_offset = self.__end_offset
+
+        _logger.debug("Starting spool segment (%d) for topic: [%s]",
+                      base_offset, self.__topic)
+
+        self.__fd = os.open(
+                        self.__get_segment_filepath(base_offset),
+                        os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                        0o644)
+
+        self.__segments.append(base_offset)
+
+    def append(self, raw_message):
+        """Returns the completion that'll be set when the message is synced."""
+
+        if self.__end_offset - self.__segments[-1] >= \
+                mr.config.spool_queue.SEGMENT_MAX_BYTES:
+            self.__roll()
+
+        record = _RECORD_HEADER.pack(
+                    len(raw_message),
+                    zlib.crc32(raw_message) & 0xffffffff) + \
+                 raw_message
+
+        written = 0
+        while written < len(record):
+            written += os.write(self.__fd, record[written:])
+
+        self.__end_offset += len(record)
+
+        if self.__completion is None:
+            self.__completion = mr.queue.queue_producer.PushCompletion()
+
+        return self.__completion
+
+    def sync(self):
+        """Sync what has been appended. Returns True if there was anything."""
+
+        self.__offset_mm.flush()
+
+        if self.__synced_offset == self.__end_offset:
+            return False
+
+        try:
+            os.fsync(self.__fd)
+        except Exception as e:
+            # The records are still unsynced, so the next sync needs a
+            # completion to publish.
+            (completion, self.__completion) = \
+                (self.__completion,
+                 mr.queue.queue_producer.PushCompletion())
+
+            completion.set_failed(e)
+            raise
+
+        (completion, self.__completion) = (self.__completion, None)
+
+        self.__synced_offset = self.__end_offset
+        completion.set_published()
+
+        return True
+
+    def read_next(self):
+        """Returns a 2-tuple of the next synced message and the offset that
+        follows it, or None if there aren't any.
+        """
+
+        offset = self.consumer_offset
+
+        while offset < self.__synced_offset:
+            i = bisect.bisect_right(self.__segments, offset) - 1
+            base_offset = self.__segments[i]
+
+            if self.__read_base_offset != base_offset:
+                if self.__read_f is not None:
+                    self.__read_f.close()
+
+                self.__read_f = open(
+                                    self.__get_segment_filepath(base_offset),
+                                    'rb')
+
+                self.__read_base_offset = base_offset
+
+            self.__read_f.seek(offset - base_offset)
+            raw_message = self.__read_record(self.__read_f)
+
+            if raw_message is not None:
+                return (raw_message, base_offset + self.__read_f.tell())
+
+            # The records were checked when they were appended, so the segment
+            # has been damaged since. Skip the rest of it.
+            if i + 1 < len(self.__segments):
+                next_offset = self.__segments[i + 1]
+            else:
+                next_offset = self.__synced_offset
+
+            _logger.error("Spool segment (%d) of topic [%s] is damaged at "
+                          "offset (%d). Skipping (%d) bytes.", base_offset,
+                          self.__topic, offset, next_offset - offset)
+
+            self.ack(next_offset)
+            offset = next_offset
+
+        return None
+
+    def ack(self, offset):
+        """Everything before the given offset has been consumed. Delete the
+        segments that are entirely before it.
+        """
+
+        self.__set_consumer_offset(offset)
+
+        while len(self.__segments) > 1 and self.__segments[1] <= offset:
+            base_offset = self.__segments.pop(0)
+
+            if self.__read_base_offset == base_offset:
+                self.__read_f.close()
+
+                self.__read_f = None
+                self.__read_base_offset = None
+
+            _logger.debug("Reclaiming spool segment (%d) of topic: [%s]",
+                          base_offset, self.__topic)
+
+            os.unlink(self.__get_segment_filepath(base_offset))
+
+    @property
+    def consumer_offset(self):
+        return _OFFSET.unpack_from(self.__offset_mm, 0)[0]
+
+    @property
+    def unsynced_bytes(self):
+        return self.__end_offset - self.__synced_offset
+
+    @property
+    def topic(self):
+        return self.__topic
+
+
+class _SpoolBroker(object):
+    """The topic logs, shared by the producer and the consumer."""
+
+    def __init__(self, spool_path, consumed_topics):
+        self.__spool_path = spool_path
+
+        try:
+            os.makedirs(spool_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self.__lock_f = open(os.path.join(spool_path, _LOCK_FILENAME), 'w')
+
+        try:
+            fcntl.flock(self.__lock_f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            raise SystemError("Spool is in use by another process: [%s]" %
+                              (spool_path,))
+
+        self.__logs = {}
+        self.__consumed_logs = [self.__get_log(topic)
+                                for topic
+                                in consumed_topics]
+
+        self.__next_consumed_index = 0
+        self.__cond = _Condition()
+        self.__is_dirty_ev = gevent.event.Event()
+        self.__is_consuming = True
+        self.__is_syncing = True
+        self.__syncer_g = None
+
+    def __get_log(self, topic):
+        try:
+            return self.__logs[topic]
+        except KeyError:
+            _logger.debug("Opening spool for topic: [%s]", topic)
+
+            log = _TopicLog(self.__spool_path, topic)
+            self.__logs[topic] = log
+
+            return log
+
+    def __syncer(self):
+        while 1:
+            self.__is_dirty_ev.wait()
+            if self.__is_syncing is False:
+                break
+
+            # Let more appends join the batch.
+            gevent.sleep(mr.config.spool_queue.FSYNC_INTERVAL_S)
+
+            self.__is_dirty_ev.clear()
+
+            try:
+                self.sync()
+            except:
+                _logger.exception("Could not sync the spool.")
+
+    def start_syncer(self):
+        self.__syncer_g = gevent.spawn(self.__syncer)
+
+    def stop_syncer(self):
+        self.__is_syncing = False
+        self.__is_dirty_ev.set()
+
+        if self.__syncer_g is not None:
+            self.__syncer_g.join()
+
+        self.sync()
+
+    def sync(self):
+        is_synced = False
+        for log in self.__logs.values():
+            if log.sync() is True:
+                is_synced = True
+
+        # There's something new to consume.
+        if is_synced is True:
+            self.__cond.notify_all()
+
+    def put(self, topic, raw_message):
+        log = self.__get_log(topic)
+        completion = log.append(raw_message)
+
+        if log.unsynced_bytes >= mr.config.spool_queue.FSYNC_BATCH_BYTES:
+            self.sync()
+        else:
+            self.__is_dirty_ev.set()
+
+        return completion
+
+    def take(self):
+        """Block until there's a message on a topic that no other consumer is
+        reading. Returns a 3-tuple of the log, the message, and the offset to
+        acknowledge, or None if the consumers are being stopped.
+        """
+
+        while self.__is_consuming is True:
+            count = len(self.__consumed_logs)
+
+            # Start from a different topic each time, so that a busy topic
+            # doesn't starve the others.
+            for i in xrange(count):
+                j = (self.__next_consumed_index + i) % count
+                log = self.__consumed_logs[j]
+
+                if log.is_busy is True:
+                    continue
+
+                item = log.read_next()
+                if item is None:
+                    continue
+
+                self.__next_consumed_index = (j + 1) % count
+                log.is_busy = True
+
+                (raw_message, next_offset) = item
+                return (log, raw_message, next_offset)
+
+            self.__cond.wait()
+
+        return None
+
+    def finish(self, log, next_offset):
+        log.ack(next_offset)
+        log.is_busy = False
+
+        # The topic can be read again.
+        self.__cond.notify()
+
+    def wake_all(self):
+        """Wake the waiting consumers, to stop."""
+
+        self.__is_consuming = False
+        self.__cond.notify_all()
+
+
+class _SpoolQueueControl(mr.queue.queue_control.QueueControl):
+    def __init__(self, broker, producer, consumer):
+        super(_SpoolQueueControl, self).__init__()
+
+        self.__broker = broker
+        self.__p = producer
+        self.__c = consumer
+
+    def start_producer(self):
+        _logger.info("Starting spool producer.")
+
+        self.__broker.start_syncer()
+
+    def start_consumer(self):
+        _logger.info("Starting spool consumer.")
+
+        self.__c.start()
+
+    def stop_producer(self):
+        _logger.info("Stopping spool producer.")
+
+        self.__broker.stop_syncer()
+
+    def stop_consumer(self):
+        _logger.info("Stopping spool consumer.")
+
+        self.__c.stop()
+
+
+class _SpoolQueueProducer(mr.queue.queue_producer.QueueProducer):
+    def __init__(self, broker):
+        super(_SpoolQueueProducer, self).__init__()
+
+        self.__broker = broker
+
+    def is_alive(self):
+        return True
+
+    def push_one_raw(self, topic, raw_message):
+        _logger.debug("Pushing message to topic: [%s]", topic)
+
+        return self.__broker.put(topic, raw_message)
+
+    def push_many_raw(self, topic, raw_message_list):
+        _logger.debug("Pushing MANY messages to topic: [%s]", topic)
+
+        completion = None
+        for raw_message in raw_message_list:
+            completion = self.__broker.put(topic, raw_message)
+
+        # The messages are synced in order, so the last one's completion
+        # covers the others.
+        return completion
+
+
+class _SpoolQueueConsumer(mr.queue.queue_consumer.QueueConsumer):
+    def __init__(self, broker):
+        super(_SpoolQueueConsumer, self).__init__()
+
+        self.__broker = broker
+        self.__mh = mr.queue.message_handler.MessageHandler()
+        self.__greenlets = []
+
+    def is_alive(self):
+        return bool(self.__greenlets) and \
+               all(not g.dead for g in self.__greenlets)
+
+    def __consume(self):
+        while 1:
+            item = self.__broker.take()
+            if item is None:
+                break
+
+            (log, raw_message, next_offset) = item
+
+            _logger.debug("Received message from topic: [%s]", log.topic)
+
+            try:
+                # This blocks while the dispatcher is full. It returns once the
+                # message has been dispatched, which (unless the dispatcher is
+                # synchronous) might be before it has been handled.
+                self.__mh.process_message(raw_message)
+            except:
+                # We don't want the message to reappear, later.
+                _logger.exception("There was an error while handling a "
+                                  "message from topic [%s]. Squashing it.",
+                                  log.topic)
+            finally:
+                self.__broker.finish(log, next_offset)
+
+    def start(self):
+        count = mr.config.spool_queue.CONSUMER_COUNT
+
+        _logger.info("Starting (%d) spool consumers.", count)
+
+        self.__greenlets = [gevent.spawn(self.__consume)
+                            for i
+                            in xrange(count)]
+
+    def stop(self):
+        self.__broker.wake_all()
+        gevent.joinall(self.__greenlets)
+
+        self.__greenlets = []
+
+
+class SpoolQueueFactory(mr.queue.queue_factory.QueueFactory):
+    def __init__(self, topics):
+        spool_path = mr.config.spool_queue.SPOOL_PATH
+        if not spool_path:
+            raise ValueError("MR_SPOOL_QUEUE_PATH must be set to use the "
+                             "spool queue.")
+
+        broker = _SpoolBroker(os.path.abspath(spool_path), topics)
+
+        self.__producer = _SpoolQueueProducer(broker)
+        self.__consumer = _SpoolQueueConsumer(broker)
+
+        self.__control = _SpoolQueueControl(
+                            broker,
+                            self.__producer,
+                            self.__consumer)
+
+    def get_control(self):
+        return self.__control
+
+    def get_producer(self):
+        return self.__producer
+
+    def get_consumer(self):
+        return self.__consumer
@@ -0,0 +1,284 @@
+"""The dispatchers that run dequeued messages. Each runs at most a fixed number
+of messages at once, and blocks whoever dispatches when it's full, so that a
+burst of messages is held back in the queue rather than all started at once.
+The queue backends can also watch the free slots to decide how many messages
+to ask for.
+"""
+
+import logging
+import sys
+import threading
+import Queue
+import pickle
+import multiprocessing
+
+import gevent.pool
+
+import mr.config.queue
+import mr.utility
+
+_logger = logging.getLogger(__name__)
+
+
+class Dispatcher(object):
+    """The base-class of all dispatchers. The callables that are dispatched
+    must be picklable (module-level functions), so that they can be sent to
+    other processes.
+    """
+
+    # Whether the messages are run in other processes, which push to the queue 
+    # themselves.
+    is_shared_queue_required = False
+
+    def __init__(self, max_concurrency):
+        self.__max_concurrency = max_concurrency
+
+    def dispatch(self, func, *args):
+        """Run the given function. Blocks until there's a free slot."""
+
+        raise NotImplementedError()
+
+    def try_dispatch(self, func, *args):
+        """Run the given function, only if there's a free slot. The function 
+        doesn't have to be picklable. Returns False if it wasn't run.
+        """
+
+        raise NotImplementedError()
+
+    @property
+    def max_concurrency(self):
+        return self.__max_concurrency
+
+    @property
+    def free_count(self):
+        """The number of messages that can be dispatched without blocking."""
+
+        raise NotImplementedError()
+
+
+class SynchronousDispatcher(Dispatcher):
+    """Run every message in the thread that received it."""
+
+    def __init__(self, max_concurrency=1):
+        super(SynchronousDispatcher, self).__init__(1)
+
+    def dispatch(self, func, *args):
+        func(*args)
+
+    def try_dispatch(self, func, *args):
+        # We'd just be recursing.
+        return False
+
+    @property
+    def free_count(self):
+        return 1
+
+
+class GeventPoolDispatcher(Dispatcher):
+    """Run every message in its own greenlet."""
+
+    def __init__(self, max_concurrency):
+        super(GeventPoolDispatcher, self).__init__(max_concurrency)
+
+        self.__pool = gevent.pool.Pool(max_concurrency)
+
+    def dispatch(self, func, *args):
+        # This blocks while the pool is full.
+        self.__pool.spawn(_run_safely, func, *args)
+
+    def try_dispatch(self, func, *args):
+        if self.__pool.full() is True:
+            return False
+
+        self.__pool.spawn(_run_safely, func, *args)
+        return True
+
+    @property
+    def free_count(self):
+        return self.__pool.free_count()
+
+
+class ThreadPoolDispatcher(Dispatcher):
+    """Run messages on a fixed set of threads."""
+
+    def __init__(self, max_concurrency):
+        super(ThreadPoolDispatcher, self).__init__(max_concurrency)
+
+        self.__slots = threading.BoundedSemaphore(max_concurrency)
+        self.__free_count = max_concurrency
+        self.__free_count_lock = threading.Lock()
+        self.__q = Queue.Queue()
+
+        for i in xrange(max_concurrency):
+            t = threading.Thread(
+                    target=self.__thread,
+                    name=('dispatch-%d' % (i,)))
+
+            t.daemon = True
+            t.start()
+
+    def __adjust_free_count(self, delta):
+        with self.__free_count_lock:
+            self.__free_count += delta
+
+    def __thread(self):
+        while 1:
+            (func, args) = self.__q.get()
+
+            try:
+                _run_safely(func, *args)
+            finally:
+                self.__adjust_free_count(1)
+                self.__slots.release()
+
+    def dispatch(self, func, *args):
+        self.__slots.acquire()
+        self.__adjust_free_count(-1)
+
+        self.__q.put((func, args))
+
+    def try_dispatch(self, func, *args):
+        if self.__slots.acquire(False) is False:
+            return False
+
+        self.__adjust_free_count(-1)
+
+        self.__q.put((func, args))
+        return True
+
+    @property
+    def free_count(self):
+        return self.__free_count
+
+
+class ProcessPoolDispatcher(Dispatcher):
+    """Run messages on a fixed set of pre-forked processes. This is for
+    CPU-bound workloads, which would otherwise serialize on the GIL. 
+
+    The processes are forked when the dispatcher is created, which has to be 
+    at boot, before the KV has been loaded (and has connected) and before the 
+    queue has been started. Each process loads the workflows and starts its 
+    own producer the first time that it handles a message. Since the 
+    producer is the process's own, the queue has to be one that's shared 
+    between processes (NSQ).
+    """
+
+    # Each process pushes the steps that it produces with its own producer.
+    is_shared_queue_required = True
+
+    def __init__(self, max_concurrency):
+        super(ProcessPoolDispatcher, self).__init__(max_concurrency)
+
+        if _KV_MODULE_NAME in sys.modules:
+            raise EnvironmentError("The process-pool dispatcher has to be "
+                                   "created before the KV is loaded, so that "
+                                   "its processes don't share our "
+                                   "connections.")
+
+        self.__slots = threading.BoundedSemaphore(max_concurrency)
+        self.__free_count = max_concurrency
+        self.__free_count_lock = threading.Lock()
+        self.__pool = multiprocessing.Pool(
+                        processes=max_concurrency,
+                        initializer=_init_worker_process)
+
+    def __adjust_free_count(self, delta):
+        with self.__free_count_lock:
+            self.__free_count += delta
+
+    def __finished(self, result):
+        self.__adjust_free_count(1)
+        self.__slots.release()
+
+    def dispatch(self, func, *args):
+        # The callback is only called on success. We pickle the call 
+        # ourselves so that one that can't be sent fails here (rather than in 
+        # the pool's thread, where nothing would release the slot), and 
+        # _run_pickled() never fails.
+        pickled = pickle.dumps((func, args), pickle.HIGHEST_PROTOCOL)
+
+        self.__slots.acquire()
+        self.__adjust_free_count(-1)
+
+        try:
+            self.__pool.apply_async(
+                _run_pickled,
+                (pickled,),
+                callback=self.__finished)
+        except:
+            self.__finished(None)
+            raise
+
+    def try_dispatch(self, func, *args):
+        # The step-processor and the message-parameters can't be sent to 
+        # another process.
+        return False
+
+    @property
+    def free_count(self):
+        return self.__free_count
+
+def _run_safely(func, *args):
+    """The dispatchers run in the background, so there's nobody to raise to."""
+
+    try:
+        func(*args)
+    except:
+        _logger.exception("Dispatched call failed: [%s]", func.__name__)
+
+def _run_pickled(pickled):
+    try:
+        (func, args) = pickle.loads(pickled)
+    except:
+        _logger.exception("Dispatched call could not be unpickled.")
+        return
+
+    _run_safely(func, *args)
+
+# The module that connects to the KV when it's loaded.
+_KV_MODULE_NAME = 'mr.models.kv.data_layer'
+
+_is_worker_process = False
+
+def _init_worker_process():
+    global _is_worker_process
+    _is_worker_process = True
+
+def is_worker_process():
+    """Whether we're one of the processes of a ProcessPoolDispatcher."""
+
+    return _is_worker_process
+
+_dispatcher = None
+def get_dispatcher():
+    """Return the dispatcher, creating it the first time. This is first 
+    called at boot, since some dispatchers have to be created before anything 
+    else is.
+    """
+
+    global _dispatcher
+
+    if _dispatcher is None:
+        if mr.config.queue.IS_MULTITHREADED is True:
+            dispatcher_cls = mr.utility.load_cls_from_string(
+                                mr.config.queue.DISPATCHER_FQ_CLASS)
+        else:
+            dispatcher_cls = SynchronousDispatcher
+
+        # A queue that's private to the process (or to the system, like the 
+        # spool, which only one process can use) would drop whatever the other 
+        # processes push.
+        if dispatcher_cls.is_shared_queue_required is True and \
+           mr.config.queue.IS_SHARED is False:
+            raise ValueError("Dispatcher [%s] requires a queue that's shared "
+                             "between processes (NSQ), not: [%s]" % 
+                             (dispatcher_cls.__name__, 
+                              mr.config.queue.QUEUE_FACTORY_FQ_CLASS))
+
+        _logger.info("Creating dispatcher [%s] with a maximum concurrency of "
+                     "(%d).", dispatcher_cls.__name__,
+                     mr.config.queue.DISPATCH_MAX_CONCURRENCY)
+
+        _dispatcher = dispatcher_cls(mr.config.queue.DISPATCH_MAX_CONCURRENCY)
+
+    return _dispatcher
@@ -1,11 +1,13 @@
 import logging
-import functools 
-import threading
-import Queue
 
+import mr.constants
 import mr.config.queue
 import mr.job_engine
+import mr.workflow_manager
+import mr.models.kv.workflow
 import mr.queue.queue_message
+import mr.queue.queue_manager
+import mr.queue.dispatcher
 
 _logger = logging.getLogger(__name__)
 
@@ -15,34 +17,8 @@ class MessageHandler(object):
 
     def __init__(self, *args, **kwargs):
         super(MessageHandler, self).__init__(*args, **kwargs)
-        self.__sp = mr.job_engine.get_step_processor()
         self.__qmp = mr.queue.queue_message.get_queue_message_processor()
-
-        self.__dispatch_join_q = Queue.Queue()
-        self.__dispatch_cleanup_thread_exit_ev = threading.Event()
-
-        self.__schedule_dispatch_cleanup()
-
-    def __del__(self):
-        self.__dispatch_cleanup_thread_exit_ev.set()
-        self.__dispatch_cleanup_t.join()
-
-    def __schedule_dispatch_cleanup(self):
-        self.__dispatch_cleanup_t = threading.Thread(
-                                        target=self.__cleanup_dispatches)
-        self.__dispatch_cleanup_t.start()
-
-    def __cleanup_dispatches(self):
-        while self.__dispatch_cleanup_thread_exit_ev.is_set() is False:
-            try:
-                dispatched_t = \
-                    self.__dispatch_join_q.get(
-                        timeout=mr.config.queue.DISPATCH_CLEANUP_INTERVAL_S)
-            except Queue.Empty:
-                continue
-
-            _logger.debug("Joining finished dispatch: [%s]", dispatched_t.name)
-            dispatched_t.join()
+        self.__dispatcher = mr.queue.dispatcher.get_dispatcher()
 
     def process_message(self, encoded_message):
         (job_class, format_version, decoded_data) = \
@@ -57,44 +33,22 @@ class MessageHandler(object):
 
         handler(format_version, decoded_data)
 
-    def __dispatch(self, handler, format_version, decoded_message):
+    def __dispatch(self, job_class, format_version, decoded_message):
         _logger.debug("Dispatching dequeued message: (%d) %s", 
                       format_version, decoded_message)
 
-        qmf = mr.queue.queue_message.get_queue_message_funnel()
-# TODO(dustin): We should embed KV state, and throw a catchable exception if 
-#               the KV has not yet reached consistency. We might add 
-#               provisions to take advantage of the indices monotically-
-#               increasing nature with *etcd* (whereby we can check whichever 
-#               has the highest index first, and if it passes we won't have to 
-#               be discretionary towards the rest).
-        message_parameters = qmf.inflate(format_version, decoded_message)
-
-        if mr.config.queue.IS_MULTITHREADED is True:
-            _logger.debug("Dispatching into separate thread.")
-
-            def wrapped_handler(message_parameters):
-                try:
-                    handler(message_parameters)
-                finally:
-                    self.__dispatch_join_q.put(threading.current_thread())
-
-            t = threading.Thread(
-                    target=wrapped_handler, 
-                    args=(message_parameters,))
-
-            t.start()
-        else:
-            _logger.debug("Running message handler synchronously (not "
-                          "multithreaded).")
-
-            handler(message_parameters)
+        # This blocks while the dispatcher is full.
+        self.__dispatcher.dispatch(
+            _handle, 
+            job_class, 
+            format_version, 
+            decoded_message)
 
     def handle_map(self, format_version, decoded_message):
         """Corresponds to steps received with a type of ST_MAP."""
 
         self.__dispatch(
-                self.__sp.handle_map, 
+                mr.constants.D_MAP, 
                 format_version, 
                 decoded_message)
 
@@ -102,6 +56,55 @@ class MessageHandler(object):
         """Corresponds to steps received with a type of ST_REDUCE."""
 
         self.__dispatch(
-                self.__sp.handle_reduce, 
+                mr.constants.D_REDUCE, 
                 format_version, 
                 decoded_message)
+
+_is_worker_process_booted = False
+
+def _boot_worker_process():
+    """The processes of a process-pool dispatcher are forked before the 
+    workflows are loaded and before the queue is started. Do both in this 
+    process, once.
+    """
+
+    global _is_worker_process_booted
+
+    if _is_worker_process_booted is True:
+        return
+
+    workflow_names = mr.config.queue.get_current_workflows()
+
+    _logger.info("Booting dispatcher process for workflow(s): %s", 
+                 workflow_names)
+
+    wm = mr.workflow_manager.get_wm()
+    for workflow_name in workflow_names:
+        w = mr.models.kv.workflow.get(workflow_name)
+        wm.add(w)
+
+    mr.queue.queue_manager.boot(workflow_names, is_producer_only=True)
+
+    _is_worker_process_booted = True
+
+def _handle(job_class, format_version, decoded_message):
+    """Inflate and process one message. This is run by the dispatcher, which 
+    might be in another process, so it has to be module-level.
+    """
+
+    if mr.queue.dispatcher.is_worker_process() is True:
+        _boot_worker_process()
+
+    qmf = mr.queue.queue_message.get_queue_message_funnel()
+# TODO(dustin): We should embed KV state, and throw a catchable exception if 
+#               the KV has not yet reached consistency. We might add 
+#               provisions to take advantage of the indices monotically-
+#               increasing nature with *etcd* (whereby we can check whichever 
+#               has the highest index first, and if it passes we won't have to 
+#               be discretionary towards the rest).
+    message_parameters = qmf.inflate(format_version, decoded_message)
+
+    sp = mr.job_engine.get_step_processor()
+    handler = getattr(sp, 'handle_' + job_class)
+
+    handler(message_parameters)
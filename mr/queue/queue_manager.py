@@ -49,7 +49,9 @@ def _make_queue(workflow_names):
 
 _q = None
 
-def boot(workflow_names):
+def boot(workflow_names, is_producer_only=False):
+    """Create the queue and start it. Worker processes only produce."""
+
     global _q
 
     _q = _make_queue(workflow_names)
@@ -57,6 +59,9 @@ def boot(workflow_names):
     _logger.info("Starting queue producer.")
     _q.control.start_producer()
 
+    if is_producer_only is True:
+        return
+
     if mr.config.queue.CONSUMER_ENABLED is True:
         _logger.info("Starting queue consumer.")
         _q.control.start_consumer()
@@ -1,9 +1,12 @@
 import logging
 import collections
+import json
 import pickle
+import struct
 import time
 
 import mr.config.queue
+import mr.constants
 import mr.shared_types
 import mr.workflow_manager
 import mr.models.kv.request
@@ -16,7 +19,8 @@ import mr.models.kv.data_layer
 _logger = logging.getLogger(__name__)
 
 # We can't prefix with an underscore because we require a symbol that matches 
-# the alleged name in order to pickle.
+# the alleged name in order to pickle (messages are pickled to be sent to 
+# dispatcher processes, and were once pickled onto the queue).
 
 QueueMessageV1 = collections.namedtuple(
                     'QueueMessageV1', 
@@ -33,43 +37,138 @@ QueueMessageV2 = collections.namedtuple(
                      'step_name',
                      'collective_state'])
 
+# The snapshots are the (key, data, state) of each model, or None if it has to 
+# be read.
+QueueMessageV3 = collections.namedtuple(
+                    'QueueMessageV3', 
+                    ['workflow_name',
+                     'request_id', 
+                     'invocation_id',
+                     'step_name',
+                     'request_snapshot',
+                     'invocation_snapshot',
+                     'job_snapshot',
+                     'step_snapshot',
+                     'handler_name',
+                     'handler_version'])
+
 
 class _QueueDataPackager(object):
+    """Translates the data of one format to and from the fields of the message 
+    envelope. Every field is a byte-string (or None).
+    """
+
     def encode(self, data):
         raise NotImplementedError()
 
-    def decode(self, encoded_data):
+    def decode(self, fields):
         raise NotImplementedError()
 
+def _to_field(value):
+    if value is None:
+        return None
+    elif issubclass(value.__class__, unicode) is True:
+        return value.encode('utf-8')
+    else:
+        return str(value)
+
+def _from_field(field):
+    if field is None:
+        return None
+
+    return field.decode('utf-8')
+
+def _to_json_field(value):
+    return json.dumps(value)
+
+def _from_json_field(field):
+    return json.loads(field)
+
 
 class _QueueDataPackagerV1(_QueueDataPackager):
     """Encoded/decoded the data going into the messages."""
 
-# TODO(dustin): Consider using protobuf. It's always faster if we know some 
-#               structure beforehand.
-
     def encode(self, data):
         assert issubclass(data.__class__, QueueMessageV1) is True
 
-        return pickle.dumps(data)
+        return [_to_field(value) for value in data]
 
-    def decode(self, encoded_data):
-        return pickle.loads(encoded_data)
+    def decode(self, fields):
+        return QueueMessageV1(*[_from_field(field) for field in fields])
 
 
 class _QueueDataPackagerV2(_QueueDataPackager):
     """Encoded/decoded the data going into the messages."""
 
-# TODO(dustin): Consider using protobuf. It's always faster if we know some 
-#               structure beforehand.
-
     def encode(self, data):
         assert issubclass(data.__class__, QueueMessageV2) is True
 
-        return pickle.dumps(data)
+        # The states are keyed by (class-name, key) tuples, which JSON can't 
+        # represent.
+        states = [(class_name, key, state)
+                  for ((class_name, key), state) 
+                  in data.collective_state.iteritems()]
+
+        return [_to_field(data.workflow_name),
+                _to_field(data.request_id),
+                _to_field(data.invocation_id),
+                _to_field(data.step_name),
+                _to_json_field(states)]
+
+    def decode(self, fields):
+        (workflow_name, request_id, invocation_id, step_name, states) = fields
+
+        collective_state = dict(((class_name, key), state)
+                                for (class_name, key, state) 
+                                in _from_json_field(states))
+
+        return QueueMessageV2(
+                workflow_name=_from_field(workflow_name),
+                request_id=_from_field(request_id),
+                invocation_id=_from_field(invocation_id),
+                step_name=_from_field(step_name),
+                collective_state=collective_state)
+
+
+class _QueueDataPackagerV3(_QueueDataPackager):
+    """Encoded/decoded the data going into the messages. The snapshots are 
+    carried together as one JSON field.
+    """
 
-    def decode(self, encoded_data):
-        return pickle.loads(encoded_data)
+    def encode(self, data):
+        assert issubclass(data.__class__, QueueMessageV3) is True
+
+        snapshots = [data.request_snapshot,
+                     data.invocation_snapshot,
+                     data.job_snapshot,
+                     data.step_snapshot]
+
+        return [_to_field(data.workflow_name),
+                _to_field(data.request_id),
+                _to_field(data.invocation_id),
+                _to_field(data.step_name),
+                _to_field(data.handler_name),
+                _to_field(data.handler_version),
+                _to_json_field(snapshots)]
+
+    def decode(self, fields):
+        (workflow_name, request_id, invocation_id, step_name, handler_name, 
+         handler_version, snapshots) = fields
+
+        (request_snapshot, invocation_snapshot, job_snapshot, 
+         step_snapshot) = _from_json_field(snapshots)
+
+        return QueueMessageV3(
+                workflow_name=_from_field(workflow_name),
+                request_id=_from_field(request_id),
+                invocation_id=_from_field(invocation_id),
+                step_name=_from_field(step_name),
+                request_snapshot=request_snapshot,
+                invocation_snapshot=invocation_snapshot,
+                job_snapshot=job_snapshot,
+                step_snapshot=step_snapshot,
+                handler_name=_from_field(handler_name),
+                handler_version=_from_field(handler_version))
 
 ## Queue data format versions.
 
@@ -83,39 +182,140 @@ _QDF_1 = 1
 #         level with help of a distributed Redis/memcached KV cache, anyway.
 _QDF_2 = 2
 
+# Carries snapshots of the models, so that they don't have to be read from the 
+# KV when the message is received (only the handler is checked, by version).
+_QDF_3 = 3
+
 _QUEUE_FORMAT_CLS_MAP = {
     _QDF_1: _QueueDataPackagerV1(),
     _QDF_2: _QueueDataPackagerV2(),
+    _QDF_3: _QueueDataPackagerV3(),
 }
 
 # Set to the current format version.
-_CURRENT_QUEUE_FORMAT = _QDF_1
+_CURRENT_QUEUE_FORMAT = _QDF_3
 
 def _get_data_packager(format_version=_CURRENT_QUEUE_FORMAT):
-    return _QUEUE_FORMAT_CLS_MAP[format_version]
+    try:
+        return _QUEUE_FORMAT_CLS_MAP[format_version]
+    except KeyError:
+        raise ValueError("Queue data format version is invalid: [%s]" % 
+                         (format_version,))
+
+## The message envelope.
+#
+# A fixed header (magic, envelope version, job-class, data format version, 
+# field count), the length of each field (-1 for None), and then the fields.
 
+_ENVELOPE_MAGIC = 'MQ'
+_ENVELOPE_VERSION = 1
 
-class _QueueMessagePackager(object):
-    """Encodes/decoded the messages going to and from the queue."""
+_ENVELOPE_HEADER = struct.Struct('!2sBBBB')
 
-# TODO(dustin): Consider using protobuf. It's always faster if we know some 
-#               structure beforehand.
+_JOB_CLASS_CODES = {
+    mr.constants.D_MAP: 1,
+    mr.constants.D_REDUCE: 2,
+}
+
+_JOB_CLASSES_BY_CODE = dict((code, job_class)
+                            for (job_class, code) 
+                            in _JOB_CLASS_CODES.iteritems())
+
+def _get_field_lengths_struct(field_count):
+    return struct.Struct('!' + 'i' * field_count)
+
+
+class _QueueMessagePackager(object):
+    """Encodes/decoded the messages going to and from the queue. Messages 
+    might come from anywhere, so we never unpickle them (unless we've been 
+    configured to accept messages from before the envelope).
+    """
 
     def encode(self, job_class, data):
         packager = _get_data_packager()
+        fields = packager.encode(data)
 
-        return pickle.dumps((
-                job_class, 
-                _CURRENT_QUEUE_FORMAT, 
-                packager.encode(data)))
+        header = _ENVELOPE_HEADER.pack(
+                    _ENVELOPE_MAGIC, 
+                    _ENVELOPE_VERSION, 
+                    _JOB_CLASS_CODES[job_class], 
+                    _CURRENT_QUEUE_FORMAT, 
+                    len(fields))
 
-    def decode(self, encoded_message):
+        field_lengths = _get_field_lengths_struct(len(fields)).pack(
+                            *[len(field) if field is not None else -1
+                              for field 
+                              in fields])
+
+        return ''.join(
+                [header, field_lengths] + 
+                [field for field in fields if field is not None])
+
+    def __decode_pickled(self, encoded_message):
         (job_class, format_version, encoded_data) = \
             pickle.loads(encoded_message)
 
+        if format_version not in (_QDF_1, _QDF_2):
+            raise ValueError("Pickled queue message has an invalid format "
+                             "version: [%s]" % (format_version,))
+
+        return (job_class, format_version, pickle.loads(encoded_data))
+
+    def decode(self, encoded_message):
+        if encoded_message[:len(_ENVELOPE_MAGIC)] != _ENVELOPE_MAGIC:
+            if mr.config.queue.IS_PICKLED_MESSAGE_ACCEPTED is True:
+                return self.__decode_pickled(encoded_message)
+
+            raise ValueError("Queue message does not have an envelope.")
+
+        offset = _ENVELOPE_HEADER.size
+
+        try:
+            (_, envelope_version, job_class_code, format_version, 
+             field_count) = _ENVELOPE_HEADER.unpack(encoded_message[:offset])
+        except struct.error:
+            raise ValueError("Queue message envelope is truncated.")
+
+        if envelope_version != _ENVELOPE_VERSION:
+            raise ValueError("Queue message envelope version is invalid: "
+                             "[%s]" % (envelope_version,))
+
+        try:
+            job_class = _JOB_CLASSES_BY_CODE[job_class_code]
+        except KeyError:
+            raise ValueError("Queue message job-class is invalid: [%s]" % 
+                             (job_class_code,))
+
         packager = _get_data_packager(format_version)
 
-        return (job_class, format_version, packager.decode(encoded_data))
+        field_lengths_struct = _get_field_lengths_struct(field_count)
+
+        try:
+            field_lengths = field_lengths_struct.unpack(
+                                encoded_message[
+                                    offset:offset + field_lengths_struct.size])
+        except struct.error:
+            raise ValueError("Queue message envelope is truncated.")
+
+        offset += field_lengths_struct.size
+
+        fields = []
+        for length in field_lengths:
+            if length == -1:
+                fields.append(None)
+                continue
+            elif length < 0 or offset + length > len(encoded_message):
+                raise ValueError("Queue message field-length is invalid: "
+                                 "(%d)" % (length,))
+
+            fields.append(encoded_message[offset:offset + length])
+            offset += length
+
+        if offset != len(encoded_message):
+            raise ValueError("Queue message has (%d) trailing bytes." % 
+                             (len(encoded_message) - offset,))
+
+        return (job_class, format_version, packager.decode(fields))
 
 _qmp = None
 
@@ -171,50 +371,182 @@ class _QueueMessageFunnel(object):
                     invocation_id=message_parameters.invocation.invocation_id,
                     step_name=message_parameters.step.step_name,
                     collective_state=sc.get_collective_state())
+        elif _CURRENT_QUEUE_FORMAT == _QDF_3:
+            handler = message_parameters.handler
+
+            if handler is not None:
+                handler_name = handler.handler_name
+                handler_version = handler.version
+            else:
+                handler_name = None
+                handler_version = None
+
+            return QueueMessageV3(
+                    workflow_name=workflow.workflow_name,
+                    request_id=message_parameters.request.request_id,
+                    invocation_id=message_parameters.invocation.invocation_id,
+                    step_name=message_parameters.step.step_name,
+                    request_snapshot=\
+                        message_parameters.request.get_snapshot(),
+                    invocation_snapshot=\
+                        message_parameters.invocation.get_snapshot(),
+                    job_snapshot=message_parameters.job.get_snapshot(),
+                    step_snapshot=message_parameters.step.get_snapshot(),
+                    handler_name=handler_name,
+                    handler_version=handler_version)
         else:
             raise ValueError("Queue data format version is invalid for "
                              "deflation: [%s]" % (format_version,))
 
+    def __load_from_snapshots(self, deflated):
+        """Rebuild the models from the snapshots in the message. Any model 
+        without a snapshot is read. The handler is taken from the model-cache 
+        and only read from the KV if it's not the version in the message.
+        """
+
+        wm = mr.workflow_manager.get_wm()
+        managed_workflow = wm.get(deflated.workflow_name)
+        workflow = managed_workflow.workflow
+
+        def build(model_cls, snapshot, get_cb):
+            if snapshot is None:
+                return get_cb()
+
+            return model_cls.build_from_snapshot(snapshot)
+
+        request = build(
+                    mr.models.kv.request.Request, 
+                    deflated.request_snapshot, 
+                    lambda: mr.models.kv.request.get(
+                                workflow, 
+                                deflated.request_id))
+
+        invocation = build(
+                        mr.models.kv.invocation.Invocation, 
+                        deflated.invocation_snapshot, 
+                        lambda: mr.models.kv.invocation.get(
+                                    workflow, 
+                                    deflated.invocation_id))
+
+        job = build(
+                mr.models.kv.job.Job, 
+                deflated.job_snapshot, 
+                lambda: mr.models.kv.job.get(workflow, request.job_name))
+
+        step = build(
+                mr.models.kv.step.Step, 
+                deflated.step_snapshot, 
+                lambda: mr.models.kv.step.get(
+                            workflow, 
+                            deflated.step_name))
+
+        if deflated.handler_name is None:
+            handler = None
+        else:
+            handler = mr.models.kv.handler.get(
+                        workflow, 
+                        deflated.handler_name)
+
+            if handler.version != deflated.handler_version:
+                _logger.debug("Handler [%s] is at version [%s] rather than "
+                              "[%s]. Reading it.", handler.handler_name, 
+                              handler.version, deflated.handler_version)
+
+                handler.refresh()
+
+                if handler.version != deflated.handler_version:
+                    _logger.warning("Handler [%s] is at version [%s] rather "
+                                    "than [%s] after reading it. Using it "
+                                    "anyway.", handler.handler_name, 
+                                    handler.version, 
+                                    deflated.handler_version)
+
+        return (workflow, request, invocation, job, step, handler)
+
     def inflate(self, format_version, deflated):
         """Reconstruct the battery of models and arguments that describes the 
         original request.
         """
 
-        def load(workflow_name, request_id, invocation_id, step_name):
+        def load(workflow_name, request_id, invocation_id, step_name, 
+                 collective_state=None):
             wm = mr.workflow_manager.get_wm()
             managed_workflow = wm.get(workflow_name)
             workflow = managed_workflow.workflow
 
-            request = mr.models.kv.request.get(workflow, request_id)
+            def get_state(model_cls, key):
+                # The state that the model had when the message was sent. 
+                # Reads of older states are retried against the leader.
+                if collective_state is None:
+                    return None
+
+                return collective_state.get((model_cls.__name__, key))
+
+            request = mr.models.kv.request.get(
+                        workflow, 
+                        request_id, 
+                        wait_for_state=get_state(
+                            mr.models.kv.request.Request, 
+                            request_id))
 
             invocation = mr.models.kv.invocation.get(
                             workflow, 
-                            invocation_id)
+                            invocation_id, 
+                            wait_for_state=get_state(
+                                mr.models.kv.invocation.Invocation, 
+                                invocation_id))
+
+            job = mr.models.kv.job.get(
+                    workflow, 
+                    request.job_name, 
+                    wait_for_state=get_state(
+                        mr.models.kv.job.Job, 
+                        request.job_name))
+
+            step = mr.models.kv.step.get(
+                    workflow, 
+                    step_name, 
+                    wait_for_state=get_state(
+                        mr.models.kv.step.Step, 
+                        step_name))
 
-            job = mr.models.kv.job.get(workflow, request.job_name)
-            step = mr.models.kv.step.get(workflow, step_name)
-            
             if invocation.direction == mr.constants.D_MAP:
-                handler = mr.models.kv.handler.get(workflow, step.map_handler_name)
+                handler_name = step.map_handler_name
             elif invocation.direction == mr.constants.D_REDUCE:
-                if step.reduce_handler_name is not None:
-                    handler = mr.models.kv.handler.get(workflow, step.reduce_handler_name)
-                else:
-                    handler = None
+                handler_name = step.reduce_handler_name
             else:
                 raise ValueError("Invocation direction [%s] invalid: %s" % 
                                  (invocation.direction, invocation))
 
+            if handler_name is not None:
+                handler = mr.models.kv.handler.get(
+                            workflow, 
+                            handler_name, 
+                            wait_for_state=get_state(
+                                mr.models.kv.handler.Handler, 
+                                handler_name))
+            else:
+                handler = None
+
             return (workflow, request, invocation, job, step, handler)
 
-        if format_version == _QDF_1:
+        if format_version == _QDF_3:
+            (workflow, request, invocation, job, step, handler) = \
+                self.__load_from_snapshots(deflated)
+        elif format_version == _QDF_1:
             (workflow_name, request_id, invocation_id, step_name) = deflated
             r = load(workflow_name, request_id, invocation_id, step_name)
             (workflow, request, invocation, job, step, handler) = r
         elif format_version == _QDF_2:
             (workflow_name, request_id, invocation_id, step_name, collective_state) = deflated
 
-            r = load(workflow_name, request_id, invocation_id, step_name)
+            r = load(
+                    workflow_name, 
+                    request_id, 
+                    invocation_id, 
+                    step_name, 
+                    collective_state=collective_state)
+
             (workflow, request, invocation, job, step, handler) = r
 
             # Ensure that the recovered models have reached the correct state 
@@ -236,16 +568,17 @@ class _QueueMessageFunnel(object):
                                     step, 
                                     handler)
                 else:
-                    if mr.config.IS_DEBUG is True:
-                        for faulted in faulted_list:
-                            old_state = int(faulted.state_string)
-                            faulted.refresh()
-                            new_state = int(faulted.state_string)
-
-                            _logger.debug("%s[%s]: (%d) => (%d) WAITING-ON=(%d)", 
-                                          faulted.__class__.__name__, 
-                                          str(faulted), old_state, new_state, 
-                                          sc.get_desired_state(faulted))
+                    for faulted in faulted_list:
+                        old_state = int(faulted.state_string)
+                        faulted.refresh()
+                        new_state = int(faulted.state_string)
+
+                        if mr.config.IS_DEBUG is True:
+                            _logger.debug(
+                                "%s[%s]: (%d) => (%d) WAITING-ON=(%d)", 
+                                faulted.__class__.__name__, 
+                                str(faulted), old_state, new_state, 
+                                sc.get_desired_state(faulted))
 
                     faulted_list = sc.check_states(*faulted_list)
 
@@ -1,10 +1,48 @@
 import logging
 
+import gevent.event
+
 import mr.queue.queue_message
 
 _logger = logging.getLogger(__name__)
 
 
+class PushCompletion(object):
+    """Returned for every push. Producers that publish in the background 
+    complete it once the message has actually been published.
+    """
+
+    def __init__(self):
+        self.__result = gevent.event.AsyncResult()
+
+    def set_published(self):
+        self.__result.set(None)
+
+    def set_failed(self, exception):
+        self.__result.set_exception(exception)
+
+    def wait(self, timeout=None):
+        """Block until the message has been published. Raises if it couldn't 
+        be.
+        """
+
+        self.__result.get(timeout=timeout)
+
+    @property
+    def is_complete(self):
+        return self.__result.ready()
+
+def get_published_completion():
+    """Return a completion that's already complete, for producers that 
+    publish immediately.
+    """
+
+    completion = PushCompletion()
+    completion.set_published()
+
+    return completion
+
+
 class QueueProducer(object):
     def __init__(self):
         self.__qmf = mr.queue.queue_message.get_queue_message_funnel()
@@ -19,7 +57,7 @@ class QueueProducer(object):
         flattened_data = self.__qmf.deflate(data)
         raw_message = self.__qmp.encode(job_class, flattened_data)
 
-        self.push_one_raw(topic, raw_message)
+        return self.__get_completion(self.push_one_raw(topic, raw_message))
 
     def push_many(self, topic, job_class, data_list):
         raw_message_list = [self.__qmp.encode(
@@ -28,14 +66,27 @@ class QueueProducer(object):
                             for data 
                             in data_list]
 
-        self.push_many_raw(topic, raw_message_list)
+        return self.__get_completion(
+                self.push_many_raw(topic, raw_message_list))
+
+    def __get_completion(self, completion):
+        # The producers that publish immediately don't have to return 
+        # anything.
+        if completion is None:
+            return get_published_completion()
+
+        return completion
 
     def push_one_raw(self, topic, raw_message):
-        """Push one message, already encoded."""
+        """Push one message, already encoded. May return a PushCompletion if 
+        the message isn't published immediately.
+        """
 
         raise NotImplementedError()
 
     def push_many_raw(self, topic, raw_message_list):
-        """Push a list of messages, each already encoded."""
+        """Push a list of messages, each already encoded. May return a 
+        PushCompletion if the messages aren't published immediately.
+        """
 
         raise NotImplementedError()
@@ -10,6 +10,8 @@ import mr.models.kv.workflow
 import mr.models.kv.queues.dataset
 import mr.models.kv.trees.relationships
 import mr.models.kv.trees.sessions
+import mr.models.kv.trees.completions
+import mr.models.kv.partial_reduction
 
 _logger = logging.getLogger(__name__)
 _logger.setLevel(logging.WARNING)
@@ -47,42 +49,56 @@ class RequestCleanup(object):
 
         # Remove post-combine data.
 
-        try:
-            dqc = mr.models.kv.queues.dataset.DatasetQueue(
-                    self.__workflow, 
-                    invocation,
-                    mr.models.kv.queues.dataset.DT_POST_COMBINE)
-
-            if self.__just_simulate is True:
-                list(dqc.list())
-            else:
-                dqc.delete()
-        except KeyError:
-            _logger.debug("No POST-COMBINE datasets to be removed for invocation: "
-                          "[%s]", invocation.invocation_id)
-        else:
-            _logger.debug("Removed POST-COMBINE datasets for invocation: [%s]", 
-                          invocation.invocation_id)
+        self.__prune_partitioned_data(
+            invocation, 
+            mr.models.kv.queues.dataset.DT_POST_COMBINE,
+            'POST-COMBINE')
 
         # Remove post-reduce data.
 
-        try:
-            dqr = mr.models.kv.queues.dataset.DatasetQueue(
-                    self.__workflow, 
-                    invocation,
-                    mr.models.kv.queues.dataset.DT_POST_REDUCE)
+        self.__prune_partitioned_data(
+            invocation, 
+            mr.models.kv.queues.dataset.DT_POST_REDUCE,
+            'POST-REDUCE')
 
-            if self.__just_simulate is True:
-                list(dqr.list())
+    def __prune_partitioned_data(self, invocation, dataset_type, type_phrase):
+        """Remove a dataset that might have been partitioned. The partitions 
+        are stored under the unpartitioned dataset, but they aren't included 
+        when it's listed, so each partition is visited on its own.
+        """
+
+        dqs = mr.models.kv.queues.dataset.get_partitioned(
+                self.__workflow, 
+                invocation,
+                dataset_type)
+
+        for dq in dqs:
+            try:
+                if self.__just_simulate is True:
+                    list(dq.list())
+                else:
+                    dq.delete()
+            except KeyError:
+                _logger.debug("No %s datasets to be removed for invocation: "
+                              "[%s] [%s]", 
+                              type_phrase, invocation.invocation_id, dq)
             else:
-                dqr.delete()
+                _logger.debug("Removed %s datasets for invocation: [%s] [%s]", 
+                              type_phrase, invocation.invocation_id, dq)
+
+        if self.__just_simulate is True or \
+           invocation.reduce_partitions is None:
+            return
+
+        # Remove whatever is left of the unpartitioned dataset.
+
+        try:
+            mr.models.kv.queues.dataset.DatasetQueue(
+                self.__workflow, 
+                invocation,
+                dataset_type).delete()
         except KeyError:
-            _logger.debug("No POST-REDUCE datasets to be removed for invocation: "
-                          "[%s]",
-                          invocation.invocation_id)
-        else:
-            _logger.debug("Removed POST-REDUCE datasets for invocation: [%s]", 
-                          invocation.invocation_id)
+            pass
 
     def __prune_invocation_relationships(self, invocation):
         """Remove the associated relationship paper-trail."""
@@ -140,12 +156,56 @@ class RequestCleanup(object):
             _logger.debug("Removed sessions: [%s]", 
                           map_invocation.invocation_id)
 
+    def __prune_invocation_completions(self, map_invocation):
+        """Remove the completion markers of the steps that the 
+        mapping-invocation mapped.
+        """
+
+        try:
+            ct = mr.models.kv.trees.completions.CompletionsTree(
+                    self.__workflow, 
+                    map_invocation)
+
+            if self.__just_simulate is True:
+                list(ct.list())
+            else:
+                ct.delete()
+        except KeyError:
+            _logger.debug("No completions to remove for invocation: "
+                          "[%s]", map_invocation.invocation_id)
+        else:
+            _logger.debug("Removed completions: [%s]", 
+                          map_invocation.invocation_id)
+
+    def __prune_invocation_partial_reductions(self, map_invocation):
+        """Remove the partial reductions of the results of the steps that the 
+        mapping-invocation mapped.
+        """
+
+        partial_reductions = mr.models.kv.partial_reduction.\
+                                list_for_invocation(
+                                    self.__workflow, 
+                                    map_invocation)
+
+        for pr in partial_reductions:
+            if self.__just_simulate is True:
+                _logger.debug("SIMULATION: Not removing partial reduction: "
+                              "[%s] [%s]", 
+                              map_invocation.invocation_id, pr.shard_name)
+            else:
+                pr.delete()
+
+        _logger.debug("Removed (%d) partial reductions: [%s]", 
+                      len(partial_reductions), map_invocation.invocation_id)
+
     def __prune_invocation(self, invocation):
         self.__prune_invocation_data(invocation)
         self.__prune_invocation_relationships(invocation)
 
         if invocation.direction == mr.constants.D_MAP:
             self.__prune_invocation_sessions(invocation)
+            self.__prune_invocation_completions(invocation)
+            self.__prune_invocation_partial_reductions(invocation)
 
         if self.__just_simulate is True:
             _logger.debug("SIMULATION: Not removing invocation: %s", 
@@ -35,25 +35,33 @@ def _get_child_info(workflow, child_invocation, parent_invocation=None):
 
     # Read post-combine data.
 
-    dqc = mr.models.kv.queues.dataset.DatasetQueue(
+    dqcs = mr.models.kv.queues.dataset.get_partitioned(
             workflow, 
             child_invocation,
             mr.models.kv.queues.dataset.DT_POST_COMBINE)
 
     try:
-        post_combine_data = list(dqc.list_data())
+        post_combine_data = [data 
+                             for dqc 
+                             in dqcs 
+                             for data 
+                             in dqc.list_data()]
     except KeyError:
         post_combine_data = None
 
     # Read post-reduce data.
 
-    dqr = mr.models.kv.queues.dataset.DatasetQueue(
+    dqrs = mr.models.kv.queues.dataset.get_partitioned(
             workflow, 
             child_invocation,
             mr.models.kv.queues.dataset.DT_POST_REDUCE)
 
     try:
-        post_reduce_data = list(dqr.list_data())
+        post_reduce_data = [data 
+                            for dqr 
+                            in dqrs 
+                            for data 
+                            in dqr.list_data()]
     except KeyError:
         post_reduce_data = None
 
@@ -207,9 +215,15 @@ class InvocationGraph(object):
         node_id = self.__get_inv_node_id(invocation)
         step = mr.models.kv.step.get(self.__workflow, invocation.step_name)
 
-        label = 'S "' + self.__escape(step.step_name) + '"' + ' ' +\
-                'H "' + self.__escape(step.map_handler_name) + '"' + ' ' +\
-                'MI ' + self.__get_inv_id(invocation)
+        if invocation.is_reduce_tier is True:
+            # An intermediate grouping of the steps mapped by its parent. It 
+            # was never mapped, itself.
+            label = 'S "' + self.__escape(step.step_name) + '"' + ' ' +\
+                    'TIER ' + self.__get_inv_id(invocation)
+        else:
+            label = 'S "' + self.__escape(step.step_name) + '"' + ' ' +\
+                    'H "' + self.__escape(step.map_handler_name) + '"' + ' ' +\
+                    'MI ' + self.__get_inv_id(invocation)
 
         dot.node(node_id, label)
 
@@ -218,6 +232,8 @@ class InvocationGraph(object):
             
             if parent_invocation.direction == mr.constants.D_REDUCE:
                 label = 'stored to'
+            elif invocation.is_reduce_tier is True:
+                label = 'grouped into'
             elif parent_invocation.direction == mr.constants.D_MAP:
                 label = 'mapped to'
             else:
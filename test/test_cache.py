@@ -0,0 +1,49 @@
+import unittest
+
+import mr.cache.memory
+
+
+class MemoryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__cache = mr.cache.memory.MemoryCache()
+
+    def test_set_if_newer(self):
+        self.__cache.set_if_newer('key', 5, 'value5')
+
+        # Older states can't replace newer ones.
+        self.__cache.set_if_newer('key', 4, 'value4')
+        self.assertEqual(self.__cache.get_versioned('key'), (5, 'value5'))
+
+        self.__cache.set_if_newer('key', 6, 'value,6')
+        self.assertEqual(self.__cache.get_versioned('key'), (6, 'value,6'))
+
+    def test_set_many_if_newer(self):
+        self.__cache.set_if_newer('key1', 5, 'value5')
+
+        self.__cache.set_many_if_newer([
+            ('key1', 4, 'value4'),
+            ('key2', 1, 'value1'),
+        ])
+
+        self.assertEqual(self.__cache.get_versioned('key1'), (5, 'value5'))
+        self.assertEqual(self.__cache.get_versioned('key2'), (1, 'value1'))
+
+    def test_tombstone(self):
+        self.__cache.set_if_newer('key', 5, 'value5')
+        self.__cache.set_tombstone('key', 6)
+
+        with self.assertRaises(KeyError):
+            self.__cache.get_versioned('key')
+
+        # A reader that read the value before it was deleted.
+        self.__cache.set_if_newer('key', 5, 'value5')
+
+        with self.assertRaises(KeyError):
+            self.__cache.get_versioned('key')
+
+        # It was created again.
+        self.__cache.set_if_newer('key', 7, 'value7')
+        self.assertEqual(self.__cache.get_versioned('key'), (7, 'value7'))
+
+if __name__ == '__main__':
+    unittest.main()
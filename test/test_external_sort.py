@@ -0,0 +1,79 @@
+import unittest
+import random
+
+import mr.external_sort
+
+
+class ExternalSortTestCase(unittest.TestCase):
+    def __get_pairs(self, count, key_count):
+        r = random.Random(0)
+
+        # The values record the original order, so that we can check that
+        # pairs with equal keys keep it.
+        return [(r.randint(0, key_count - 1), i)
+                for i
+                in xrange(count)]
+
+    def __get_expected(self, pairs):
+        # sorted() is stable.
+        return sorted(pairs, key=lambda (key, value): key)
+
+    def test_sort_pairs_in_memory(self):
+        pairs = self.__get_pairs(100, 10)
+
+        actual = list(mr.external_sort.sort_pairs(
+                        iter(pairs),
+                        max_run_bytes=1024 * 1024))
+
+        self.assertEqual(actual, self.__get_expected(pairs))
+
+    def test_sort_pairs_spilled(self):
+        pairs = self.__get_pairs(1000, 10)
+
+        # Small enough that there are many spilled runs, and the pairs of each
+        # key are spread across them.
+        actual = list(mr.external_sort.sort_pairs(
+                        iter(pairs),
+                        max_run_bytes=200))
+
+        self.assertEqual(actual, self.__get_expected(pairs))
+
+    def test_sort_pairs_spilled_exact_runs(self):
+        pairs = [('k', i) for i in xrange(10)]
+
+        # Every pair fills a run, so there's nothing left in memory.
+        actual = list(mr.external_sort.sort_pairs(
+                        iter(pairs),
+                        max_run_bytes=1))
+
+        self.assertEqual(actual, pairs)
+
+    def test_sort_pairs_empty(self):
+        actual = list(mr.external_sort.sort_pairs(iter([])))
+
+        self.assertEqual(actual, [])
+
+    def test_merge_sorted_pairs(self):
+        streams = [
+            [('a', 1), ('b', 1), ('d', 1)],
+            [('a', 2), ('c', 2)],
+            [],
+            [('b', 4), ('d', 4)],
+        ]
+
+        actual = list(mr.external_sort.merge_sorted_pairs(
+                        iter(stream)
+                        for stream
+                        in streams))
+
+        expected = [
+            ('a', 1), ('a', 2),
+            ('b', 1), ('b', 4),
+            ('c', 2),
+            ('d', 1), ('d', 4),
+        ]
+
+        self.assertEqual(actual, expected)
+
+if __name__ == '__main__':
+    unittest.main()
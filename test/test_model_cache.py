@@ -0,0 +1,35 @@
+"""These need a running KV (see mr.config.etcd)."""
+
+import unittest
+import uuid
+
+import mr.config.kv
+import mr.models.kv.data_layer
+import mr.models.kv.workflow
+
+
+class ModelCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        # A root that nothing has been written under, like on a fresh KV.
+        self.__entity_root = mr.config.kv.ENTITY_ROOT
+        mr.config.kv.ENTITY_ROOT = ('test' + uuid.uuid4().hex,)
+
+        self.__is_model_cached = mr.config.kv.IS_MODEL_CACHED
+        mr.config.kv.IS_MODEL_CACHED = True
+
+    def tearDown(self):
+        mr.config.kv.ENTITY_ROOT = self.__entity_root
+        mr.config.kv.IS_MODEL_CACHED = self.__is_model_cached
+
+    def test_get_current_index_missing(self):
+        dl = mr.models.kv.data_layer.DataLayerKv()
+        index = dl.get_current_index(mr.config.kv.ENTITY_ROOT)
+
+        self.assertGreater(index, 0)
+
+    def test_get_missing_entity(self):
+        with self.assertRaises(KeyError):
+            mr.models.kv.workflow.get('missing_workflow')
+
+if __name__ == '__main__':
+    unittest.main()
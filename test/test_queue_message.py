@@ -0,0 +1,163 @@
+import unittest
+import pickle
+import struct
+
+import mr.config.queue
+import mr.constants
+import mr.queue.queue_message
+
+
+class QueueMessagePackagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__qmp = mr.queue.queue_message.get_queue_message_processor()
+
+    def __get_message(self):
+        snapshot = ('some_key', { 'name': u'some\u00e9 name' }, 5)
+
+        return mr.queue.queue_message.QueueMessageV3(
+                workflow_name=u'workflow',
+                request_id=u'request',
+                invocation_id=u'invocation\u00e9',
+                step_name=u'step',
+                request_snapshot=snapshot,
+                invocation_snapshot=None,
+                job_snapshot=snapshot,
+                step_snapshot=None,
+                handler_name=u'handler',
+                handler_version=None)
+
+    def __encode(self):
+        return self.__qmp.encode(mr.constants.D_MAP, self.__get_message())
+
+    def __assert_invalid(self, encoded_message, message_fragment):
+        with self.assertRaises(ValueError) as cm:
+            self.__qmp.decode(encoded_message)
+
+        self.assertIn(message_fragment, str(cm.exception))
+
+    def __replace_header(self, encoded_message, index, value):
+        header_size = mr.queue.queue_message._ENVELOPE_HEADER.size
+        header = list(mr.queue.queue_message._ENVELOPE_HEADER.unpack(
+                        encoded_message[:header_size]))
+
+        header[index] = value
+
+        return mr.queue.queue_message._ENVELOPE_HEADER.pack(*header) + \
+               encoded_message[header_size:]
+
+    def test_round_trip(self):
+        message = self.__get_message()
+
+        for job_class in (mr.constants.D_MAP, mr.constants.D_REDUCE):
+            encoded_message = self.__qmp.encode(job_class, message)
+
+            (actual_job_class, format_version, data) = \
+                self.__qmp.decode(encoded_message)
+
+            self.assertEqual(actual_job_class, job_class)
+            self.assertEqual(
+                format_version,
+                mr.queue.queue_message._CURRENT_QUEUE_FORMAT)
+
+            self.assertEqual(data.workflow_name, message.workflow_name)
+            self.assertEqual(data.request_id, message.request_id)
+            self.assertEqual(data.invocation_id, message.invocation_id)
+            self.assertEqual(data.step_name, message.step_name)
+            self.assertEqual(data.handler_name, message.handler_name)
+            self.assertIsNone(data.handler_version)
+            self.assertIsNone(data.invocation_snapshot)
+            self.assertIsNone(data.step_snapshot)
+
+            # JSON gives us lists rather than tuples.
+            self.assertEqual(data.request_snapshot,
+                             list(message.request_snapshot))
+
+            self.assertEqual(data.job_snapshot, list(message.job_snapshot))
+
+    def test_no_envelope(self):
+        self.__assert_invalid('XX' + self.__encode()[2:],
+                              "does not have an envelope")
+
+    def test_truncated_header(self):
+        self.__assert_invalid(self.__encode()[:4], "truncated")
+
+    def test_invalid_envelope_version(self):
+        encoded_message = self.__replace_header(self.__encode(), 1, 99)
+        self.__assert_invalid(encoded_message, "envelope version is invalid")
+
+    def test_invalid_job_class(self):
+        encoded_message = self.__replace_header(self.__encode(), 2, 99)
+        self.__assert_invalid(encoded_message, "job-class is invalid")
+
+    def test_invalid_format_version(self):
+        encoded_message = self.__replace_header(self.__encode(), 3, 99)
+        self.__assert_invalid(encoded_message, "format version is invalid")
+
+    def test_truncated_field_lengths(self):
+        header_size = mr.queue.queue_message._ENVELOPE_HEADER.size
+
+        encoded_message = self.__encode()[:header_size + 2]
+        self.__assert_invalid(encoded_message, "truncated")
+
+    def test_invalid_field_length(self):
+        header_size = mr.queue.queue_message._ENVELOPE_HEADER.size
+        encoded_message = self.__encode()
+
+        # Only -1 (None) may be negative.
+        encoded_message = encoded_message[:header_size] + \
+                          struct.pack('!i', -2) + \
+                          encoded_message[header_size + 4:]
+
+        self.__assert_invalid(encoded_message, "field-length is invalid")
+
+    def test_truncated_field(self):
+        self.__assert_invalid(self.__encode()[:-1], "field-length is invalid")
+
+    def test_trailing_bytes(self):
+        self.__assert_invalid(self.__encode() + 'abc', "(3) trailing bytes")
+
+
+class PickledQueueMessageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__qmp = mr.queue.queue_message.get_queue_message_processor()
+        self.__is_accepted = mr.config.queue.IS_PICKLED_MESSAGE_ACCEPTED
+
+    def tearDown(self):
+        mr.config.queue.IS_PICKLED_MESSAGE_ACCEPTED = self.__is_accepted
+
+    def __get_pickled(self, format_version):
+        message = mr.queue.queue_message.QueueMessageV1(
+                    workflow_name='workflow',
+                    request_id='request',
+                    invocation_id='invocation',
+                    step_name='step')
+
+        return pickle.dumps(
+                (mr.constants.D_MAP, format_version, pickle.dumps(message)))
+
+    def test_rejected(self):
+        mr.config.queue.IS_PICKLED_MESSAGE_ACCEPTED = False
+
+        with self.assertRaises(ValueError):
+            self.__qmp.decode(self.__get_pickled(1))
+
+    def test_accepted(self):
+        mr.config.queue.IS_PICKLED_MESSAGE_ACCEPTED = True
+
+        (job_class, format_version, data) = \
+            self.__qmp.decode(self.__get_pickled(1))
+
+        self.assertEqual(job_class, mr.constants.D_MAP)
+        self.assertEqual(format_version, 1)
+        self.assertEqual(data.step_name, 'step')
+
+    def test_accepted_invalid_format_version(self):
+        mr.config.queue.IS_PICKLED_MESSAGE_ACCEPTED = True
+
+        with self.assertRaises(ValueError) as cm:
+            self.__qmp.decode(self.__get_pickled(3))
+
+        self.assertIn("invalid format version", str(cm.exception))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+import tempfile
+import shutil
+import os
+import os.path
+
+import mr.config.spool_queue
+import mr.queue.backends.spool_queue
+
+# Every record is an 8-byte header and the message.
+_MESSAGE_SIZE = 10
+_RECORD_SIZE = 8 + _MESSAGE_SIZE
+
+
+class TopicLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__spool_path = tempfile.mkdtemp()
+        self.__topic_path = os.path.join(self.__spool_path, 'topic')
+
+        # Roll after every two records.
+        self.__segment_max_bytes = mr.config.spool_queue.SEGMENT_MAX_BYTES
+        mr.config.spool_queue.SEGMENT_MAX_BYTES = _RECORD_SIZE * 2
+
+    def tearDown(self):
+        mr.config.spool_queue.SEGMENT_MAX_BYTES = self.__segment_max_bytes
+
+        shutil.rmtree(self.__spool_path)
+
+    def __open(self):
+        return mr.queue.backends.spool_queue._TopicLog(
+                self.__spool_path,
+                'topic')
+
+    def __get_message(self, i):
+        return ('message%d' % (i,)).ljust(_MESSAGE_SIZE, '-')
+
+    def __append(self, log, count):
+        for i in xrange(count):
+            log.append(self.__get_message(i))
+
+        log.sync()
+
+    def __get_segments(self):
+        return sorted(int(filename[:-4])
+                      for filename
+                      in os.listdir(self.__topic_path)
+                      if filename.endswith('.log'))
+
+    def __consume(self, log, count):
+        messages = []
+        for i in xrange(count):
+            (raw_message, next_offset) = log.read_next()
+            messages.append(raw_message)
+            log.ack(next_offset)
+
+        return messages
+
+    def test_segment_roll(self):
+        log = self.__open()
+        self.__append(log, 5)
+
+        self.assertEqual(
+            self.__get_segments(),
+            [0, _RECORD_SIZE * 2, _RECORD_SIZE * 4])
+
+        self.assertEqual(
+            self.__consume(log, 5),
+            [self.__get_message(i) for i in xrange(5)])
+
+        self.assertIsNone(log.read_next())
+
+    def test_unsynced_not_read(self):
+        log = self.__open()
+
+        completion = log.append(self.__get_message(0))
+
+        self.assertIsNone(log.read_next())
+        self.assertFalse(completion.is_complete)
+
+        self.assertTrue(log.sync())
+
+        self.assertTrue(completion.is_complete)
+        self.assertEqual(self.__consume(log, 1), [self.__get_message(0)])
+
+    def test_reclaim(self):
+        log = self.__open()
+        self.__append(log, 5)
+
+        # Still in the first segment.
+        self.__consume(log, 1)
+        self.assertEqual(len(self.__get_segments()), 3)
+
+        # Past the first segment.
+        self.__consume(log, 1)
+        self.assertEqual(
+            self.__get_segments(),
+            [_RECORD_SIZE * 2, _RECORD_SIZE * 4])
+
+        # The last segment is never reclaimed.
+        self.__consume(log, 3)
+        self.assertEqual(self.__get_segments(), [_RECORD_SIZE * 4])
+
+    def test_consumer_offset_survives_reopen(self):
+        log = self.__open()
+        self.__append(log, 5)
+        self.__consume(log, 3)
+
+        log = self.__open()
+
+        self.assertEqual(log.consumer_offset, _RECORD_SIZE * 3)
+        self.assertEqual(
+            self.__consume(log, 2),
+            [self.__get_message(3), self.__get_message(4)])
+
+    def test_recover_truncated_record(self):
+        log = self.__open()
+        self.__append(log, 3)
+
+        # A record that was only partially written when we went down.
+        filepath = os.path.join(
+                    self.__topic_path,
+                    '%020d.log' % (_RECORD_SIZE * 2,))
+
+        with open(filepath, 'ab') as f:
+            f.write('\x00\x00\x00\x0aabc')
+
+        log = self.__open()
+
+        self.assertEqual(os.path.getsize(filepath), _RECORD_SIZE)
+
+        # Appends continue after the last intact record.
+        self.__append(log, 1)
+
+        self.assertEqual(
+            self.__consume(log, 4),
+            [self.__get_message(i) for i in xrange(3)] +
+            [self.__get_message(0)])
+
+        self.assertIsNone(log.read_next())
+
+    def test_recover_corrupt_record(self):
+        log = self.__open()
+        self.__append(log, 2)
+
+        filepath = os.path.join(self.__topic_path, '%020d.log' % (0,))
+
+        # Flip a byte in the message of the second record, so its CRC fails.
+        with open(filepath, 'r+b') as f:
+            f.seek(_RECORD_SIZE + 8)
+            f.write('X')
+
+        log = self.__open()
+
+        self.assertEqual(os.path.getsize(filepath), _RECORD_SIZE)
+        self.assertEqual(self.__consume(log, 1), [self.__get_message(0)])
+        self.assertIsNone(log.read_next())
+
+if __name__ == '__main__':
+    unittest.main()